@@ -0,0 +1,120 @@
+# CPU cost per concurrent stream for the 'pcm' and 'opus' playback modes.
+#
+# Plays N local streams at once through bot.build_source and drives them the
+# way discord.py's AudioPlayer does (read a 20 ms frame, Opus-encode it if the
+# source isn't already Opus), but as fast as possible instead of in real time.
+# CPU is counted for both Python and the ffmpeg children, then expressed as a
+# percentage of one core needed per stream when playing in real time.
+#
+#   python -m benchmarks.audio_cpu --streams 4 --seconds 30
+import argparse
+import ctypes.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+import imageio_ffmpeg  # noqa: E402
+
+import bot  # noqa: E402
+
+FRAME_SECONDS = 0.02
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+# The 'pcm' mode encodes with discord.py's Encoder, which needs libopus loaded
+# (the bot only loads it when it joins a voice channel)
+def load_opus():
+    if discord.opus.is_loaded():
+        return
+    name = ctypes.util.find_library('opus')
+    if name:
+        try:
+            discord.opus.load_opus(name)
+        except OSError as e:
+            print(f"Could not load {name}: {e}")
+    if not discord.opus.is_loaded():
+        sys.exit("libopus required: install it (e.g. apt install libopus0) and run again")
+
+
+def make_track(path, seconds):
+    # Stereo 48 kHz Opus in WebM, same shape as YouTube's format 251
+    subprocess.run([
+        imageio_ffmpeg.get_ffmpeg_exe(), '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={seconds}',
+        '-ac', '2', '-c:a', 'libopus', '-b:a', '128k', path,
+    ], check=True)
+
+
+def process_cpu(pid):
+    # utime + stime of a child from /proc, in seconds
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (FileNotFoundError, ProcessLookupError):
+        return 0.0
+
+
+def run(mode, path, streams, seconds, volume):
+    data = {'title': 'bench', 'url': path, 'duration': seconds, 'acodec': 'opus'}
+    sources = [bot.build_source(data, path, mode=mode, volume=volume, before_options='') for _ in range(streams)]
+    encoder = discord.opus.Encoder()
+
+    frames = int(seconds / FRAME_SECONDS)
+    py_start = time.process_time()
+    wall_start = time.perf_counter()
+    ffmpeg_cpu = 0.0
+    for _ in range(frames):
+        for source in sources:
+            frame = source.read()
+            if frame and not source.is_opus():
+                encoder.encode(frame, encoder.SAMPLES_PER_FRAME)
+    py_cpu = time.process_time() - py_start
+    wall = time.perf_counter() - wall_start
+
+    for source in sources:
+        # FFmpegOpusAudio/FFmpegPCMAudio keep the Popen on _process
+        process = getattr(source, '_process', None) or getattr(source.original, '_process', None)
+        ffmpeg_cpu += process_cpu(process.pid)
+        source.cleanup()
+
+    total = py_cpu + ffmpeg_cpu
+    return {
+        'mode': mode if volume != 1.0 or mode == 'pcm' else 'opus (copy)',
+        'python_cpu': py_cpu,
+        'ffmpeg_cpu': ffmpeg_cpu,
+        'wall': wall,
+        'per_stream_pct': 100 * total / (streams * seconds),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--streams', type=int, default=4)
+    parser.add_argument('--seconds', type=int, default=30)
+    args = parser.parse_args()
+    load_opus()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'track.webm')
+        make_track(path, args.seconds + 1)
+
+        results = [
+            run('pcm', path, args.streams, args.seconds, bot.DEFAULT_VOLUME),
+            run('opus', path, args.streams, args.seconds, bot.DEFAULT_VOLUME),
+            run('opus', path, args.streams, args.seconds, 1.0),
+        ]
+
+    print(f"{args.streams} streams x {args.seconds}s of audio")
+    print(f"{'mode':<14}{'python s':>10}{'ffmpeg s':>10}{'wall s':>10}{'% core/stream':>16}")
+    for r in results:
+        print(f"{r['mode']:<14}{r['python_cpu']:>10.2f}{r['ffmpeg_cpu']:>10.2f}{r['wall']:>10.2f}{r['per_stream_pct']:>16.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+# Stand-ins for yt-dlp, ffmpeg and Discord, so the Music cog can be driven
+# offline by benchmarks.load. Everything is deterministic: latencies are fixed
+# per instance and per-query jitter is derived from the query itself.
+import asyncio
+import datetime
+import itertools
+import re
+import threading
+import time
+import zlib
+
+import discord
+
+import extraction
+
+FRAME_SECONDS = 0.02
+OPUS_SILENCE = b'\xf8\xff\xfe'
+PCM_SILENCE = b'\x00' * 3840
+# Playlist urls ending in a number have that many entries
+PLAYLIST_RE = re.compile(r'list=FAKE(\d+)')
+
+_ids = itertools.count(1)
+
+
+VIDEO_ID_RE = re.compile(r'v=([A-Za-z0-9_-]{11})')
+
+
+def _jitter(query, spread):
+    # Same query, same "network" delay, whatever order the workers run in
+    return spread * (zlib.crc32(query.encode()) % 1000) / 1000
+
+
+def _video_id(key):
+    return f'{zlib.crc32(key.encode()):011d}'
+
+
+# Drop-in for extraction._run_extract and _open_playlist: runs on the pool's
+# worker threads and blocks like yt-dlp does. Urls containing list=FAKE<n> are
+# n-entry playlists, anything else is a single video.
+class FakeYoutube:
+    def __init__(self, stream_latency=0.4, flat_latency=0.3, jitter=0.2, track_seconds=180):
+        self.stream_latency = stream_latency
+        self.flat_latency = flat_latency
+        self.jitter = jitter
+        self.track_seconds = track_seconds
+        self.calls = {'stream': 0, 'flat': 0}
+        self._lock = threading.Lock()
+
+    def install(self, workers=2, max_queue=100):
+        extraction._run_extract = self.extract
+        extraction._open_playlist = self.open_playlist
+        return extraction.ExtractionPool({'stream': {}, 'flat': {}}, workers=workers, kind='thread', max_queue=max_queue)
+
+    def extract(self, profile, options, query, download, overrides):
+        with self._lock:
+            self.calls[profile] += 1
+        latency = self.flat_latency if profile == 'flat' else self.stream_latency
+        time.sleep(latency + _jitter(query, self.jitter))
+
+        m = PLAYLIST_RE.search(query)
+        if m and profile == 'flat':
+            return self.playlist(query, int(m.group(1)), overrides.get('playlist_items'))
+        if query.startswith('ytsearch:'):
+            return {'_type': 'playlist', 'entries': [self.video(query, profile)]}
+        return self.video(query, profile)
+
+    # Lazy playlist listing: opening it costs a flat extraction, every 100
+    # entries after that another continuation request
+    def open_playlist(self, options, query):
+        with self._lock:
+            self.calls['flat'] += 1
+        time.sleep(self.flat_latency + _jitter(query, self.jitter))
+        m = PLAYLIST_RE.search(query)
+        return self._entries(self.playlist(query, int(m.group(1)) if m else 0)['entries'])
+
+    def _entries(self, entries):
+        for n, entry in enumerate(entries):
+            if n and n % 100 == 0:
+                time.sleep(self.flat_latency)
+            yield entry
+
+    def playlist(self, query, count, items=None):
+        start, end = 1, count
+        if items:
+            first, _, last = items.partition('-')
+            start, end = int(first), min(count, int(last or count))
+        entries = []
+        for n in range(start, end + 1):
+            video_id = _video_id(f'{query}#{n}')
+            entries.append({'id': video_id, 'url': f'https://www.youtube.com/watch?v={video_id}',
+                            'title': f'Fake track {video_id}', 'duration': self.track_seconds})
+        return {'_type': 'playlist', 'entries': entries}
+
+    def video(self, query, profile):
+        m = VIDEO_ID_RE.search(query)
+        video_id = m.group(1) if m else _video_id(query)
+        info = {
+            'id': video_id,
+            'title': f'Fake track {video_id}',
+            'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+            'duration': self.track_seconds,
+        }
+        if profile == 'stream':
+            expire = int(time.time()) + 6 * 3600
+            info['url'] = f'https://rr1---fake.googlevideo.com/videoplayback?id={video_id}&expire={expire}'
+            info['acodec'] = 'opus'
+        return info
+
+
+# Replaces bot.build_source: a source that yields silent frames for the track's
+# remaining duration instead of spawning ffmpeg. `spawn_cost` is spent on the
+# calling thread, like Popen is.
+class FakeSources:
+    def __init__(self, spawn_cost=0.005, opus=True):
+        self.spawn_cost = spawn_cost
+        self.opus = opus
+        self.created = 0
+        self.live = set()
+
+    def build(self, data, filename, *, start_time=0, volume=1.0, mode=None, before_options=None):
+        if self.spawn_cost:
+            time.sleep(self.spawn_cost)
+        self.created += 1
+        return FakeAudioSource(self, data, start_time, volume)
+
+
+class FakeAudioSource(discord.AudioSource):
+    def __init__(self, sources, data, start_time, volume):
+        self.sources = sources
+        self.data = data
+        self.title = data.get('title')
+        self.url = data.get('url')
+        self.duration = data.get('duration')
+        self.volume = volume
+        self.frames_left = max(0, int(((self.duration or 0) - start_time) / FRAME_SECONDS))
+        self.frame = OPUS_SILENCE if sources.opus else PCM_SILENCE
+        sources.live.add(self)
+
+    def read(self):
+        if self.frames_left <= 0:
+            return b''
+        self.frames_left -= 1
+        return self.frame
+
+    def is_opus(self):
+        return self.sources.opus
+
+    def cleanup(self):
+        self.frames_left = 0
+        self.sources.live.discard(self)
+
+
+# Same threading model as discord.py's AudioPlayer: one thread per playing
+# voice client reading a frame every 20 ms (divided by `speed`), calling
+# `after` from that thread when the source runs dry or stop() is called.
+class FakePlayer(threading.Thread):
+    def __init__(self, voice, source, after, speed):
+        super().__init__(daemon=True)
+        self.voice = voice
+        self.source = source
+        self.after = after
+        self.speed = speed
+        self._end = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._lock = threading.Lock()
+
+    def run(self):
+        delay = FRAME_SECONDS / self.speed
+        started = time.perf_counter()
+        frames = 0
+        while not self._end.is_set():
+            if not self._resumed.is_set():
+                self._resumed.wait()
+                started = time.perf_counter()
+                frames = 0
+                continue
+            with self._lock:
+                data = self.source.read()
+            if not data:
+                self._end.set()
+                break
+            if frames == 0 and self.voice.first_frame is None:
+                self.voice.first_frame = time.perf_counter()
+            frames += 1
+            self.voice.frames += 1
+            behind = time.perf_counter() - (started + frames * delay)
+            if behind > delay:
+                self.voice.late_frames += 1
+            time.sleep(max(0.0, delay - behind))
+
+        self.source.cleanup()
+        if self.after is not None:
+            try:
+                self.after(None)
+            except Exception as e:
+                print(f"after callback failed: {e}")
+
+    def stop(self):
+        self._end.set()
+        self._resumed.set()
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def is_playing(self):
+        return self._resumed.is_set() and not self._end.is_set()
+
+    def is_paused(self):
+        return not self._end.is_set() and not self._resumed.is_set()
+
+    def set_source(self, source):
+        with self._lock:
+            self.source = source
+
+
+class FakeVoiceClient:
+    def __init__(self, guild, channel, speed=1.0):
+        self.guild = guild
+        self.channel = channel
+        self.speed = speed
+        self._player = None
+        self.plays = 0
+        self.frames = 0
+        self.late_frames = 0
+        self.first_frame = None  # perf_counter() of the first frame ever played
+
+    def play(self, source, *, after=None):
+        if self.is_playing():
+            raise discord.ClientException('Already playing audio.')
+        self.plays += 1
+        self._player = FakePlayer(self, source, after, self.speed)
+        self._player.start()
+
+    @property
+    def source(self):
+        return self._player.source if self._player else None
+
+    @source.setter
+    def source(self, value):
+        if self._player:
+            self._player.set_source(value)
+
+    def is_playing(self):
+        return self._player is not None and self._player.is_playing()
+
+    def is_paused(self):
+        return self._player is not None and self._player.is_paused()
+
+    def pause(self):
+        if self._player:
+            self._player.pause()
+
+    def resume(self):
+        if self._player:
+            self._player.resume()
+
+    def stop(self):
+        if self._player:
+            self._player.stop()
+
+    def is_connected(self):
+        return self.guild.voice_client is self
+
+    async def disconnect(self, *, force=False):
+        self.stop()
+        self.guild.voice_client = None
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+
+# Discord objects, only as much as the Music cog touches. Every send/edit
+# sleeps `latency` to stand in for the REST round trip.
+class FakeMessage:
+    def __init__(self, channel, content, view=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.view = view
+        self.edits = 0
+
+    async def edit(self, *, content=None, view=None):
+        await asyncio.sleep(self.channel.latency)
+        self.edits += 1
+        self.channel.edits += 1
+        if content is not None:
+            self.content = content
+
+
+class FakeChannel:
+    def __init__(self, latency=0.05, name="ჭაჭing"):
+        self.id = next(_ids)
+        self.name = name
+        self.latency = latency
+        self.sent = 0
+        self.edits = 0
+
+    async def send(self, content=None, *, view=None, ephemeral=False):
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+        return FakeMessage(self, content, view)
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, speed=1.0):
+        self.id = next(_ids)
+        self.name = 'General'
+        self.guild = guild
+        self.speed = speed
+        self.members = []  # users who ran a command, so the channel never looks empty
+
+    async def connect(self):
+        self.guild.voice_client = FakeVoiceClient(self.guild, self, self.speed)
+        self.guild.voice_clients.append(self.guild.voice_client)
+        return self.guild.voice_client
+
+
+class FakeGuild:
+    def __init__(self, guild_id, latency=0.05, speed=1.0):
+        self.id = guild_id
+        self.voice_client = None
+        self.voice_clients = []  # every client ever connected, for stats after disconnecting
+        self.text_channel = FakeChannel(latency)
+        self.voice_channel = FakeVoiceChannel(self, speed)
+
+
+class _Voice:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeUser:
+    def __init__(self, guild):
+        self.id = next(_ids)
+        self.bot = False
+        self.voice = _Voice(guild.voice_channel)
+        guild.voice_channel.members.append(self)
+
+
+class FakeResponse:
+    def __init__(self, channel):
+        self.channel = channel
+        self._done = False
+        self.sent = []  # contents of send_message calls
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, *, ephemeral=False, thinking=False):
+        await asyncio.sleep(self.channel.latency)
+        self._done = True
+
+    async def send_message(self, content=None, *, view=None, ephemeral=False):
+        self.sent.append(content)
+        await self.channel.send(content, view=view)
+        self._done = True
+
+    async def edit_message(self, *, content=None, view=None):
+        await asyncio.sleep(self.channel.latency)
+        self._done = True
+
+
+class FakeFollowup:
+    def __init__(self, channel):
+        self.channel = channel
+        self.sent = []
+
+    async def send(self, content=None, *, view=None, ephemeral=False):
+        self.sent.append(content)
+        return await self.channel.send(content, view=view)
+
+
+class FakeInteraction:
+    def __init__(self, guild):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = guild.text_channel
+        self.user = FakeUser(guild)
+        self.response = FakeResponse(guild.text_channel)
+        self.followup = FakeFollowup(guild.text_channel)
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.created = time.perf_counter()
+
+
+# What the Music cog needs from commands.Bot
+class FakeBot:
+    def __init__(self, loop):
+        self.loop = loop
+        self.cogs = {}
+        self.guilds = []
+
+    def get_cog(self, name):
+        return self.cogs.get(name)
+
+    async def wait_until_ready(self):
+        pass
+
+    @property
+    def voice_clients(self):
+        return [g.voice_client for g in self.guilds if g.voice_client]
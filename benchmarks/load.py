@@ -0,0 +1,397 @@
+# Load scenarios for the Music cog, with no network and no Discord: yt-dlp,
+# ffmpeg, voice clients and interactions are the fakes from benchmarks.fakes.
+#
+#   python -m benchmarks.load progress --guilds 200 --seconds 30
+#   python -m benchmarks.load progress --guilds 800 --processes 4 --shards 16
+#   python -m benchmarks.load import --entries 5000
+#   python -m benchmarks.load seek --guilds 20 --presses 50
+#   python -m benchmarks.load autocomplete --titles 20000
+#   python -m benchmarks.load all --json results.jsonl
+#
+# Fake latencies are fixed (per-query jitter is a hash of the query), so runs
+# on the same machine are comparable across commits. --json appends one line
+# per scenario, tagged with the current commit.
+#
+# With --processes, the progress scenario is split over worker processes by
+# shard the way shards.py runs the bot, each one only seeing its own guilds,
+# and the results are added up.
+import argparse
+import asyncio
+import atexit
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the bot's storage out of the working tree, and off Mongo
+_tmp = tempfile.mkdtemp(prefix='bot-bench-')
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ['MONGO_URI'] = ''
+os.environ['PLAYLIST_DB'] = os.path.join(_tmp, 'bot.db')
+
+import bot  # noqa: E402
+from benchmarks.fakes import FakeBot, FakeGuild, FakeInteraction, FakeSources, FakeYoutube  # noqa: E402
+from cache import TTLCache  # noqa: E402
+from title_index import TitleIndex  # noqa: E402
+from shards import partition, shard_for  # noqa: E402
+from storage import CheckpointStore, SqliteCheckpointBackend  # noqa: E402
+
+
+def pct(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def wait_until(condition, timeout, interval=0.05):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+# Wires a fresh Music cog to the fakes. Module level state the cog reaches for
+# (extractor, stream cache, checkpoint store, build_source) is swapped out for
+# the duration of the scenario.
+class Harness:
+    def __init__(self, name, youtube, sources, workers=2, speed=1.0, latency=0.05, checkpoint_db=None):
+        self.name = name
+        self.checkpoint_db = checkpoint_db or os.path.join(_tmp, f'{name}.db')
+        self.youtube = youtube
+        self.sources = sources
+        self.workers = workers
+        self.speed = speed
+        self.latency = latency
+        self.lag = []
+        self._next_guild = 10 ** 17
+        self._saved = {}
+
+    def _swap(self, name, value):
+        self._saved.setdefault(name, getattr(bot, name))
+        setattr(bot, name, value)
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        self._swap('extractor', self.youtube.install(self.workers, max_queue=10_000))
+        self._swap('stream_cache', TTLCache(maxsize=bot.STREAM_CACHE_SIZE, ttl=bot.STREAM_CACHE_TTL))
+        self._swap('checkpoint_store', CheckpointStore(SqliteCheckpointBackend(self.checkpoint_db)))
+        self._swap('build_source', self.sources.build)
+
+        self.bot = FakeBot(loop)
+        self.music = bot.Music(self.bot)
+        self.music.transition_gaps = []
+        self.bot.cogs['Music'] = self.music
+        self._lag_task = loop.create_task(self._sample_lag())
+        self.cpu_started = time.process_time()
+        self.started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.wall = time.perf_counter() - self.started
+        self.cpu = time.process_time() - self.cpu_started
+        self._lag_task.cancel()
+
+        await asyncio.gather(*(player.stop() for player in self.music.players.values()))
+        # Let the audio threads finish their `after` callbacks
+        self.voices = [v for g in self.bot.guilds for v in g.voice_clients]
+        await asyncio.gather(*(asyncio.to_thread(v._player.join, 5) for v in self.voices if v._player))
+
+        self.music.cog_unload()
+        bot.extractor.shutdown()
+        for name, value in self._saved.items():
+            setattr(bot, name, value)
+
+    async def _sample_lag(self, interval=0.05):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.lag.append(max(0.0, loop.time() - started - interval))
+
+    def guild(self, guild_id=None):
+        if guild_id is None:
+            self._next_guild += 1
+            guild_id = self._next_guild
+        guild = FakeGuild(guild_id, latency=self.latency, speed=self.speed)
+        self.bot.guilds.append(guild)
+        return guild
+
+    async def play(self, guild, query):
+        interaction = FakeInteraction(guild)
+        await self.music.play.callback(self.music, interaction, query)
+        return interaction
+
+    def common(self):
+        gaps = [gap for gap, _ in self.music.transition_gaps]
+        frames = sum(v.frames for v in self.voices)
+        late = sum(v.late_frames for v in self.voices)
+        return {
+            'wall_s': self.wall,
+            'cpu_s': self.cpu,
+            'loop_lag_p50_ms': pct(self.lag, 0.5) * 1000,
+            'loop_lag_p99_ms': pct(self.lag, 0.99) * 1000,
+            'loop_lag_max_ms': max(self.lag, default=0.0) * 1000,
+            'transitions': len(gaps),
+            'transition_p50_ms': pct(gaps, 0.5) * 1000,
+            'transition_p95_ms': pct(gaps, 0.95) * 1000,
+            'late_frame_pct': 100 * late / frames if frames else 0.0,
+            'extract_stream': self.youtube.calls['stream'],
+            'extract_flat': self.youtube.calls['flat'],
+            'sources_created': self.sources.created,
+        }
+
+
+def video_url(n):
+    return f'https://www.youtube.com/watch?v={n % 10 ** 11:011d}'
+
+
+def first_audio_ms(interactions):
+    return [(i.guild.voice_clients[0].first_frame - i.created) * 1000
+            for i in interactions if i.guild.voice_clients and i.guild.voice_clients[0].first_frame]
+
+
+# N guilds hit /play at once with a short playlist each and keep playing, so
+# the progress scheduler, track transitions and prefetches all run together
+async def scenario_progress(args):
+    youtube = FakeYoutube(args.stream_latency, args.flat_latency, track_seconds=args.track_seconds)
+    async with Harness('progress', youtube, FakeSources(), args.workers, latency=args.latency) as h:
+        if getattr(args, 'guild_ids', None) is not None:
+            guilds = [h.guild(guild_id) for guild_id in args.guild_ids]
+        else:
+            guilds = [h.guild() for _ in range(args.guilds)]
+        plays = await asyncio.gather(*(
+            h.play(g, f'https://www.youtube.com/playlist?list=FAKE{args.songs}&guild={g.id}') for g in guilds
+        ))
+        await asyncio.sleep(args.seconds)
+        progress = h.music.progress.stats()
+        edits = sum(g.text_channel.edits for g in guilds)
+    first = first_audio_ms(plays)
+    return {
+        'started': len(first),
+        'first_audio_p50_ms': pct(first, 0.5),
+        'first_audio_p95_ms': pct(first, 0.95),
+        'edits': edits,
+        'edits_per_s': progress['edits'] / h.wall,
+        'edit_latency_p95_ms': progress['latency_p95'] * 1000,
+        'edits_dropped': progress['dropped'],
+        'edits_late': progress['late'],
+        **h.common(),
+    }
+
+
+# One guild queues a huge playlist while a few others play single songs: how
+# soon the importer hears audio, how long the whole import takes, and whether
+# the bystanders notice
+async def scenario_import(args):
+    youtube = FakeYoutube(args.stream_latency, args.flat_latency)
+    saved_max = bot.PLAYLIST_MAX_ITEMS
+    bot.PLAYLIST_MAX_ITEMS = args.entries
+    try:
+        async with Harness('import', youtube, FakeSources(), args.workers, latency=args.latency) as h:
+            importer = h.guild()
+            started = time.perf_counter()
+            play = await h.play(importer, f'https://www.youtube.com/playlist?list=FAKE{args.entries}')
+            bystanders = [h.guild() for _ in range(args.bystanders)]
+            others = await asyncio.gather(*(h.play(g, video_url(g.id))
+                                            for g in bystanders))
+            finished = await wait_until(lambda: not h.music.session(importer.id).imports, args.timeout)
+            import_seconds = time.perf_counter() - started
+            queued = len(h.music.session(importer.id).queue) + (1 if importer.id in h.music.current_song else 0)
+            status_edits = importer.text_channel.edits
+    finally:
+        bot.PLAYLIST_MAX_ITEMS = saved_max
+    other_first = first_audio_ms(others)
+    return {
+        'finished': finished,
+        'queued': queued,
+        'import_s': import_seconds,
+        'first_audio_ms': (first_audio_ms([play]) or [0.0])[0],
+        'bystander_first_audio_p95_ms': pct(other_first, 0.95),
+        'status_edits': status_edits,
+        **h.common(),
+    }
+
+
+# Guilds mash the +10s/-10s buttons faster than a seek can finish
+async def scenario_seek(args):
+    youtube = FakeYoutube(args.stream_latency, args.flat_latency, track_seconds=3600)
+    async with Harness('seek', youtube, FakeSources(), args.workers, latency=args.latency) as h:
+        guilds = [h.guild() for _ in range(args.guilds)]
+        await asyncio.gather(*(h.play(g, video_url(g.id)) for g in guilds))
+        await wait_until(lambda: all(g.voice_client and g.voice_client.first_frame for g in guilds), args.timeout)
+
+        latencies = []
+        outcomes = {'ok': 0, 'rejected': 0, 'failed': 0}
+
+        async def press(guild, seconds):
+            interaction = FakeInteraction(guild)
+            started = time.perf_counter()
+            await h.music.seek(interaction, seconds)
+            if interaction.response.sent:
+                outcomes['rejected'] += 1
+            elif interaction.followup.sent:
+                outcomes['failed'] += 1
+            else:
+                outcomes['ok'] += 1
+                latencies.append(time.perf_counter() - started)
+
+        async def spam(guild):
+            presses = []
+            for i in range(args.presses):
+                presses.append(asyncio.ensure_future(press(guild, 10 if i % 3 else -10)))
+                await asyncio.sleep(args.interval)
+            await asyncio.gather(*presses)
+
+        await asyncio.gather(*(spam(g) for g in guilds))
+    # Everything still live after the stop is a leak
+    leaked = len(h.sources.live)
+    return {
+        'presses': args.guilds * args.presses,
+        **outcomes,
+        'seek_p50_ms': pct(latencies, 0.5) * 1000,
+        'seek_p95_ms': pct(latencies, 0.95) * 1000,
+        'seek_max_ms': max(latencies, default=0.0) * 1000,
+        'leaked_sources': leaked,
+        **h.common(),
+    }
+
+
+# /play autocomplete against a full title index, one lookup per keystroke as
+# users type the start of titles that are (mostly) in it
+async def scenario_autocomplete(args):
+    rng = random.Random(1)
+    syllables = ['da', 'ko', 'ri', 'mel', 'son', 'ta', 'vi', 'lo', 'ne', 'shu', 'ba', 'gre', 'ol', 'ze', 'pa']
+    vocabulary = [''.join(rng.choice(syllables) for _ in range(rng.randint(1, 4))) for _ in range(3000)]
+    titles = [' '.join(rng.choice(vocabulary) for _ in range(rng.randint(2, 7))) for _ in range(args.titles)]
+
+    index = TitleIndex(max_entries=args.titles)
+    started = time.perf_counter()
+    for n, title in enumerate(titles):
+        index.add(f'{n:011d}', title, plays=rng.randint(1, 50))
+    build = time.perf_counter() - started
+
+    latencies = []
+    results = 0
+    for _ in range(args.lookups):
+        typed = ' '.join(rng.choice(titles).split()[:rng.randint(1, 2)])
+        for end in range(1, len(typed) + 1):
+            started = time.perf_counter()
+            results += len(index.search(typed[:end]))
+            latencies.append(time.perf_counter() - started)
+    return {
+        'titles': len(index),
+        'build_s': build,
+        'lookups': len(latencies),
+        'lookup_p50_ms': pct(latencies, 0.5) * 1000,
+        'lookup_p99_ms': pct(latencies, 0.99) * 1000,
+        'lookup_max_ms': max(latencies, default=0.0) * 1000,
+        'results_avg': results / len(latencies) if latencies else 0.0,
+    }
+
+
+def _shard_worker(args, shards):
+    bot.GAPLESS = args.gapless
+    args.guild_ids = [guild_id for guild_id in shard_guild_ids(args.guilds)
+                      if shard_for(guild_id, args.shards) in shards]
+    return asyncio.run(scenario_progress(args))
+
+
+# Snowflake-shaped ids spread evenly over the shards
+def shard_guild_ids(count):
+    return [(n << 22) | 1 for n in range(1, count + 1)]
+
+
+def run_sharded(args):
+    ranges = partition(args.shards, args.processes)
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(len(ranges), mp_context=context) as pool:
+        results = list(pool.map(_shard_worker, [args] * len(ranges), ranges))
+
+    total = {'processes': len(results)}
+    for key in results[0]:
+        values = [r[key] for r in results]
+        if key in ('wall_s',) or key.endswith(('_p50_ms', '_p95_ms', '_p99_ms', '_max_ms', '_pct')):
+            # Worst process; percentiles don't add up
+            total[key] = max(values)
+        else:
+            total[key] = sum(values)
+    return total
+
+
+SCENARIOS = {
+    'progress': scenario_progress,
+    'import': scenario_import,
+    'seek': scenario_seek,
+    'autocomplete': scenario_autocomplete,
+}
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def report(name, args, results):
+    print(f"== {name}")
+    for key, value in results.items():
+        print(f"  {key:<30}{value:>12.1f}" if isinstance(value, float) else f"  {key:<30}{value!s:>12}")
+    if args.json:
+        params = {k: v for k, v in vars(args).items() if k not in ('scenario', 'json')}
+        with open(args.json, 'a') as f:
+            f.write(json.dumps({'scenario': name, 'commit': commit(), 'params': params, 'results': results}) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scenario', choices=tuple(SCENARIOS) + ('all',))
+    parser.add_argument('--guilds', type=int, default=None, help="200 for progress, 20 for seek")
+    parser.add_argument('--seconds', type=float, default=30, help="progress: how long to keep playing")
+    parser.add_argument('--songs', type=int, default=5, help="progress: songs queued per guild")
+    parser.add_argument('--track-seconds', type=int, default=12, help="progress: track length")
+    parser.add_argument('--entries', type=int, default=5000, help="import: playlist size")
+    parser.add_argument('--bystanders', type=int, default=5, help="import: other guilds playing meanwhile")
+    parser.add_argument('--presses', type=int, default=50, help="seek: presses per guild")
+    parser.add_argument('--interval', type=float, default=0.05, help="seek: seconds between presses")
+    parser.add_argument('--titles', type=int, default=20000, help="autocomplete: titles in the index")
+    parser.add_argument('--lookups', type=int, default=500, help="autocomplete: titles typed out")
+    parser.add_argument('--stream-latency', type=float, default=0.4, help="fake yt-dlp stream extraction, seconds")
+    parser.add_argument('--flat-latency', type=float, default=0.3, help="fake yt-dlp playlist page, seconds")
+    parser.add_argument('--latency', type=float, default=0.05, help="fake Discord REST round trip, seconds")
+    parser.add_argument('--workers', type=int, default=bot.EXTRACT_WORKERS, help="extraction workers per process")
+    parser.add_argument('--processes', type=int, default=1, help="progress: shard worker processes")
+    parser.add_argument('--shards', type=int, default=None, help="progress: shard count (default: one per process)")
+    parser.add_argument('--gapless', action='store_true', help="play with bot.GAPLESS on")
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--json', help="append results to this file as JSON lines")
+    args = parser.parse_args()
+    bot.GAPLESS = args.gapless
+
+    names = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    for name in names:
+        scenario_args = argparse.Namespace(**vars(args))
+        if scenario_args.guilds is None:
+            scenario_args.guilds = 20 if name == 'seek' else 200
+        if name == 'progress' and args.processes > 1:
+            scenario_args.shards = args.shards or args.processes
+            results = run_sharded(scenario_args)
+        else:
+            results = asyncio.run(SCENARIOS[name](scenario_args))
+        report(name, scenario_args, results)
+
+
+if __name__ == '__main__':
+    main()
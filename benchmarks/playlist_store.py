@@ -0,0 +1,99 @@
+# Write/read cost of the local playlist backends at a realistic-ish size.
+#
+# Fills each backend with --playlists playlists (spread over users, --songs songs
+# each), then times single-song adds, playlist creates and per-user reads.
+# The JSON backend rewrites the whole file on every change; SQLite only
+# touches the affected rows.
+#
+#   python -m benchmarks.playlist_store --playlists 10000
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import JsonPlaylistBackend, SqlitePlaylistBackend  # noqa: E402
+
+PLAYLISTS_PER_USER = 10
+
+
+def make_data(playlists, songs):
+    data = {}
+    for i in range(playlists):
+        user_id = str(100000000000000000 + i // PLAYLISTS_PER_USER)
+        data.setdefault(user_id, {})[f'playlist {i % PLAYLISTS_PER_USER}'] = [
+            f'https://www.youtube.com/watch?v={i:06d}{j:05d}' for j in range(songs)
+        ]
+    return data
+
+
+def timed(fn, ops):
+    start = time.perf_counter()
+    for args in ops:
+        fn(*args)
+    return (time.perf_counter() - start) / len(ops)
+
+
+def run(name, backend, data, ops, rng):
+    if isinstance(backend, JsonPlaylistBackend):
+        # Write the file first so setup() loads the full dataset into memory
+        backend.save_all(data)
+        backend.setup()
+    else:
+        backend.setup()
+        backend.save_all(data)
+    users = list(data)
+
+    # The store passes each backend the user's updated playlists alongside the
+    # change, mirror that here
+    add_ops = []
+    for _ in range(ops):
+        user_id = rng.choice(users)
+        playlist = rng.choice(list(data[user_id]))
+        data[user_id][playlist].append('ytsearch:benchmark song')
+        add_ops.append((user_id, playlist, 'ytsearch:benchmark song', data[user_id]))
+
+    create_ops = []
+    for i in range(ops):
+        user_id = rng.choice(users)
+        data[user_id][f'new {i}'] = []
+        create_ops.append((user_id, f'new {i}', data[user_id]))
+
+    return {
+        'backend': name,
+        'add_song': timed(backend.add_song, add_ops),
+        'create': timed(backend.create_playlist, create_ops),
+        'load_user': timed(backend.load_user, [(rng.choice(users),) for _ in range(ops)]),
+        'size': os.path.getsize(backend.path),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--playlists', type=int, default=10000)
+    parser.add_argument('--songs', type=int, default=20)
+    parser.add_argument('--ops', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, backend in (
+            ('json', JsonPlaylistBackend(os.path.join(tmp, 'playlists.json'))),
+            ('sqlite', SqlitePlaylistBackend(os.path.join(tmp, 'playlists.db'))),
+        ):
+            data = make_data(args.playlists, args.songs)
+            results.append(run(name, backend, data, args.ops, random.Random(args.seed)))
+
+    print(f"{args.playlists} playlists x {args.songs} songs, {args.ops} ops each")
+    print(f"{'backend':<10}{'add_song ms':>14}{'create ms':>12}{'load_user ms':>15}{'size MB':>10}")
+    for r in results:
+        print(f"{r['backend']:<10}{r['add_song'] * 1000:>14.2f}{r['create'] * 1000:>12.2f}"
+              f"{r['load_user'] * 1000:>15.3f}{r['size'] / 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# Local stand-in for open.spotify.com, for exercising spotify.SpotifyResolver
+# without hitting Spotify.
+#
+# Record a link once (the album/playlist page plus every track page it lists):
+#   python -m benchmarks.spotify_standin record https://open.spotify.com/album/<id> --pages spotify_pages
+# Then replay it as often as needed, optionally with added per-request latency:
+#   python -m benchmarks.spotify_standin run https://open.spotify.com/album/<id> --pages spotify_pages --latency 150
+#
+# Pages are stored as <pages>/<kind>/<id>.html.
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spotify import SONG_META_RE, SpotifyResolver  # noqa: E402
+
+
+async def record(url, pages):
+    resolver = SpotifyResolver()
+    kind, spotify_id = resolver.match(url)
+    targets = [(kind, spotify_id)]
+
+    async with aiohttp.ClientSession(headers={'User-Agent': 'Mozilla/5.0'}) as session:
+        async def fetch(kind, spotify_id):
+            async with session.get(f"https://open.spotify.com/{kind}/{spotify_id}") as resp:
+                resp.raise_for_status()
+                text = await resp.text()
+            os.makedirs(os.path.join(pages, kind), exist_ok=True)
+            with open(os.path.join(pages, kind, f"{spotify_id}.html"), 'w') as f:
+                f.write(text)
+            return text
+
+        text = await fetch(kind, spotify_id)
+        if kind != 'track':
+            for song_url in SONG_META_RE.findall(text):
+                m = resolver.match(song_url)
+                if m and m not in targets:
+                    targets.append(m)
+                    await fetch(*m)
+
+    print(f"Recorded {len(targets)} pages into {pages}")
+
+
+async def run(url, pages, latency, concurrency):
+    async def page(request):
+        if latency:
+            await asyncio.sleep(latency / 1000)
+        path = os.path.join(pages, request.match_info['kind'], f"{request.match_info['id']}.html")
+        if not os.path.exists(path):
+            raise web.HTTPNotFound()
+        with open(path) as f:
+            return web.Response(text=f.read(), content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/{kind}/{id}', page)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    resolver = SpotifyResolver(origin=f"http://127.0.0.1:{port}", concurrency=concurrency)
+    try:
+        start = time.perf_counter()
+        first = None
+        searches = []
+        async for search in resolver.expand(url):
+            if first is None:
+                first = time.perf_counter() - start
+            searches.append(search)
+        total = time.perf_counter() - start
+
+        # Second pass is served entirely from the resolver's cache
+        start = time.perf_counter()
+        async for _ in resolver.expand(url):
+            pass
+        cached = time.perf_counter() - start
+    finally:
+        await resolver.close()
+        await runner.cleanup()
+
+    for search in searches:
+        print(search)
+    print(f"{len(searches)} tracks: first after {(first or 0) * 1000:.0f} ms, all after {total * 1000:.0f} ms, "
+          f"cached {cached * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', choices=('record', 'run'))
+    parser.add_argument('url')
+    parser.add_argument('--pages', default='spotify_pages')
+    parser.add_argument('--latency', type=int, default=0, help="added latency per request, in ms")
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.mode == 'record':
+        asyncio.run(record(args.url, args.pages))
+    else:
+        asyncio.run(run(args.url, args.pages, args.latency, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
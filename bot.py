@@ -1,100 +1,222 @@
+import time
+# Boot timing starts before the heavy imports, see boot_timings below
+BOOT_STARTED = time.perf_counter()
+
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
-import yt_dlp
 import os
 from dotenv import load_dotenv
 import asyncio
-import imageio_ffmpeg
-import time
 import collections
+import functools
+import hashlib
+import io
 import json
-import pymongo
-from pymongo import MongoClient
-import threading
-from flask import Flask
+import shutil
+import subprocess
+import weakref
+import metrics
+import profiling
+from cache import TTLCache
+from disk_cache import OpusDiskCache
+from gapless import Prebuffered, TrackChain, unwrap
+from health import HealthServer
+from shards import close_on_sigterm, parse_shard_ids
+from extraction import ExtractionPool, ExtractionQueueFull, INTERACTIVE, BACKGROUND
+from progress import ProgressScheduler
+from seek_buffer import SeekBuffer
+from song_queue import SongQueue, Track
+from spotify import SpotifyResolver
+from title_index import TitleIndex
+from storage import (PlaylistStore, MongoPlaylistBackend, JsonPlaylistBackend, SqlitePlaylistBackend,
+                     CheckpointStore, MongoCheckpointBackend, SqliteCheckpointBackend,
+                     KeyValueStore, MongoKeyValueBackend, SqliteKeyValueBackend, MongoDatabase,
+                     SearchCache, MongoSearchBackend, SqliteSearchBackend, PlaylistsUnavailable,
+                     PinStore, MongoPinBackend, SqlitePinBackend)
+
+# Startup phases in seconds, printed once the gateway is ready. yt_dlp and
+# pymongo are only imported when first needed to keep the first one small.
+boot_timings = {}
+_boot_mark = [BOOT_STARTED]
+
+def mark_boot(phase):
+    now = time.perf_counter()
+    boot_timings[phase] = now - _boot_mark[0]
+    _boot_mark[0] = now
+
+mark_boot('imports')
+
+# Hot-path metrics, served on /metrics by the health server
+FIRST_AUDIO_SECONDS = metrics.Histogram('time_to_first_audio_seconds',
+                                        'Time until a track starts playing: from the /play interaction, or from the end of the previous track',
+                                        ['path'])
+SEEK_SECONDS = metrics.Histogram('seek_seconds', 'Time from a seek press until audio resumes')
+SEEKS = metrics.Counter('seeks', 'Seeks, by whether the frames were in memory or ffmpeg was restarted', ['served'])
+loop_lag = metrics.LoopLagMonitor()
 
 load_dotenv()
 
 TOKEN = os.getenv('DISCORD_TOKEN')
 MONGO_URI = os.getenv('MONGO_URI')
 PLAYLIST_FILE = 'playlists.json'
-
-# MongoDB Setup
-if MONGO_URI:
-    try:
-        client = MongoClient(MONGO_URI)
-        db = client['music_bot']
-        playlists_col = db['playlists']
-        using_mongo = True
-        print("Connected to MongoDB for playlists.")
-    except Exception as e:
-        print(f"Failed to connect to MongoDB: {e}. Falling back to local file.")
-        using_mongo = False
+# Local storage when MONGO_URI is unset: 'sqlite' (default) or the legacy 'json' file
+LOCAL_STORE = os.getenv('LOCAL_STORE', 'sqlite')
+PLAYLIST_DB = os.getenv('PLAYLIST_DB', 'playlists.db')
+
+# Resolved stream info cache (see YTDLSource.from_url)
+STREAM_CACHE_SIZE = int(os.getenv('STREAM_CACHE_SIZE', 512))
+STREAM_CACHE_TTL = int(os.getenv('STREAM_CACHE_TTL', 3 * 3600))
+# Drop entries this many seconds before googlevideo's signed URL expires,
+# so a track started from the cache can still finish/reconnect
+STREAM_EXPIRY_MARGIN = int(os.getenv('STREAM_EXPIRY_MARGIN', 15 * 60))
+# Persistent search query -> video id cache (SEARCH_CACHE_SIZE=0 disables it)
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', 50000))
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', 30 * 24 * 3600))
+# /play autocomplete: titles played or saved, kept in memory and saved every
+# TITLE_INDEX_SAVE_INTERVAL seconds when changed
+TITLE_INDEX_SIZE = int(os.getenv('TITLE_INDEX_SIZE', 20000))
+TITLE_INDEX_SAVE_INTERVAL = float(os.getenv('TITLE_INDEX_SAVE_INTERVAL', 300))
+
+# Saved playlist entries are resolved to video ids in the background: when
+# added, and every PIN_INTERVAL hours for up to PIN_BATCH unresolved entries,
+# starting PIN_DELAY seconds after the bot is ready. Entries that fail are
+# left alone for PIN_INTERVAL hours, doubling per failure up to PIN_RETRY_MAX.
+PIN_CONCURRENCY = int(os.getenv('PIN_CONCURRENCY', 2))
+PIN_INTERVAL = float(os.getenv('PIN_INTERVAL', 6))
+PIN_BATCH = int(os.getenv('PIN_BATCH', 200))
+PIN_DELAY = float(os.getenv('PIN_DELAY', 600))
+PIN_RETRY_MAX = float(os.getenv('PIN_RETRY_MAX', 7 * 24))
+# How many upcoming queue entries to resolve in the background while a song plays
+PREFETCH_DEPTH = int(os.getenv('PREFETCH_DEPTH', 1))
+
+# 'opus': ffmpeg hands discord.py ready-made Opus and applies volume itself.
+# 'pcm': legacy path, Python scales every PCM frame and discord.py encodes it.
+AUDIO_MODE = os.getenv('AUDIO_MODE', 'opus')
+DEFAULT_VOLUME = float(os.getenv('DEFAULT_VOLUME', 0.5))
+
+# yt-dlp extraction pool ('thread' or 'process'), see extraction.py
+EXTRACT_POOL = os.getenv('EXTRACT_POOL', 'thread')
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', 2))
+EXTRACT_QUEUE_LIMIT = int(os.getenv('EXTRACT_QUEUE_LIMIT', 100))
+
+# Songs per page of /queue
+QUEUE_PAGE_SIZE = int(os.getenv('QUEUE_PAGE_SIZE', 10))
+
+# Playlists are listed page by page so playback can start after the first page
+PLAYLIST_PAGE_SIZE = int(os.getenv('PLAYLIST_PAGE_SIZE', 50))
+PLAYLIST_MAX_ITEMS = int(os.getenv('PLAYLIST_MAX_ITEMS', 1000))
+
+# Where Spotify pages are fetched from (point at a local stand-in for testing)
+SPOTIFY_ORIGIN = os.getenv('SPOTIFY_ORIGIN', 'https://open.spotify.com')
+
+# Queues/positions are checkpointed this often (seconds) so they survive restarts
+CHECKPOINT_INTERVAL = float(os.getenv('CHECKPOINT_INTERVAL', 30))
+
+# Set to sync slash commands on boot even if the command tree looks unchanged
+FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', '') not in ('', '0', 'false')
+
+# Optional local cache of popular tracks as Opus/Ogg files (empty = disabled).
+# A track is written after DISK_CACHE_ADMIT_AFTER plays; least recently played
+# tracks are evicted past DISK_CACHE_MAX_MB.
+DISK_CACHE_DIR = os.getenv('DISK_CACHE_DIR', '')
+DISK_CACHE_MAX_MB = int(os.getenv('DISK_CACHE_MAX_MB', 2048))
+DISK_CACHE_ADMIT_AFTER = int(os.getenv('DISK_CACHE_ADMIT_AFTER', 2))
+
+# Gapless mode (see gapless.py): the next track's ffmpeg is started GAPLESS_LEAD
+# seconds before the current one ends and GAPLESS_BUFFER_FRAMES 20 ms frames are
+# read ahead, so playback moves on without the AudioPlayer stopping. An optional
+# crossfade (seconds) applies in PCM mode only.
+GAPLESS = os.getenv('GAPLESS', '') not in ('', '0', 'false')
+GAPLESS_LEAD = float(os.getenv('GAPLESS_LEAD', 5))
+GAPLESS_BUFFER_FRAMES = int(os.getenv('GAPLESS_BUFFER_FRAMES', 50))
+GAPLESS_CROSSFADE = float(os.getenv('GAPLESS_CROSSFADE', 0))
+
+# Seek buffer (see seek_buffer.py): the playing track keeps SEEK_BUFFER_SECONDS
+# of played frames and reads SEEK_AHEAD_SECONDS ahead, so seeks inside that
+# window need no ffmpeg restart. At most SEEK_BUFFER_MB per track (Opus is
+# ~16 KB/s, PCM 192 KB/s). SEEK_BUFFER_SECONDS=0 turns it off.
+SEEK_BUFFER_SECONDS = float(os.getenv('SEEK_BUFFER_SECONDS', 120))
+SEEK_AHEAD_SECONDS = float(os.getenv('SEEK_AHEAD_SECONDS', 15))
+SEEK_BUFFER_MB = float(os.getenv('SEEK_BUFFER_MB', 8))
+
+# The reaper leaves voice channels nobody has been listening in for
+# EMPTY_DISCONNECT seconds, or where nothing has played for IDLE_DISCONNECT
+# seconds (queues are checkpointed first, /play picks them up again), and
+# forgets idle guilds' state. Checked every REAP_INTERVAL seconds.
+IDLE_DISCONNECT = float(os.getenv('IDLE_DISCONNECT', 300))
+EMPTY_DISCONNECT = float(os.getenv('EMPTY_DISCONNECT', 60))
+REAP_INTERVAL = float(os.getenv('REAP_INTERVAL', 30))
+
+# Sharding (see shards.py): total shard count and the shards this process runs.
+# Unset: a single process connected as one shard.
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 0)) or None
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS', '')) or None
+SHARDED = SHARD_COUNT is not None or SHARD_IDS is not None
+
+# Health check / metrics server (port from env, standard for cloud hosts).
+# Unhealthy when the gateway is down or the event loop lagged more than this.
+PORT = int(os.getenv('PORT', 8080))
+HEALTH_MAX_LAG = float(os.getenv('HEALTH_MAX_LAG', 1.0))
+
+# Stall diagnostics. The event loop being blocked for longer than
+# STALL_THRESHOLD seconds is logged with the loop thread's stack (0 = off).
+# LOOP_DEBUG turns on asyncio's debug mode as well, which logs callbacks slower
+# than SLOW_CALLBACK seconds along with where their task was created; it slows
+# everything down, so it's for chasing a problem, not for leaving on.
+# DEBUG_TOKEN enables /debug/stalls and /debug/profile on the health server,
+# /profile works for the bot's owner regardless.
+STALL_THRESHOLD = float(os.getenv('STALL_THRESHOLD', 0.25))
+LOOP_DEBUG = os.getenv('LOOP_DEBUG', '') not in ('', '0', 'false')
+SLOW_CALLBACK = float(os.getenv('SLOW_CALLBACK', 0.1))
+DEBUG_TOKEN = os.getenv('DEBUG_TOKEN')
+PROFILE_MAX_SECONDS = 60
+stall_watchdog = profiling.StallWatchdog(STALL_THRESHOLD) if STALL_THRESHOLD else None
+
+# MongoDB Setup. The connection is made in the background on a storage thread
+# (see MusicBot.setup_hook), not at import time.
+using_mongo = bool(MONGO_URI)
+if using_mongo:
+    mongo = MongoDatabase(MONGO_URI)
+
+if using_mongo:
+    playlist_backend = MongoPlaylistBackend(mongo, 'playlists', migrate_from=PLAYLIST_FILE)
+elif LOCAL_STORE == 'json' and not SHARDED:
+    # Rewrites the whole file, so it can't be shared between shard workers
+    playlist_backend = JsonPlaylistBackend(PLAYLIST_FILE)
 else:
-    using_mongo = False
+    # Picks up an existing playlists.json on first start
+    playlist_backend = SqlitePlaylistBackend(PLAYLIST_DB, migrate_from=PLAYLIST_FILE)
+
+# Used by the /playlist commands: cached per user, non-blocking, granular writes.
+# Shard workers share the backend, so they only cache briefly.
+playlist_store = PlaylistStore(playlist_backend, ttl=float(os.getenv('PLAYLIST_CACHE_TTL', 5 if SHARDED else 'inf')))
+
+# Per-guild queue/position checkpoints (the JSON store has no local equivalent, use SQLite)
+if using_mongo:
+    checkpoint_store = CheckpointStore(MongoCheckpointBackend(mongo, 'checkpoints'))
+    meta_store = KeyValueStore(MongoKeyValueBackend(mongo, 'meta'))
+    pin_store = PinStore(MongoPinBackend(mongo, 'playlist_pins'))
+else:
+    checkpoint_store = CheckpointStore(SqliteCheckpointBackend(PLAYLIST_DB))
+    meta_store = KeyValueStore(SqliteKeyValueBackend(PLAYLIST_DB))
+    pin_store = PinStore(SqlitePinBackend(PLAYLIST_DB))
+
+search_cache = None
+if SEARCH_CACHE_SIZE:
+    search_backend = MongoSearchBackend(mongo, 'search_cache') if using_mongo else SqliteSearchBackend(PLAYLIST_DB)
+    search_cache = SearchCache(search_backend, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_SIZE)
 
+# Whole-dataset access, for scripts and one-off maintenance
 def load_playlists():
-    if using_mongo:
-        try:
-            # We store all playlists in one document or per user? 
-            # Looking at original code, it's user_id -> {playlist_name: [songs]}
-            all_data = {}
-            for doc in playlists_col.find():
-                user_id = doc['user_id']
-                all_data[user_id] = doc['playlists']
-            return all_data
-        except Exception as e:
-            print(f"Error loading from MongoDB: {e}")
-            return {}
-            
-    if os.path.exists(PLAYLIST_FILE):
-        try:
-            with open(PLAYLIST_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
-
-def save_playlists_to_mongo(user_id, name, songs, deletion=False):
-    if not using_mongo:
-        return
     try:
-        if deletion and name is None:
-            # Delete whole user data? No, original had per-user dict
-            playlists_col.delete_one({'user_id': user_id})
-        else:
-            # Update specific user's playlists
-            doc = playlists_col.find_one({'user_id': user_id})
-            if doc:
-                playlists = doc.get('playlists', {})
-                if deletion:
-                    if name in playlists:
-                        del playlists[name]
-                else:
-                    playlists[name] = songs
-                playlists_col.update_one({'user_id': user_id}, {'$set': {'playlists': playlists}}, upsert=True)
-            else:
-                if not deletion:
-                    playlists_col.insert_one({'user_id': user_id, 'playlists': {name: songs}})
+        return playlist_backend.load_all()
     except Exception as e:
-        print(f"Error saving to MongoDB: {e}")
+        print(f"Error loading playlists: {e}")
+        return {}
 
 def save_playlists(data):
-    # This is the old monolithic save. For MongoDB we might want more granular updates
-    # but to keep compatibility with existing code structure:
-    if using_mongo:
-        # We don't want to re-upload everything every time ideally, 
-        # but the bot's logic calls this after any change.
-        for user_id, playlists in data.items():
-            playlists_col.update_one({'user_id': user_id}, {'$set': {'playlists': playlists}}, upsert=True)
-        return
-
-    with open(PLAYLIST_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
-
-# Suppress noise about console usage from errors
-yt_dlp.utils.bug_reports_message = lambda *args, **kwargs: ''
+    playlist_backend.save_all(data)
 
 ytdl_format_options = {
     'format': 'bestaudio/best',
@@ -122,39 +244,135 @@ ffmpeg_options = {
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -reconnect_at_eof 1'
 }
 
-ytdl = yt_dlp.YoutubeDL(ytdl_format_options)
+# Quick extraction to tell playlists from single tracks without resolving each entry
+ytdl_flat_options = {
+    'extract_flat': True,
+    'quiet': True,
+    'noplaylist': False,
+    'default_search': 'auto',
+}
+
+# Only needed for prepare_filename on the (unused by default) download path
+@functools.lru_cache(maxsize=None)
+def get_ytdl():
+    import yt_dlp
+    # Suppress noise about console usage from errors
+    yt_dlp.utils.bug_reports_message = lambda *args, **kwargs: ''
+    return yt_dlp.YoutubeDL(ytdl_format_options)
+
+# Looked up once: the system ffmpeg if there is one (the Docker image installs
+# it), otherwise the binary bundled with imageio-ffmpeg
+@functools.lru_cache(maxsize=None)
+def get_ffmpeg_executable():
+    system_ffmpeg = shutil.which('ffmpeg')
+    if system_ffmpeg:
+        return system_ffmpeg
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+# All extract_info calls go through here instead of the loop's default executor
+extractor = ExtractionPool(
+    {'stream': ytdl_format_options, 'flat': ytdl_flat_options},
+    workers=EXTRACT_WORKERS,
+    kind=EXTRACT_POOL,
+    max_queue=EXTRACT_QUEUE_LIMIT,
+)
 
 import re
-import aiohttp
-
-# ... (Previous imports)
 
-# Helper to resolve Spotify tracks to YouTube search queries
-async def resolve_spotify_track(query):
-    if "open.spotify.com/track" in query:
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(query) as resp:
-                    if resp.status == 200:
-                        text = await resp.text()
-                        # Extract title from meta tags or title tag
-                        # <meta property="og:title" content="Song Name" />
-                        # <meta property="og:description" content="Artist ... " />
-                        # Simple Title tag fallback: <title>Song - Artist | Spotify</title>
-                        
-                        m = re.search(r'<title>(.*?) \| Spotify</title>', text) or re.search(r'<title>(.*?)</title>', text)
-                        if m:
-                            title = m.group(1)
-                            # Clean up common spotify title suffixes
-                            title = title.replace(" - song by", "")
-                            title = title.replace(" | Spotify", "")
-                            return f"ytsearch:{title}"
-        except Exception as e:
-            print(f"Failed to resolve Spotify link: {e}")
-    return query
+# Spotify links are turned into YouTube searches, see spotify.py
+spotify = SpotifyResolver(origin=SPOTIFY_ORIGIN)
+
+# Cache of resolved yt-dlp info, keyed by canonical video id / normalized query
+YOUTUBE_ID_RE = re.compile(r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/)|youtu\.be/)([A-Za-z0-9_-]{11})')
+EXPIRE_RE = re.compile(r'[?&/]expire[=/](\d+)')
+
+stream_cache = TTLCache(maxsize=STREAM_CACHE_SIZE, ttl=STREAM_CACHE_TTL)
+
+disk_cache = None
+if DISK_CACHE_DIR:
+    disk_cache = OpusDiskCache(DISK_CACHE_DIR, DISK_CACHE_MAX_MB * 1024 * 1024,
+                               admit_after=DISK_CACHE_ADMIT_AFTER, ffmpeg=get_ffmpeg_executable)
+
+def youtube_id(query):
+    m = YOUTUBE_ID_RE.search(query or '')
+    return m.group(1) if m else None
+
+def canonical_key(query):
+    video_id = youtube_id(query)
+    if video_id:
+        return f"youtube:{video_id}"
+    if query.startswith(('http://', 'https://')):
+        return query.strip()
+    # Plain searches: "Despacito " and "despacito" are the same lookup
+    return ' '.join(query.lower().split())
+
+# Normalized form of a plain search ("Despacito", "ytsearch:Song Artist"), None for URLs
+def search_key(query):
+    if query.startswith(('http://', 'https://')):
+        return None
+    if query.startswith('ytsearch:'):
+        query = query[len('ytsearch:'):]
+    return ' '.join(query.lower().split()) or None
+
+# Remembers which video a search picked (written in the background)
+def remember_search(key, data):
+    video_id = youtube_id(data.get('webpage_url') or data.get('url'))
+    if search_cache and key and video_id:
+        asyncio.get_running_loop().create_task(search_cache.put(
+            key, {'video_id': video_id, 'title': data.get('title'), 'duration': data.get('duration')}))
+
+# The video a search picked before (in any guild, before any restart), as
+# {'url', 'title', 'duration'}, or None
+async def cached_search(query):
+    key = search_key(query)
+    if not search_cache or not key:
+        return None
+    entry = await search_cache.get(key)
+    if not entry:
+        return None
+    return {'url': f"https://www.youtube.com/watch?v={entry['video_id']}",
+            'title': entry.get('title'), 'duration': entry.get('duration')}
+
+title_index = TitleIndex(max_entries=TITLE_INDEX_SIZE)
+# Each shard worker keeps its own index
+TITLE_INDEX_KEY = 'title_index' + (f':{SHARD_IDS[0]}' if SHARD_IDS else '')
+
+def stream_expires_at(data):
+    # googlevideo URLs carry their signature expiry as ?expire=<unix ts>
+    # (or /expire/<ts>/ for manifest URLs)
+    m = EXPIRE_RE.search(data.get('url') or '')
+    return int(m.group(1)) if m else None
+
+def stream_cache_ttl(data):
+    expire = stream_expires_at(data)
+    if expire is None:
+        return STREAM_CACHE_TTL
+    return min(STREAM_CACHE_TTL, expire - time.time() - STREAM_EXPIRY_MARGIN)
+
+async def extract_stream_info(url, guild_id=None, priority=INTERACTIVE):
+    async def load():
+        # A search that was done before goes straight to its video
+        hit = await cached_search(url)
+        video_url = hit['url'] if hit else None
+        data = await extractor.extract(video_url or url, profile='stream', guild_id=guild_id, priority=priority)
+        if 'entries' in data:
+            data = data['entries'][0]
+        if video_url is None:
+            remember_search(search_key(url), data)
+        # Also remember it under the video's own id, so the same track reached
+        # through a search or a different URL form hits the cache too
+        if data.get('webpage_url'):
+            alias = canonical_key(data['webpage_url'])
+            if alias != key:
+                stream_cache.set(alias, data, stream_cache_ttl(data))
+        return data
+
+    key = canonical_key(url)
+    return await stream_cache.get_or_load(key, load, ttl_for=stream_cache_ttl)
 
 class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.5):
+    def __init__(self, source, *, data, volume=DEFAULT_VOLUME):
         super().__init__(source, volume)
         self.data = data
         self.title = data.get('title')
@@ -162,27 +380,109 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.duration = data.get('duration')
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=False, start_time=0):
-        loop = loop or asyncio.get_event_loop()
+    async def from_url(cls, url, *, loop=None, stream=False, start_time=0, data=None, volume=DEFAULT_VOLUME,
+                       guild_id=None, priority=INTERACTIVE):
         
         # Resolve Spotify links first
-        url = await resolve_spotify_track(url)
-        
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
-
-        if 'entries' in data:
-            data = data['entries'][0]
-
-        filename = data['url'] if stream else ytdl.prepare_filename(data)
-        
-        ffmpeg_executable = imageio_ffmpeg.get_ffmpeg_exe()
-        
-        # Add seeking if needed
-        options = ffmpeg_options.copy()
-        if start_time > 0:
-            options['before_options'] += f' -ss {start_time}'
-
-        return cls(discord.FFmpegPCMAudio(filename, executable=ffmpeg_executable, **options), data=data)
+        url = await spotify.resolve_track(url)
+
+        # Tracks in the local disk cache need no extraction at all
+        local = await disk_cache.lookup(youtube_id(url)) if disk_cache and stream else None
+
+        if local is not None:
+            pass
+        elif data is not None:
+            # Already resolved (e.g. prefetched while the previous song played)
+            pass
+        elif stream:
+            # Loop replays, seeks and popular tracks reuse the cached stream info
+            data = await extract_stream_info(url, guild_id=guild_id, priority=priority)
+        else:
+            data = await extractor.extract(url, profile='stream', guild_id=guild_id, priority=priority, download=True)
+            if 'entries' in data:
+                data = data['entries'][0]
+
+        # A search or other url form can still turn out to be a cached video
+        if local is None and disk_cache and stream:
+            video_id = youtube_id(data.get('webpage_url'))
+            if video_id != youtube_id(url):
+                local = await disk_cache.lookup(video_id)
+
+        if local is not None:
+            # Local file: no reconnect options, and -ss seeks are instant
+            path, data = local
+            return seekable(build_source(data, path, start_time=start_time, volume=volume, before_options=''), start_time)
+
+        filename = data['url'] if stream else get_ytdl().prepare_filename(data)
+        return seekable(build_source(data, filename, start_time=start_time, volume=volume), start_time)
+
+# Opus playback: ffmpeg does the decoding, volume filter and Opus encoding (or
+# just remuxes when the stream is already Opus at 100% volume), so the voice
+# thread only forwards packets and Python does no per-frame work
+class YTDLOpusSource(discord.FFmpegOpusAudio):
+    def __init__(self, filename, *, data, volume=DEFAULT_VOLUME, executable='ffmpeg', before_options=None):
+        options = ffmpeg_options['options']
+        codec = None
+        if volume != 1.0:
+            options += f' -af volume={volume:.2f}'
+        elif data.get('acodec') == 'opus':
+            codec = 'copy'
+
+        super().__init__(filename, codec=codec, executable=executable, before_options=before_options, options=options)
+        self.data = data
+        self.title = data.get('title')
+        self.url = data.get('url')
+        self.duration = data.get('duration')
+        # Fixed for the lifetime of the ffmpeg process; changing it means a restart
+        self.volume = volume
+
+# Every source we create, so /metrics can count the ffmpeg processes still
+# alive and the reaper can find ones nothing plays anymore
+live_sources = weakref.WeakKeyDictionary() # source -> monotonic() when it was created
+
+def ffmpeg_alive(source):
+    source = getattr(unwrap(source), 'original', source)
+    process = getattr(source, '_process', None)
+    return isinstance(process, subprocess.Popen) and process.poll() is None
+
+def build_source(data, filename, *, start_time=0, volume=DEFAULT_VOLUME, mode=None, before_options=None):
+    mode = mode or AUDIO_MODE
+    ffmpeg_executable = get_ffmpeg_executable()
+
+    # Add seeking if needed
+    if before_options is None:
+        before_options = ffmpeg_options['before_options']
+    if start_time > 0:
+        before_options += f' -ss {start_time}'
+
+    if mode == 'opus':
+        source = YTDLOpusSource(filename, data=data, volume=volume, executable=ffmpeg_executable, before_options=before_options)
+    else:
+        pcm = discord.FFmpegPCMAudio(filename, executable=ffmpeg_executable, before_options=before_options, options=ffmpeg_options['options'])
+        source = YTDLSource(pcm, data=data, volume=volume)
+    live_sources[source] = time.monotonic()
+    return source
+
+# Puts a SeekBuffer on a new source. In PCM mode it goes under the volume
+# transformer, so a volume change still applies to frames already buffered.
+def seekable(source, start_time=0):
+    if not SEEK_BUFFER_SECONDS:
+        return source
+    options = dict(start=start_time, back=SEEK_BUFFER_SECONDS, ahead=SEEK_AHEAD_SECONDS, max_bytes=int(SEEK_BUFFER_MB * 1024 * 1024))
+    if isinstance(source, discord.PCMVolumeTransformer):
+        source.original = SeekBuffer(source.original, **options)
+        return source
+    return SeekBuffer(source, **options)
+
+# The SeekBuffer under whatever is playing, if it has one
+def seek_buffer_of(source):
+    if isinstance(source, TrackChain):
+        source = source.current
+    if isinstance(source, Prebuffered):
+        source = source.source
+    if isinstance(source, discord.PCMVolumeTransformer):
+        source = source.original
+    return source if isinstance(source, SeekBuffer) else None
 
 # Helper for progress bar
 def create_progress_bar(current, total, length=20):
@@ -210,6 +510,51 @@ def format_time(seconds):
         return f"{h:02d}:{m:02d}:{s:02d}"
     return f"{m:02d}:{s:02d}"
 
+# Turns the entries of a flat extraction into queue entries, keeping the
+# title and duration it already gave us
+def flat_entry_tracks(info, requester=None):
+    tracks = []
+    for entry in info.get('entries') or []:
+        if not entry:
+            # Unavailable/private videos can come back as None
+            continue
+        if entry.get('url'):
+            url = entry['url']
+        elif entry.get('id'):
+            url = f"https://www.youtube.com/watch?v={entry['id']}"
+        else:
+            continue
+        tracks.append(Track(url, entry.get('title'), entry.get('duration'), requester))
+    return tracks
+
+# Groups an async iterator into lists of up to `size` items
+async def batched(items, size):
+    page = []
+    try:
+        async for item in items:
+            page.append(item)
+            if len(page) >= size:
+                yield page
+                page = []
+        if page:
+            yield page
+    finally:
+        await items.aclose()
+
+# View attached to the playlist import progress message
+class PlaylistImportControls(discord.ui.View):
+    def __init__(self, task, user_id):
+        super().__init__(timeout=None)
+        self.task = task
+        self.user_id = user_id  # only whoever started the import can cancel it
+
+    @discord.ui.button(label="Cancel import", style=discord.ButtonStyle.danger)
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != self.user_id:
+            return await interaction.response.send_message("🚫 Only the person who started this import can cancel it.", ephemeral=True)
+        self.task.cancel()
+        await interaction.response.defer()
+
 # View for Music Controls
 class MusicControls(discord.ui.View):
     def __init__(self, bot, guild_id, looping=False):
@@ -241,20 +586,814 @@ class MusicControls(discord.ui.View):
     async def loop_button(self, interaction: discord.Interaction, button: discord.ui.Button):
          await self.bot.get_cog("Music").toggle_loop(interaction, self, button)
 
+# Paged /queue listing, with buttons to flip through it
+class QueueView(discord.ui.View):
+    def __init__(self, music, guild_id, page=0):
+        super().__init__(timeout=300)
+        self.music = music
+        self.guild_id = guild_id
+        self.page = page
+
+    def render(self):
+        content, self.page, pages = self.music.render_queue(self.guild_id, self.page)
+        self.previous.disabled = self.page == 0
+        self.next.disabled = self.page >= pages - 1
+        return content
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+# Guild playback states, see GuildPlayer
+IDLE = 'idle'
+RESOLVING = 'resolving'
+PLAYING = 'playing'
+SEEKING = 'seeking'
+STOPPED = 'stopped'
+
+# Everything kept per guild between commands. Sessions are created on first
+# use and dropped by the reaper (Music.reap) once the guild has gone idle, so
+# guilds that used the bot once don't keep state around forever.
+class GuildSession:
+    __slots__ = ('guild_id', 'queue', 'looping', 'volume', 'imports', 'prefetches', 'track_ended_at',
+                 'resume_at', 'restore_checked', 'last_active', 'empty_since')
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.queue = SongQueue() # Tracks
+        self.looping = False
+        self.volume = DEFAULT_VOLUME # 1.0 = 100%
+        self.imports = set() # running playlist import tasks
+        self.prefetches = {} # query -> Task resolving its stream info
+        self.track_ended_at = None # perf_counter() when the last song ended
+        self.resume_at = None # (query, position) to start the restored song at
+        self.restore_checked = False # looked up its checkpoint already
+        self.last_active = time.monotonic() # last command or track change
+        self.empty_since = None # monotonic() since when nobody is listening
+
+# Playback for one guild, run by a single asyncio task. Everything that changes
+# what's playing (starting, track end, skip, seek, stop) is a command on its
+# queue and handled one at a time, in order. discord.py's audio thread only
+# posts a 'finished' command when a track ends, it never waits on anything.
+class GuildPlayer:
+    def __init__(self, music, guild_id):
+        self.music = music
+        self.guild_id = guild_id
+        self.state = IDLE
+        self.interaction = None # latest interaction, for the guild and channel to use
+        self.generation = 0 # bumped per track, so a stale 'finished' is ignored
+        self.seek_by = 0.0 # seek presses not applied yet, see seek()
+        self.pending_seek = None
+        self.reload_requested = False # next seek restarts ffmpeg even if the frames are buffered
+        self.resolving = None # Task resolving the next track
+        self.chain = None # TrackChain being played, in gapless mode
+        self.preparing = None # Task starting the next track's source ahead of time
+        self.commands = asyncio.Queue()
+        self.loop = music.bot.loop
+        self.task = self.loop.create_task(self.run())
+
+    @property
+    def idle(self):
+        return self.state in (IDLE, STOPPED)
+
+    def submit(self, command, *args):
+        future = self.loop.create_future()
+        self.commands.put_nowait((command, args, future))
+        return future
+
+    async def run(self):
+        while True:
+            command, args, future = await self.commands.get()
+            self.music.session(self.guild_id).last_active = time.monotonic()
+            try:
+                result = await getattr(self, '_' + command)(*args)
+            except Exception as e:
+                if future is None:
+                    print(f"Player {self.guild_id}: {command} failed: {e}")
+                elif not future.done():
+                    future.set_exception(e)
+            else:
+                if future is not None and not future.done():
+                    future.set_result(result)
+
+    # Starts playing the queue if nothing is playing. With `respond`, the deferred
+    # interaction is answered (Now Playing, or the errors). Returns False, without
+    # answering, if something was already playing.
+    def start(self, interaction, respond=False, note=''):
+        return self.submit('start', interaction, respond, note)
+
+    def skip(self):
+        return self.submit('skip')
+
+    # Presses that arrive while a seek is still waiting to run are added up and
+    # applied as one restart. Returns the new position (None if nothing is playing).
+    def seek(self, seconds):
+        self.seek_by += seconds
+        if self.pending_seek is None:
+            self.pending_seek = self.submit('seek')
+        return self.pending_seek
+
+    # Restarts ffmpeg where the track is, for a new volume (baked into the
+    # frames in Opus mode, so the buffered ones won't do)
+    def reload(self):
+        self.reload_requested = True
+        return self.seek(0)
+
+    def stop(self):
+        # Don't make a stop wait for an extraction that's about to be thrown away
+        if self.resolving is not None:
+            self.resolving.cancel()
+        return self.submit('stop')
+
+    def close(self):
+        if self.resolving is not None:
+            self.resolving.cancel()
+        self._cancel_prepare()
+        self.task.cancel()
+
+    # The queue was reordered: a next track prepared for gapless playback may
+    # not be the next one anymore
+    def queue_changed(self):
+        upcoming = self.chain.upcoming if self.chain is not None else None
+        if upcoming is not None and upcoming.from_queue:
+            queue = self.music.session(self.guild_id).queue
+            if not queue or queue[0].query != upcoming.query:
+                self._schedule_prepare()
+
+    # Called on the audio thread
+    def _after(self, generation):
+        def after(error):
+            ended_at = time.perf_counter()
+            try:
+                self.loop.call_soon_threadsafe(self.commands.put_nowait, ('finished', (generation, error, ended_at), None))
+            except RuntimeError:
+                # Loop already closed, shutting down
+                pass
+        return after
+
+    # Called on the audio thread when a TrackChain moves on to the prepared track
+    def _switched(self, chain, source, ended_at, gap, started_at):
+        try:
+            self.loop.call_soon_threadsafe(self.commands.put_nowait,
+                                           ('advanced', (chain, source, ended_at, gap, started_at), None))
+        except RuntimeError:
+            pass
+
+    async def _start(self, interaction, respond, note):
+        self.interaction = interaction
+        if not self.idle:
+            return False
+        await self._advance(respond=interaction if respond else None, note=note)
+        return True
+
+    async def _finished(self, generation, error, ended_at):
+        if generation != self.generation or self.state != PLAYING:
+            return
+        if error:
+            print(f"Player error: {error}")
+        self._cancel_prepare()
+        self.chain = None
+        self.music.session(self.guild_id).track_ended_at = ended_at
+
+        # Status may have been set manually (Skipped)
+        info = self.music.current_song.get(self.guild_id, {})
+        status = info.get('status', 'Finished')
+        if status == 'Playing':
+            status = 'Finished'
+        # _advance replaces (or drops) current_song before this task runs
+        self.loop.create_task(self.music.cleanup_song(self.guild_id, status, info))
+        await self._advance()
+
+    # Plays the next track (or the current one again when looping). Tracks that
+    # fail are reported and skipped until one plays or the queue is empty.
+    async def _advance(self, respond=None, note=''):
+        music = self.music
+        guild_id = self.guild_id
+        session = music.session(guild_id)
+        while True:
+            session.last_active = time.monotonic()
+            query = track = None
+            if session.looping and music.current_song.get(guild_id):
+                query = music.current_song[guild_id]['query']
+            elif session.queue:
+                track = session.queue.popleft()
+                query = track.query
+                music.mark_dirty(guild_id)
+
+            voice_client = self.interaction.guild.voice_client
+            if query is not None and not voice_client:
+                # Disconnected: keep the song (with its title etc.) for when we're back
+                if track is None:
+                    # The looping song, which only current_song still has
+                    info = music.current_song[guild_id]
+                    track = Track(query, info.get('title'), info.get('duration'))
+                session.queue.appendleft(track)
+            if query is None or not voice_client:
+                music.current_song.pop(guild_id, None)
+                music.mark_dirty(guild_id)
+                self.state = IDLE
+                if respond and query is None:
+                    await respond.followup.send("Could not find any songs.")
+                return False
+
+            # A song restored from a checkpoint picks up where it left off
+            start_time = 0
+            resume, session.resume_at = session.resume_at, None
+            if resume and resume[0] == query:
+                start_time = resume[1]
+
+            self.state = RESOLVING
+            data = music.take_prefetched(guild_id, query)
+            try:
+                player = await self._resolve(query, data, start_time)
+                if player is None:
+                    # Stopped while resolving
+                    return False
+                self.generation += 1
+                source = player
+                if GAPLESS:
+                    source = TrackChain(player, self._switched, crossfade=GAPLESS_CROSSFADE)
+                voice_client.play(source, after=self._after(self.generation))
+                self.chain = source if GAPLESS else None
+            except Exception as e:
+                print(f"Error playing {query}: {e}")
+                if session.looping:
+                    # Don't retry the same failing song forever
+                    session.looping = False
+                    msg = f"Error playing **{query}**, loop disabled. Skipping..."
+                else:
+                    msg = f"Error playing **{query}**: {e}. Skipping..."
+                music.current_song.pop(guild_id, None)
+                await self._say(respond, msg)
+                respond = None
+                continue
+
+            self.state = PLAYING
+            music.current_song[guild_id] = {
+                'query': query,
+                'title': player.title,
+                'start_timestamp': time.time(),
+                'seek_position': start_time,
+                'duration': player.duration,
+                'message': None,
+                'status': 'Playing'
+            }
+            if respond:
+                FIRST_AUDIO_SECONDS.labels('process_songs').observe(time.time() - respond.created_at.timestamp())
+            music.record_transition(guild_id, prefetched=data is not None)
+            music.schedule_prefetch(guild_id)
+            music.record_play(player)
+
+            # Audio is already playing, the message doesn't add to the gap
+            view = MusicControls(music.bot, guild_id, looping=session.looping)
+            msg_content = f'**Now playing:** {player.title}\n{create_progress_bar(start_time, player.duration)}{note}'
+            music.current_song[guild_id]['message'] = await self._say(respond, msg_content, view=view)
+            self._schedule_prepare()
+            return True
+
+    # Gapless mode: the chain already moved on to the prepared track, catch up
+    async def _advanced(self, chain, player, ended_at, gap, started_at):
+        # Stale, or a seek replaced the track right after the switch
+        if chain is not self.chain or chain.current is not player or self.state != PLAYING:
+            return
+        music = self.music
+        guild_id = self.guild_id
+        session = music.session(guild_id)
+        session.last_active = time.monotonic()
+        query = player.query
+        self.preparing = None
+
+        info = music.current_song.get(guild_id, {})
+        status = info.get('status', 'Finished')
+        if status == 'Playing':
+            status = 'Finished'
+        # current_song is replaced below, before this task runs
+        self.loop.create_task(music.cleanup_song(guild_id, status, info))
+
+        if player.from_queue and session.queue and session.queue[0].query == query:
+            session.queue.popleft()
+            music.mark_dirty(guild_id)
+        music.current_song[guild_id] = {
+            'query': query,
+            'title': player.title,
+            'start_timestamp': started_at,
+            'seek_position': 0,
+            'duration': player.duration,
+            'message': None,
+            'status': 'Playing'
+        }
+        session.track_ended_at = ended_at
+        music.record_transition(guild_id, prefetched=True, gap=gap)
+        music.schedule_prefetch(guild_id)
+        music.record_play(player)
+        self._schedule_prepare()
+
+        view = MusicControls(music.bot, guild_id, looping=session.looping)
+        msg_content = f'**Now playing:** {player.title}\n{create_progress_bar(0, player.duration)}'
+        music.current_song[guild_id]['message'] = await self._say(None, msg_content, view=view)
+
+    # Starts preparing the next track GAPLESS_LEAD seconds before this one ends
+    def _schedule_prepare(self):
+        self._cancel_prepare()
+        info = self.music.current_song.get(self.guild_id)
+        if self.chain is None or not info or not info.get('duration'):
+            return
+        remaining = info['duration'] - info['seek_position'] - (time.time() - info['start_timestamp'])
+        self.chain.set_remaining(remaining)
+        self.preparing = self.loop.create_task(self._prepare(self.chain, max(0.0, remaining - GAPLESS_LEAD)))
+
+    def _cancel_prepare(self):
+        if self.preparing is not None:
+            self.preparing.cancel()
+            self.preparing = None
+        if self.chain is not None:
+            self.chain.set_next(None)
+
+    async def _prepare(self, chain, delay):
+        await asyncio.sleep(delay)
+        music = self.music
+        guild_id = self.guild_id
+        session = music.session(guild_id)
+        while True:
+            if session.looping and music.current_song.get(guild_id):
+                query, from_queue = music.current_song[guild_id]['query'], False
+                break
+            if session.queue:
+                query, from_queue = session.queue[0].query, True
+                break
+            # Nothing to go on to yet, keep an eye out until the track ends
+            await asyncio.sleep(1)
+
+        try:
+            player = await YTDLSource.from_url(
+                query, loop=self.loop, stream=True, data=music.take_prefetched(guild_id, query),
+                volume=session.volume, guild_id=guild_id, priority=BACKGROUND)
+        except Exception as e:
+            # _advance will try again, and report it, when the track ends
+            print(f"Could not prepare {query}: {e}")
+            return
+        source = Prebuffered(player)
+        try:
+            await self.loop.run_in_executor(None, source.fill, GAPLESS_BUFFER_FRAMES)
+        except BaseException:
+            source.cleanup()
+            raise
+        if chain is not self.chain:
+            source.cleanup()
+            return
+        source.query = query
+        source.from_queue = from_queue
+        chain.set_next(source)
+
+    async def _resolve(self, query, data, start_time):
+        self.resolving = self.loop.create_task(YTDLSource.from_url(
+            query, loop=self.loop, stream=True, data=data, start_time=start_time,
+            volume=self.music.session(self.guild_id).volume, guild_id=self.guild_id))
+        try:
+            await asyncio.wait([self.resolving])
+        finally:
+            task, self.resolving = self.resolving, None
+        if task.cancelled():
+            return None
+        return task.result()
+
+    # Answers the interaction if there is one to answer, else posts in the channel
+    async def _say(self, respond, content, view=None):
+        try:
+            if respond:
+                return await respond.followup.send(content, view=view)
+            return await self.interaction.channel.send(content, view=view)
+        except discord.HTTPException as e:
+            print(f"Failed to send message in {self.guild_id}: {e}")
+            return None
+
+    async def _skip(self):
+        voice_client = self.interaction.guild.voice_client if self.interaction else None
+        if self.state != PLAYING or not voice_client:
+            return False
+        info = self.music.current_song.get(self.guild_id)
+        if info:
+            info['status'] = 'Skipped'
+        if self.chain is not None and self.chain.skip():
+            # Moves straight on to the prepared track, which comes back as 'advanced'
+            return True
+        # Ends the track, which comes back to us as 'finished'
+        voice_client.stop()
+        return True
+
+    async def _seek(self):
+        seconds, self.seek_by = self.seek_by, 0.0
+        reload, self.reload_requested = self.reload_requested, False
+        self.pending_seek = None
+        info = self.music.current_song.get(self.guild_id)
+        voice_client = self.interaction.guild.voice_client if self.interaction else None
+        if self.state != PLAYING or not info or not voice_client:
+            return None
+
+        position = info['seek_position'] + (time.time() - info['start_timestamp'])
+        new_position = max(0, position + seconds)
+        if not reload and self._seek_buffered(voice_client, info, new_position):
+            SEEKS.labels('buffer').inc()
+        else:
+            SEEKS.labels('restart').inc()
+            self.state = SEEKING
+            voice_client.pause()
+            try:
+                await self._restart(voice_client, info, new_position)
+            finally:
+                voice_client.resume()
+                self.state = PLAYING
+
+        # Show the new position right away instead of on the next progress tick
+        message = info.get('message')
+        if message:
+            content = f"**Now playing:** {info['title']}\n{create_progress_bar(new_position, info.get('duration'))}"
+            self.loop.create_task(quietly(message.edit(content=content)))
+        return new_position
+
+    # Seeks within the frames the playing track has buffered, if `position` is
+    # among them. Nothing is paused or spawned.
+    def _seek_buffered(self, voice_client, info, position):
+        buffer = seek_buffer_of(voice_client.source)
+        if buffer is None or not buffer.seek(position):
+            return False
+        current = self.chain.current if self.chain is not None else voice_client.source
+        if isinstance(current, Prebuffered):
+            # Frames it read ahead for the start of the track
+            current.buffer.clear()
+            current.ended = False
+        self._moved(info, position)
+        if self.chain is not None:
+            self._schedule_prepare()
+        return True
+
+    def _moved(self, info, position):
+        info['start_timestamp'] = time.time()
+        info['seek_position'] = position
+        self.music.mark_dirty(self.guild_id)
+
+    # Replaces the playing source with a fresh one at `position`, picking up the
+    # guild's current volume. The stream info is cached, so this is mostly the
+    # cost of spawning ffmpeg.
+    async def _restart(self, voice_client, info, position):
+        player = await YTDLSource.from_url(info['query'], loop=self.loop, stream=True, start_time=position,
+                                           volume=self.music.session(self.guild_id).volume, guild_id=self.guild_id)
+        self._moved(info, position)
+
+        if self.chain is not None:
+            # The prepared track was lined up for the old position
+            self.chain.replace_current(player)
+            self._schedule_prepare()
+            return
+
+        # Swap source, and kill the old ffmpeg now rather than whenever it gets GC'd
+        old_source = voice_client.source
+        voice_client.source = player
+        if old_source is not None:
+            old_source.cleanup()
+
+    async def _stop(self):
+        music = self.music
+        guild_id = self.guild_id
+        session = music.session(guild_id)
+        session.queue.clear()
+        music.cancel_prefetch(guild_id)
+        music.cancel_imports(guild_id)
+        session.resume_at = None
+        music.mark_dirty(guild_id)
+
+        self.state = STOPPED
+        self.generation += 1 # the track's 'finished' is ours to handle, ignore it
+        self._cancel_prepare()
+        self.chain = None
+        if guild_id in music.current_song:
+            music.current_song[guild_id]['status'] = 'Stopped'
+            await music.cleanup_song(guild_id, 'Stopped')
+            music.current_song.pop(guild_id, None)
+
+        voice_client = self.interaction.guild.voice_client if self.interaction else None
+        if voice_client:
+            voice_client.stop()
+            await voice_client.disconnect()
+
+# Awaits a coroutine, ignoring Discord errors (for fire-and-forget edits)
+async def quietly(coro):
+    try:
+        await coro
+    except discord.HTTPException:
+        pass
+
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.queues = collections.defaultdict(list) # guild_id -> list of song queries/urls
+        self.sessions = {} # guild_id -> GuildSession
         self.current_song = {} # guild_id -> {url, title, start_timestamp, current_position, duration, message}
-        self.voice_states = {} # guild_id -> bool (is_playing)
-        self.looping = {} # guild_id -> bool
+        self.players = {} # guild_id -> GuildPlayer
+        self.progress = ProgressScheduler(on_gone=self.forget_message)
+        self.transition_gaps = collections.deque(maxlen=200) # (seconds, was_prefetched)
+        self.dirty = set() # guild_ids whose checkpoint is out of date
         self.update_progress.start()
+        self.checkpoint_loop.start()
+        self.reap.start()
+        self.pinning = set() # playlist entries being resolved right now
+        self.unpinnable = set() # entries that are playlists themselves
+        self.pin_failures = {} # entry -> (failures in a row, monotonic time to retry at)
+        self.title_index_saved = time.monotonic()
+        self.pin_slots = asyncio.Semaphore(PIN_CONCURRENCY)
+        if not SHARD_IDS or 0 in SHARD_IDS:
+            # One worker is enough to go over everyone's playlists
+            self.pin_loop.start()
 
     def cog_unload(self):
         self.update_progress.cancel()
+        self.progress.close()
+        self.checkpoint_loop.cancel()
+        self.reap.cancel()
+        self.pin_loop.cancel()
+        for player in self.players.values():
+            player.close()
+
+    def session(self, guild_id):
+        session = self.sessions.get(guild_id)
+        if session is None:
+            session = self.sessions[guild_id] = GuildSession(guild_id)
+        return session
+
+    def player(self, guild_id):
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(self, guild_id)
+        return player
+
+    # Checkpoints: state changes only mark the guild dirty, and checkpoint_loop
+    # writes everything that changed (plus positions of playing guilds) in one
+    # batch every CHECKPOINT_INTERVAL seconds
+    def mark_dirty(self, guild_id):
+        self.dirty.add(guild_id)
+
+    def snapshot(self, guild_id):
+        info = self.current_song.get(guild_id)
+        playing = info is not None and info.get('status') == 'Playing'
+        session = self.sessions.get(guild_id)
+        queue = [track.dump() for track in session.queue] if session else []
+        if not playing and not queue:
+            return None
+
+        checkpoint = {
+            'queue': queue,
+            'current': None,
+            'position': 0,
+            'looping': session.looping if session else False,
+            'volume': session.volume if session else DEFAULT_VOLUME,
+            'saved_at': time.time(),
+        }
+        if playing:
+            checkpoint['current'] = info['query']
+            checkpoint['position'] = info['seek_position'] + (time.time() - info['start_timestamp'])
+        return checkpoint
+
+    @tasks.loop(seconds=CHECKPOINT_INTERVAL)
+    async def checkpoint_loop(self):
+        await self.checkpoint_now()
+
+    async def checkpoint_now(self, all_guilds=False):
+        guild_ids = set(self.dirty)
+        guild_ids.update(g for g, info in self.current_song.items() if info.get('status') == 'Playing')
+        if all_guilds:
+            guild_ids.update(self.sessions)
+        self.dirty.clear()
+        await self.save_title_index(force=all_guilds)
+        if not guild_ids:
+            return
+
+        batch = {guild_id: self.snapshot(guild_id) for guild_id in guild_ids}
+        try:
+            await checkpoint_store.save_many(batch)
+        except Exception as e:
+            print(f"Failed to save checkpoints: {e}")
+            self.dirty.update(guild_ids)
+
+    async def save_title_index(self, force=False):
+        if not title_index.dirty or (not force and time.monotonic() - self.title_index_saved < TITLE_INDEX_SAVE_INTERVAL):
+            return
+        self.title_index_saved = time.monotonic()
+        try:
+            await meta_store.set(TITLE_INDEX_KEY, title_index.dump())
+        except Exception as e:
+            title_index.dirty = True
+            print(f"Failed to save the title index: {e}")
+
+    # Titles from before the restart, plus every pinned playlist entry
+    async def load_title_index(self):
+        try:
+            title_index.load(await meta_store.get(TITLE_INDEX_KEY) or [])
+            for pin in (await pin_store.load_all()).values():
+                title_index.add(pin['video_id'], pin['title'], plays=0)
+        except Exception as e:
+            print(f"Failed to load the title index: {e}")
+        print(f"Title index: {len(title_index)} titles")
+
+    @tasks.loop(seconds=REAP_INTERVAL)
+    async def reap(self):
+        now = time.monotonic()
+        connected = set()
+        for voice_client in list(self.bot.voice_clients):
+            guild_id = voice_client.guild.id
+            connected.add(guild_id)
+            session = self.session(guild_id)
+            if any(not member.bot for member in voice_client.channel.members):
+                session.empty_since = None
+            elif session.empty_since is None:
+                session.empty_since = now
+
+            if session.empty_since is not None and now - session.empty_since >= EMPTY_DISCONNECT:
+                reason = "nobody is listening"
+            elif not voice_client.is_playing() and now - session.last_active >= IDLE_DISCONNECT:
+                reason = "nothing is playing"
+            else:
+                continue
+            try:
+                await self.leave(guild_id, voice_client, reason)
+            except Exception as e:
+                print(f"Failed to leave voice in {guild_id}: {e}")
+
+        # State of guilds that aren't in voice and haven't done anything in a while
+        for guild_id, session in list(self.sessions.items()):
+            player = self.players.get(guild_id)
+            if (guild_id not in connected and guild_id not in self.dirty and not session.imports
+                    and (player is None or player.idle) and now - session.last_active >= IDLE_DISCONNECT):
+                self.forget(guild_id)
+
+        killed = self.kill_orphans(now)
+        if killed:
+            print(f"Killed {killed} orphaned ffmpeg processes")
+
+    # Disconnects, keeping the queue (and where the song was) in the checkpoint
+    async def leave(self, guild_id, voice_client, reason):
+        checkpoint = self.snapshot(guild_id)
+        player = self.players.get(guild_id)
+        if player is not None:
+            await player.stop()
+            if player.interaction is not None:
+                note = " Use /play to pick the queue back up." if checkpoint else ""
+                await quietly(player.interaction.channel.send(f"👋 Left the voice channel, {reason}.{note}"))
+        if voice_client.is_connected():
+            await voice_client.disconnect()
+        self.dirty.discard(guild_id)
+        try:
+            await checkpoint_store.save_many({guild_id: checkpoint})
+        except Exception as e:
+            print(f"Failed to save checkpoint for {guild_id}: {e}")
+        self.forget(guild_id)
+        print(f"Left voice in {guild_id}: {reason}")
+
+    # Drops everything kept for the guild; it's rebuilt (and restored from its
+    # checkpoint) the next time the guild uses the bot
+    def forget(self, guild_id):
+        player = self.players.pop(guild_id, None)
+        if player is not None:
+            player.close()
+        self.cancel_prefetch(guild_id)
+        self.cancel_imports(guild_id)
+        self.sessions.pop(guild_id, None)
+        self.current_song.pop(guild_id, None)
+
+    # ffmpeg processes of sources that no voice client plays and that aren't
+    # new enough to be on their way to one (resolving, seeking, prepared)
+    def kill_orphans(self, now):
+        in_use = set()
+        for voice_client in self.bot.voice_clients:
+            source = voice_client.source
+            if isinstance(source, TrackChain) and source.upcoming is not None:
+                in_use.add(unwrap(source.upcoming))
+            in_use.add(unwrap(source))
+        killed = 0
+        for source, created in list(live_sources.items()):
+            if source not in in_use and now - created > REAP_INTERVAL and ffmpeg_alive(source):
+                source.cleanup()
+                killed += 1
+        return killed
+
+    # Lazily brings back a guild's queue after a restart, the first time someone
+    # uses /play or /join there. Returns True if there is something to play.
+    async def restore_guild(self, guild_id):
+        session = self.session(guild_id)
+        if session.restore_checked:
+            return False
+        session.restore_checked = True
+        if session.queue or guild_id in self.current_song:
+            return False
+
+        try:
+            checkpoint = await checkpoint_store.load(guild_id)
+        except Exception as e:
+            print(f"Failed to load checkpoint for {guild_id}: {e}")
+            return False
+        if not checkpoint:
+            return False
+
+        queue = [Track.load(value) for value in checkpoint.get('queue', [])]
+        if checkpoint.get('current'):
+            queue.insert(0, Track(checkpoint['current']))
+            session.resume_at = (checkpoint['current'], checkpoint.get('position', 0))
+        session.queue.extend(queue)
+        session.looping = checkpoint.get('looping', False)
+        session.volume = checkpoint.get('volume', DEFAULT_VOLUME)
+        return bool(queue)
+
+    @tasks.loop(hours=PIN_INTERVAL)
+    async def pin_loop(self):
+        try:
+            data = await playlist_store.load_all()
+            songs = [song for playlists in data.values() for entries in playlists.values() for song in entries]
+            await self.pin_songs(songs, limit=PIN_BATCH)
+        except Exception as e:
+            print(f"Playlist pinning failed: {e}")
+
+    # Keeps the pass (a load_all and up to PIN_BATCH extractions) out of the
+    # way of a cold start
+    @pin_loop.before_loop
+    async def before_pin_loop(self):
+        await self.bot.wait_until_ready()
+        await asyncio.sleep(PIN_DELAY)
+
+    def backing_off(self, song):
+        failure = self.pin_failures.get(song)
+        return failure is not None and failure[1] > time.monotonic()
+
+    # Resolves saved playlist entries that aren't pinned to a video yet, a few
+    # at a time on the background extraction lane. Returns how many were pinned.
+    async def pin_songs(self, songs, limit=None):
+        try:
+            pins = await pin_store.get_many(set(songs))
+        except Exception as e:
+            print(f"Could not load playlist pins: {e}")
+            return 0
+        todo = [song for song in dict.fromkeys(songs) if song not in pins and song not in self.pinning
+                and song not in self.unpinnable and not self.backing_off(song)][:limit]
+        if not todo:
+            return 0
+        self.pinning.update(todo)
+        try:
+            results = await asyncio.gather(*(self.pin_song(song) for song in todo))
+        finally:
+            self.pinning.difference_update(todo)
+        found = {song: pin for song, pin in zip(todo, results) if pin}
+        for song, pin in zip(todo, results):
+            if pin:
+                self.pin_failures.pop(song, None)
+            elif song not in self.unpinnable:
+                failures = self.pin_failures.get(song, (0, 0))[0] + 1
+                hours = min(PIN_RETRY_MAX, PIN_INTERVAL * 2 ** (failures - 1))
+                self.pin_failures[song] = (failures, time.monotonic() + hours * 3600)
+        for pin in found.values():
+            title_index.add(pin['video_id'], pin['title'])
+        try:
+            await pin_store.put_many(found)
+        except Exception as e:
+            print(f"Could not save playlist pins: {e}")
+            return 0
+        print(f"Pinned {len(found)}/{len(todo)} playlist entries")
+        return len(found)
+
+    # {'video_id', 'title', 'duration'} for one entry, or None (failed, or a playlist link)
+    async def pin_song(self, song):
+        async with self.pin_slots:
+            try:
+                query = await spotify.resolve_track(song)
+                is_search = not query.startswith(('http://', 'https://'))
+                if is_search and not query.startswith('ytsearch'):
+                    query = f'ytsearch1:{query}'
+                info = await extractor.extract(query, profile='flat', priority=BACKGROUND)
+            except Exception as e:
+                print(f"Could not pin {song}: {e}")
+                return None
+        if 'entries' in info:
+            if not is_search:
+                # A playlist saved as one entry stays a playlist
+                self.unpinnable.add(song)
+                return None
+            info = next((entry for entry in info['entries'] if entry), None) or {}
+        video_id = youtube_id(info.get('webpage_url') or info.get('url')) or youtube_id(query)
+        if not video_id:
+            return None
+        return {'video_id': video_id, 'title': info.get('title'), 'duration': info.get('duration')}
 
     @tasks.loop(seconds=1.0)
     async def update_progress(self):
+        # Render every playing guild and let the scheduler decide which edits
+        # actually go out (changed content, due for its cadence, not rate limited).
+        # Edits run concurrently, so one slow channel doesn't hold up the rest.
+        self.progress.tick(self.render_progress())
+
+    def render_progress(self):
+        now = time.time()
         # We use a copy of items to avoid runtime errors if dictionary changes during iteration
         for guild_id, info in list(self.current_song.items()):
             message = info.get('message')
@@ -265,36 +1404,103 @@ class Music(commands.Cog):
             # The cleanup_song method handles the final update.
             if info.get('status') != 'Playing':
                 continue
-                
-            try:
-                # Calculate current position
-                now = time.time()
-                elapsed = now - info['start_timestamp']
-                current_position = info['seek_position'] + elapsed
-                
-                # Check if song is basically over
-                if current_position > info.get('duration', 0) + 2:
-                    continue
 
-                msg_content = f"**Now playing:** {info['title']}\n{create_progress_bar(current_position, info.get('duration'))}"
-                
-                # Only edit if content changed significantly (usually every second it does)
-                # We put a try/except specifically for the edit to catch rate limits
-                await message.edit(content=msg_content)
-            except discord.NotFound:
-                # Message deleted, remove it from tracking so we don't spam errors
-                info['message'] = None
-            except Exception as e:
-                # Keep quiet largely to avoid console spam on rate limits
-                pass
+            # Calculate current position
+            elapsed = now - info['start_timestamp']
+            current_position = info['seek_position'] + elapsed
+            
+            # Check if song is basically over
+            duration = info.get('duration') or 0
+            if current_position > duration + 2:
+                continue
+
+            msg_content = f"**Now playing:** {info['title']}\n{create_progress_bar(current_position, duration)}"
+            yield guild_id, message, msg_content, duration
+
+    def forget_message(self, guild_id):
+        # Message deleted, remove it from tracking so we don't spam errors
+        info = self.current_song.get(guild_id)
+        if info:
+            info['message'] = None
 
     def get_queue(self, guild_id):
-        return self.queues[guild_id]
+        return self.session(guild_id).queue
+
+    # Resolve the head of the queue in the background so the next track change
+    # doesn't wait on yt-dlp. Safe to call whenever the queue may have changed:
+    # prefetches for songs that are no longer up next are thrown away.
+    def schedule_prefetch(self, guild_id):
+        session = self.session(guild_id)
+        wanted = [track.query for track in session.queue.head(PREFETCH_DEPTH)]
+        pending = session.prefetches
+
+        for query in list(pending):
+            if query not in wanted:
+                pending.pop(query).cancel()
+
+        for query in wanted:
+            if query not in pending:
+                pending[query] = self.bot.loop.create_task(self._prefetch(guild_id, query))
+
+    async def _prefetch(self, guild_id, query):
+        if disk_cache and disk_cache.has(youtube_id(query)):
+            # Will play from disk, nothing to resolve
+            return None
+        try:
+            return await extract_stream_info(await spotify.resolve_track(query), guild_id=guild_id, priority=BACKGROUND)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Prefetch failed for {query}: {e}")
+            return None
+
+    def cancel_prefetch(self, guild_id):
+        session = self.sessions.get(guild_id)
+        if session is not None:
+            for task in session.prefetches.values():
+                task.cancel()
+            session.prefetches.clear()
+
+    # Returns prefetched stream info for query, or None if it isn't ready yet
+    # or its signed URL is too close to expiry to start playing from
+    def take_prefetched(self, guild_id, query):
+        task = self.session(guild_id).prefetches.pop(query, None)
+        if task is None or not task.done() or task.cancelled():
+            # If it's still running, from_url will join the same in-flight extraction
+            return None
+        data = task.result()
+        if data is None:
+            return None
+        expire = stream_expires_at(data)
+        if expire is not None and expire - time.time() < STREAM_EXPIRY_MARGIN:
+            return None
+        return data
+
+    # `gap` is given when it was measured where the audio switched (gapless mode)
+    def record_transition(self, guild_id, prefetched, gap=None):
+        session = self.session(guild_id)
+        ended_at, session.track_ended_at = session.track_ended_at, None
+        if ended_at is None:
+            return
+        if gap is None:
+            gap = time.perf_counter() - ended_at
+        self.transition_gaps.append((gap, prefetched))
+        FIRST_AUDIO_SECONDS.labels('next_track').observe(gap)
+        print(f"Time to next audio in {guild_id}: {gap * 1000:.0f} ms ({'prefetched' if prefetched else 'cold'})")
+
+    # Counts towards the track's admission to the disk cache
+    def record_play(self, player):
+        title_index.add(youtube_id(player.data.get('webpage_url')), player.title)
+        if disk_cache:
+            disk_cache.record_play(youtube_id(player.data.get('webpage_url')), player.data)
 
     # Helper to clean up the message of the ending song
-    async def cleanup_song(self, guild_id, status="Finished"):
-        if guild_id in self.current_song:
-            info = self.current_song[guild_id]
+    # `info` is the song's current_song entry; pass it when the song may have
+    # been replaced (or dropped) by the time this runs
+    async def cleanup_song(self, guild_id, status="Finished", info=None):
+        if info is None:
+            info = self.current_song.get(guild_id)
+        if info:
             message = info.get('message')
             if message:
                 try:
@@ -316,89 +1522,19 @@ class Music(commands.Cog):
                 except:
                     pass
 
-    async def play_next(self, interaction):
-        guild_id = interaction.guild_id
-        
-        # Decide what to play next
-        query = None
-        
-        # Check loop first
-        if self.looping.get(guild_id) and self.current_song.get(guild_id):
-             query = self.current_song[guild_id]['query']
-        elif self.queues[guild_id]:
-            query = self.queues[guild_id].pop(0)
-            
-        if query:
-            try:
-                # We need to recreate the player logic here without the interaction response context
-                # because this is a callback
-                voice_client = interaction.guild.voice_client
-                if not voice_client:
-                    return
-
-                # Prepare player
-                player = await YTDLSource.from_url(query, loop=self.bot.loop, stream=True)
-                
-                # Send a message to the channel
-                view = MusicControls(self.bot, guild_id, looping=self.looping.get(guild_id, False))
-                msg_content = f'**Now playing:** {player.title}\n{create_progress_bar(0, player.duration)}'
-                message = await interaction.channel.send(msg_content, view=view)
-
-                # Update current song info
-                self.current_song[guild_id] = {
-                    'query': query,
-                    'title': player.title,
-                    'start_timestamp': time.time(),
-                    'seek_position': 0,
-                    'duration': player.duration,
-                    'message': message,
-                    'status': 'Playing'
-                }
-
-                # Define the after callback recursively
-                def after_playing(error):
-                    if error:
-                        print(f"Player error: {error}")
-                    
-                    # Cleanup old song first
-                    # We check if status was manually set (e.g. Skipped/Stopped)
-                    current_status = self.current_song[guild_id].get('status', 'Finished')
-                    if current_status == 'Playing':
-                        current_status = 'Finished'
-                    
-                    coro_cleanup = self.cleanup_song(guild_id, current_status)
-                    asyncio.run_coroutine_threadsafe(coro_cleanup, self.bot.loop)
-
-                    # If stopped, don't play next
-                    if current_status == "Stopped":
-                        return
-
-                    # Schedule play_next on the loop
-                    coro = self.play_next(interaction)
-                    fut = asyncio.run_coroutine_threadsafe(coro, self.bot.loop)
-                    try:
-                        fut.result()
-                    except:
-                        pass
-
-                voice_client.play(player, after=after_playing)
-                
-            except Exception as e:
-                print(f"Error in play_next: {e}")
-                # If we fail to play a song, we should try the next one
-                # But if we are looping, we might get stuck in an infinite loop of failures
-                # So we should probably disable loop if it fails
-                if self.looping.get(guild_id):
-                     self.looping[guild_id] = False
-                     await interaction.channel.send(f"Error playing **{query}**, loop disabled. Skipping...")
-                else:
-                     await interaction.channel.send(f"Error playing **{query}**: {e}. Skipping...")
-                
-                # Recursive call to skip to next
-                await self.play_next(interaction)
-        else:
-            self.current_song.pop(guild_id, None)
-            # await interaction.channel.send("Queue finished.") # Reduced spam
+    # Storage errors in the playlist commands get an answer instead of leaving
+    # the interaction hanging (the store has already logged them)
+    async def cog_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        original = getattr(error, 'original', error)
+        if not isinstance(original, PlaylistsUnavailable):
+            raise error
+        try:
+            if interaction.response.is_done():
+                await interaction.followup.send(str(original), ephemeral=True)
+            else:
+                await interaction.response.send_message(str(original), ephemeral=True)
+        except discord.HTTPException as e:
+            print(f"Failed to report a playlist error in {interaction.guild_id}: {e}")
 
     def check_channel(self, interaction: discord.Interaction) -> bool:
         return interaction.channel.name == "ჭაჭing"
@@ -416,6 +1552,11 @@ class Music(commands.Cog):
             else:
                 await channel.connect()
                 await interaction.response.send_message(f"Joined {channel.name}")
+
+            # Pick up a queue that was saved before the last restart
+            if await self.restore_guild(interaction.guild_id):
+                await interaction.channel.send("Resuming the queue from before the restart.")
+                await self.player(interaction.guild_id).start(interaction)
         else:
             await interaction.response.send_message("You are not connected to a voice channel.", ephemeral=True)
 
@@ -433,17 +1574,37 @@ class Music(commands.Cog):
         
         await interaction.response.defer()
 
+        # Pick up a queue that was saved before the last restart, then add to it
+        if await self.restore_guild(interaction.guild_id):
+            await self.player(interaction.guild_id).start(interaction)
+
         # Resolve query (Playlist vs Single)
         songs_to_add = []
         is_playlist = False
         
+        # Spotify albums/playlists: start on the first track, stream in the rest
+        if spotify.is_collection(query):
+            return await self.play_spotify_collection(interaction, query)
+
         # Pre-resolve if it's a spotify track to avoid yt-dlp DRM error on initial check
-        query = await resolve_spotify_track(query)
+        query = await spotify.resolve_track(query)
         
+        more_from = None
+        # Video links (e.g. picked from autocomplete) and repeat searches need no
+        # lookup; the title index and the search cache know their titles
+        if youtube_id(query) and 'list=' not in query:
+            hit = {'url': query, 'title': title_index.title(youtube_id(query)), 'duration': None}
+        else:
+            hit = await cached_search(query)
         try:
-            # Quick extraction to resolve types/entries
-            with yt_dlp.YoutubeDL({'extract_flat': True, 'quiet': True, 'noplaylist': False, 'default_search': 'auto'}) as ydl:
-                 info = await self.bot.loop.run_in_executor(None, lambda: ydl.extract_info(query, download=False))
+            if hit:
+                # Searched before: no need to ask YouTube again
+                info = {'webpage_url': hit['url'], 'title': hit['title'], 'duration': hit['duration']}
+            else:
+                # Quick extraction to resolve types/entries. Only the first page of a
+                # playlist is listed here, the rest is streamed in by import_playlist.
+                info = await extractor.extract(query, profile='flat', guild_id=interaction.guild_id, priority=INTERACTIVE,
+                                               playlist_items=f'1-{PLAYLIST_PAGE_SIZE}')
             
             if 'entries' in info:
                 # It's a playlist or a search result with multiple items
@@ -453,109 +1614,151 @@ class Music(commands.Cog):
                 
                 is_playlist = info.get('_type') == 'playlist' and 'http' in query # Simple heuristic
                 
-                for entry in info['entries']:
-                    if entry.get('url'):
-                        songs_to_add.append(entry['url'])
-                    elif entry.get('id'):
-                         songs_to_add.append(f"https://www.youtube.com/watch?v={entry['id']}")
+                songs_to_add = flat_entry_tracks(info, requester=interaction.user.id)
+                first = next((entry for entry in info['entries'] if entry), None)
+                if first and songs_to_add and not is_playlist:
+                    remember_search(search_key(query), dict(first, url=songs_to_add[0].query))
+                if is_playlist and len(info['entries']) >= PLAYLIST_PAGE_SIZE and PLAYLIST_PAGE_SIZE < PLAYLIST_MAX_ITEMS:
+                    more_from = PLAYLIST_PAGE_SIZE + 1
             else:
                 # Single item
-                songs_to_add.append(info.get('webpage_url') or info.get('url') or query)
+                songs_to_add.append(Track(info.get('webpage_url') or info.get('url') or query, info.get('title'),
+                                          info.get('duration'), interaction.user.id))
+                if hit is None:
+                    remember_search(search_key(query), info)
+        except ExtractionQueueFull as e:
+            return await interaction.followup.send(str(e))
         except Exception:
             # Fallback
-            songs_to_add = [query]
+            songs_to_add = [Track(query, requester=interaction.user.id)]
 
+        first_page = len(songs_to_add)
         await self.process_songs(interaction, songs_to_add)
 
-    # Helper to process a list of songs (queue/play)
-    async def process_songs(self, interaction, songs_to_add):
-        guild_id = interaction.guild_id
-        voice_client = interaction.guild.voice_client
-        
-        if not songs_to_add:
-            return await interaction.followup.send("Could not find any songs.")
+        if more_from:
+            self.start_import(interaction, self.playlist_pages(interaction.guild_id, query, more_from), first_page)
 
-        # Lock to ensure we don't race on 'is_playing' check
-        # We need a per-guild lock really, but global is fine for small bot
-        # Or just checking our own state flag
-        
-        is_playing = voice_client.is_playing() or voice_client.is_paused()
-        
-        # Check our internal flag too in case ffmpeg hasn't started yet
-        if self.voice_states.get(guild_id):
-             is_playing = True
-             
-        play_now = None
-        queued_count = 0
-        
-        if not is_playing and not self.queues[guild_id]:
-             play_now = songs_to_add.pop(0)
+    # Runs on every keystroke, so it only looks at the in-memory index
+    @play.autocomplete('query')
+    async def play_autocomplete(self, interaction: discord.Interaction, current: str):
+        if not self.check_channel(interaction):
+            return []
+        return [app_commands.Choice(name=title[:100], value=f"https://www.youtube.com/watch?v={video_id}")
+                for video_id, title in title_index.search(current)]
 
-        # Queue the rest
-        self.queues[guild_id].extend(songs_to_add)
-        queued_count = len(songs_to_add)
+    async def play_spotify_collection(self, interaction, query):
+        tracks = spotify.expand(query)
+        first = None
+        try:
+            first = await tracks.__anext__()
+        except StopAsyncIteration:
+            pass
+        except Exception as e:
+            print(f"Failed to expand Spotify link: {e}")
 
-        # Responses
-        if play_now:
-            self.voice_states[guild_id] = True # Mark as "busty starting"
-            try:
-                player = await YTDLSource.from_url(play_now, loop=self.bot.loop, stream=True)
-                
-                view = MusicControls(self.bot, guild_id, looping=self.looping.get(guild_id, False))
-                msg_content = f'**Now playing:** {player.title}\n{create_progress_bar(0, player.duration)}'
-                if queued_count > 0:
-                     msg_content += f"\n*(+ {queued_count} more songs added to queue)*"
-                
-                message = await interaction.followup.send(msg_content, view=view)
-
-                self.current_song[guild_id] = {
-                    'query': play_now,
-                    'title': player.title,
-                    'start_timestamp': time.time(),
-                    'seek_position': 0,
-                    'duration': player.duration,
-                    'message': message,
-                    'status': 'Playing'
-                }
-
-                def after_playing(error):
-                    self.voice_states[guild_id] = False # Reset busy flag (will be set again in play_next if playing)
-                    if error:
-                        print(f"Player error: {error}")
-                    
-                    # Cleanup old song first
-                    current_status = self.current_song[guild_id].get('status', 'Finished')
-                    if current_status == 'Playing':
-                        current_status = 'Finished'
-                    
-                    coro_cleanup = self.cleanup_song(guild_id, current_status)
-                    asyncio.run_coroutine_threadsafe(coro_cleanup, self.bot.loop)
+        if first is None:
+            await tracks.aclose()
+            return await interaction.followup.send("Could not find any songs on that Spotify page.")
 
-                    if current_status == "Stopped":
-                        return
+        await self.process_songs(interaction, [Track(first, requester=interaction.user.id)])
+        self.start_import(interaction, batched(tracks, 10), 1)
 
-                    coro = self.play_next(interaction)
-                    fut = asyncio.run_coroutine_threadsafe(coro, self.bot.loop)
-                    try:
-                        fut.result()
-                    except:
-                        pass
+    def start_import(self, interaction, pages, already_queued):
+        guild_id = interaction.guild_id
+        task = self.bot.loop.create_task(self.import_pages(interaction, pages, already_queued))
+        imports = self.session(guild_id).imports
+        imports.add(task)
+        task.add_done_callback(imports.discard)
+
+    def cancel_imports(self, guild_id):
+        session = self.sessions.get(guild_id)
+        if session is not None:
+            for task in list(session.imports):
+                task.cancel()
+
+    # The rest of a YouTube playlist, one page of urls at a time, listed in a
+    # single walk on the background extraction lane
+    async def playlist_pages(self, guild_id, query, start):
+        pages = extractor.playlist_pages(query, start, PLAYLIST_MAX_ITEMS - start + 1, PLAYLIST_PAGE_SIZE,
+                                         guild_id=guild_id, priority=BACKGROUND)
+        try:
+            async for entries in pages:
+                yield flat_entry_tracks({'entries': entries})
+        finally:
+            await pages.aclose()
+
+    # Streams pages of songs into the queue as they arrive, reporting progress
+    # on a single message
+    async def import_pages(self, interaction, pages, already_queued):
+        guild_id = interaction.guild_id
+        imported = already_queued
+        status = "done"
+        message = None
 
-                voice_client.play(player, after=after_playing)
-            except Exception as e:
-                self.voice_states[guild_id] = False
-                import traceback
-                traceback.print_exc()
-                await interaction.followup.send(f"An error occurred: {e}")
-                # Try to play next if this failed but we added stuff to queue
-                if queued_count > 0:
-                     await self.play_next(interaction)
-        else:
-            # We just queued everything
-            msg = f"Added **{queued_count}** songs to queue."
-            if queued_count == 1:
-                 msg = f"Added to queue: **{songs_to_add[0]}**" # Might be raw url
-            await interaction.followup.send(msg)
+        async def report(content, view=None):
+            if message:
+                try:
+                    await message.edit(content=content, view=view)
+                except discord.HTTPException:
+                    # Interaction tokens expire after 15 minutes, just keep importing
+                    pass
+
+        try:
+            view = PlaylistImportControls(asyncio.current_task(), interaction.user.id)
+            message = await interaction.followup.send(f"📥 Importing playlist... **{imported}** songs queued so far.", view=view)
+
+            async for songs in pages:
+                songs = songs[:PLAYLIST_MAX_ITEMS - imported]
+                self.session(guild_id).queue.extend(songs)
+                self.mark_dirty(guild_id)
+                imported += len(songs)
+                self.schedule_prefetch(guild_id)
+
+                # The queue may have run dry while we were fetching this page
+                player = self.player(guild_id)
+                if songs and interaction.guild.voice_client and player.idle:
+                    await player.start(interaction)
+
+                if imported >= PLAYLIST_MAX_ITEMS:
+                    status = f"stopped at the {PLAYLIST_MAX_ITEMS} song limit"
+                    break
+                await report(f"📥 Importing playlist... **{imported}** songs queued so far.", view)
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            print(f"Playlist import failed after {imported} songs: {e}")
+            status = "stopped early, couldn't load the rest"
+        finally:
+            await pages.aclose()
+            await report(f"📥 Playlist import {status}: **{imported}** songs queued.")
+
+    # Helper to process a list of songs (queue/play)
+    async def process_songs(self, interaction, songs_to_add, note=''):
+        guild_id = interaction.guild_id
+
+        if not songs_to_add:
+            return await interaction.followup.send("Could not find any songs.")
+
+        player = self.player(guild_id)
+        queued_count = len(songs_to_add)
+        session = self.session(guild_id)
+        session.last_active = time.monotonic()
+        session.queue.extend(songs_to_add)
+        self.mark_dirty(guild_id)
+
+        if player.idle:
+            more = f"\n*(+ {queued_count - 1} more songs added to queue)*" if queued_count > 1 else ""
+            if await player.start(interaction, respond=True, note=more + note):
+                return
+
+        # We just queued everything (or another /play got to start first)
+        msg = f"Added **{queued_count}** songs to queue."
+        if queued_count == 1:
+            track = session.queue[-1]
+            msg = f"Added to queue: **{track.title or track.query}**" # Might be raw url
+        self.schedule_prefetch(guild_id)
+        await interaction.followup.send(msg + note)
 
     # Playlist Group
     playlist_group = app_commands.Group(name="playlist", description="Manage your playlists")
@@ -565,17 +1768,11 @@ class Music(commands.Cog):
         if not self.check_channel(interaction):
             return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
             
-        data = load_playlists()
         user_id = str(interaction.user.id)
         
-        if user_id not in data:
-            data[user_id] = {}
-            
-        if name in data[user_id]:
+        if not await playlist_store.create(user_id, name):
              return await interaction.response.send_message(f"Playlist **{name}** already exists!", ephemeral=True)
              
-        data[user_id][name] = []
-        save_playlists(data)
         await interaction.response.send_message(f"Created playlist **{name}**.")
 
     @playlist_group.command(name="delete", description="Delete a playlist")
@@ -583,12 +1780,9 @@ class Music(commands.Cog):
         if not self.check_channel(interaction):
             return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
 
-        data = load_playlists()
         user_id = str(interaction.user.id)
         
-        if user_id in data and name in data[user_id]:
-            del data[user_id][name]
-            save_playlists(data)
+        if await playlist_store.delete(user_id, name):
             await interaction.response.send_message(f"Deleted playlist **{name}**.")
         else:
             await interaction.response.send_message(f"Playlist **{name}** not found.", ephemeral=True)
@@ -598,28 +1792,26 @@ class Music(commands.Cog):
         if not self.check_channel(interaction):
             return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
 
-        data = load_playlists()
         user_id = str(interaction.user.id)
         
-        if user_id not in data or name not in data[user_id]:
+        # We store the raw query. Resolving at play time is better to avoid stale URLs.
+        if not await playlist_store.add_song(user_id, name, query):
              return await interaction.response.send_message(f"Playlist **{name}** not found. Create it first with /playlist create", ephemeral=True)
         
-        # We store the raw query. Resolving at play time is better to avoid stale URLs.
-        data[user_id][name].append(query)
-        save_playlists(data)
         await interaction.response.send_message(f"Added **{query}** to playlist **{name}**.")
+        self.bot.loop.create_task(self.pin_songs([query]))
 
     @playlist_group.command(name="list", description="List your playlists")
     async def playlist_list(self, interaction: discord.Interaction):
         if not self.check_channel(interaction):
             return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
 
-        data = load_playlists()
         user_id = str(interaction.user.id)
+        playlists = await playlist_store.get_user(user_id)
         
-        if user_id in data and data[user_id]:
+        if playlists:
             msg = "**Your Playlists:**\n"
-            for name, songs in data[user_id].items():
+            for name, songs in playlists.items():
                 msg += f"- **{name}**: {len(songs)} songs\n"
             await interaction.response.send_message(msg)
         else:
@@ -630,13 +1822,13 @@ class Music(commands.Cog):
         if not self.check_channel(interaction):
             return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
 
-        data = load_playlists()
         user_id = str(interaction.user.id)
+        playlists = await playlist_store.get_user(user_id)
         
-        if user_id not in data or name not in data[user_id]:
+        if name not in playlists:
              return await interaction.response.send_message(f"Playlist **{name}** not found.", ephemeral=True)
              
-        songs = data[user_id][name]
+        songs = playlists[name]
         if not songs:
              return await interaction.response.send_message(f"Playlist **{name}** is empty!", ephemeral=True)
 
@@ -647,11 +1839,70 @@ class Music(commands.Cog):
              await interaction.user.voice.channel.connect()
         
         await interaction.response.defer()
-        
-        # Process the list of songs
-        # Note: These are queries, so we pass them as is. 
-        # process_songs is expecting a list of things to play
-        await self.process_songs(interaction, list(songs)) # Pass a copy
+
+        # Pinned entries are queued as their video, so they need no search
+        try:
+            pins = await pin_store.get_many(set(songs))
+        except Exception as e:
+            print(f"Could not load playlist pins: {e}")
+            pins = {}
+        queue = []
+        for song in songs:
+            pin = pins.get(song)
+            if pin:
+                queue.append(Track(f"https://www.youtube.com/watch?v={pin['video_id']}", pin['title'], pin['duration'], interaction.user.id))
+            else:
+                queue.append(Track(song, requester=interaction.user.id))
+
+        note = ''
+        if pins:
+            total = sum(pins[song].get('duration') or 0 for song in songs if song in pins)
+            unknown = sum(1 for song in songs if song not in pins)
+            note = f"\n*Playlist length: {format_time(total)}" + (f" (+ {unknown} songs not resolved yet)*" if unknown else "*")
+        if any(song not in pins and song not in self.unpinnable and not self.backing_off(song) for song in songs):
+            self.bot.loop.create_task(self.pin_songs(songs))
+        await self.process_songs(interaction, queue, note=note)
+
+    @playlist_group.command(name="cache", description="Download a saved playlist's songs to the local cache")
+    async def playlist_cache(self, interaction: discord.Interaction, name: str):
+        if not self.check_channel(interaction):
+            return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
+
+        if not disk_cache:
+            return await interaction.response.send_message("The local track cache is disabled.", ephemeral=True)
+
+        playlists = await playlist_store.get_user(str(interaction.user.id))
+        songs = playlists.get(name)
+        if not songs:
+            return await interaction.response.send_message(f"Playlist **{name}** not found or empty.", ephemeral=True)
+
+        await interaction.response.send_message(f"Caching **{len(songs)}** songs from **{name}** in the background.")
+        self.bot.loop.create_task(self.warm_cache(interaction, name, list(songs)))
+
+    # Resolves and writes each song in turn, on the background extraction lane
+    async def warm_cache(self, interaction, name, songs):
+        cached = failed = 0
+        for song in songs:
+            try:
+                data = await extract_stream_info(await spotify.resolve_track(song), guild_id=interaction.guild_id, priority=BACKGROUND)
+                video_id = youtube_id(data.get('webpage_url'))
+                if disk_cache.has(video_id):
+                    cached += 1
+                    continue
+                task = disk_cache.store(video_id, data)
+                if task is not None:
+                    await task
+                if disk_cache.has(video_id):
+                    cached += 1
+                else:
+                    failed += 1
+            except Exception as e:
+                print(f"Failed to cache {song}: {e}")
+                failed += 1
+        try:
+            await interaction.channel.send(f"Playlist **{name}**: {cached} songs cached, {failed} couldn't be cached.")
+        except discord.HTTPException:
+            pass
 
     async def update_status(self, interaction):
         # Manual refresh still useful if automatic one lags
@@ -662,117 +1913,344 @@ class Music(commands.Cog):
 
     async def toggle_loop(self, interaction, view, button):
         guild_id = interaction.guild_id
-        is_looping = not self.looping.get(guild_id, False)
-        self.looping[guild_id] = is_looping
+        session = self.session(guild_id)
+        is_looping = session.looping = not session.looping
+        self.mark_dirty(guild_id)
         
         button.style = discord.ButtonStyle.success if is_looping else discord.ButtonStyle.secondary
         await interaction.response.edit_message(view=view)
 
     async def seek(self, interaction, seconds):
-        if not interaction.guild.voice_client or not interaction.guild.voice_client.is_playing():
+        player = self.players.get(interaction.guild_id)
+        if not interaction.guild.voice_client or not player or player.state not in (PLAYING, SEEKING):
             return await interaction.response.send_message("Nothing is playing.", ephemeral=True)
-        
+
         # Defer immediately because processing takes time
         await interaction.response.defer()
-        
+
+        try:
+            with SEEK_SECONDS.time():
+                new_position = await player.seek(seconds)
+        except Exception as e:
+            return await interaction.followup.send(f"Failed to seek: {e}", ephemeral=True)
+        if new_position is None:
+            await interaction.followup.send("Nothing is playing.", ephemeral=True)
+
+    @app_commands.command(name="volume", description="Sets the playback volume")
+    @app_commands.describe(percent="Volume from 0 to 200%")
+    async def volume(self, interaction: discord.Interaction, percent: app_commands.Range[int, 0, 200]):
+        if not self.check_channel(interaction):
+            return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
+
         guild_id = interaction.guild_id
+        volume = percent / 100
+        self.session(guild_id).volume = volume
+        self.mark_dirty(guild_id)
+
+        voice_client = interaction.guild.voice_client
         current_info = self.current_song.get(guild_id)
-        
-        if not current_info:
-            return await interaction.followup.send("Cannot determine current song.", ephemeral=True)
+        if not voice_client or not voice_client.is_playing() or not current_info:
+            return await interaction.response.send_message(f"Volume set to **{percent}%**.")
 
-        # Calculate current position
-        now = time.time()
-        elapsed = now - current_info['start_timestamp']
-        current_position = current_info['seek_position'] + elapsed
-        
-        new_position = max(0, current_position + seconds)
-        
-        # Trick: Temporarily disable the 'after' callback by removing it or setting a flag
-        # But we can't easily remove it. Just pausing is usually safe.
-        interaction.guild.voice_client.pause() 
-        
-        query = current_info['query']
-        
+        if isinstance(unwrap(voice_client.source), discord.PCMVolumeTransformer):
+            # PCM mode scales frames in Python, so the change is immediate
+            unwrap(voice_client.source).volume = volume
+            if isinstance(voice_client.source, TrackChain) and voice_client.source.upcoming is not None:
+                unwrap(voice_client.source.upcoming).volume = volume
+            return await interaction.response.send_message(f"Volume set to **{percent}%**.")
+
+        # Opus mode: the volume lives in ffmpeg's filter graph, restart it where we are
+        await interaction.response.defer()
         try:
-             # Create new player at offset
-             player = await YTDLSource.from_url(query, loop=self.bot.loop, stream=True, start_time=new_position)
-             
-             # Update state
-             current_info['start_timestamp'] = time.time()
-             current_info['seek_position'] = new_position
-             
-             # Swap source
-             interaction.guild.voice_client.source = player
-             interaction.guild.voice_client.resume()
-             
-             # Force update the message with new progress bar immediately
-             message = current_info.get('message')
-             if message:
-                 msg_content = f"**Now playing:** {current_info['title']}\n{create_progress_bar(new_position, current_info.get('duration'))}"
-                 await message.edit(content=msg_content)
-             
+            await self.player(guild_id).reload()
+            await interaction.followup.send(f"Volume set to **{percent}%**.")
         except Exception as e:
-            interaction.guild.voice_client.resume() # Try to resume old one if fail
-            await interaction.followup.send(f"Failed to seek: {e}", ephemeral=True)
+            await interaction.followup.send(f"Failed to change volume: {e}", ephemeral=True)
+
+    # (content, page, page count) for a page of the guild's queue
+    def render_queue(self, guild_id, page):
+        session = self.sessions.get(guild_id)
+        queue = session.queue if session else SongQueue()
+        pages = max(1, -(-len(queue) // QUEUE_PAGE_SIZE))
+        page = max(0, min(page, pages - 1))
+
+        lines = []
+        info = self.current_song.get(guild_id)
+        if info:
+            lines.append(f"**Now playing:** {info['title']}")
+        if not queue:
+            lines.append("The queue is empty.")
+            return "\n".join(lines), page, pages
+
+        start = page * QUEUE_PAGE_SIZE
+        for position, track in enumerate(queue.page(start, QUEUE_PAGE_SIZE), start + 1):
+            length = f" `{format_time(track.duration)}`" if track.duration else ""
+            lines.append(f"`{position}.` {(track.title or track.query)[:80]}{length}")
+        total = format_time(queue.duration)
+        if queue.unknown:
+            total += f" + {queue.unknown} of unknown length"
+        lines.append(f"\n**{len(queue)}** songs, {total} · page {page + 1}/{pages}")
+        return "\n".join(lines), page, pages
+
+    @app_commands.command(name="queue", description="Shows the queue")
+    async def queue(self, interaction: discord.Interaction):
+        if not self.check_channel(interaction):
+            return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
+
+        view = QueueView(self, interaction.guild_id)
+        await interaction.response.send_message(view.render(), view=view)
+
+    # After the queue's order changed
+    def reordered(self, guild_id):
+        self.mark_dirty(guild_id)
+        self.schedule_prefetch(guild_id)
+        player = self.players.get(guild_id)
+        if player is not None:
+            player.queue_changed()
+
+    @app_commands.command(name="shuffle", description="Shuffles the queue")
+    async def shuffle(self, interaction: discord.Interaction):
+        if not self.check_channel(interaction):
+            return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
+
+        queue = self.session(interaction.guild_id).queue
+        if len(queue) < 2:
+            return await interaction.response.send_message("Not enough songs in the queue to shuffle.", ephemeral=True)
+        queue.shuffle()
+        self.reordered(interaction.guild_id)
+        await interaction.response.send_message(f"🔀 Shuffled **{len(queue)}** songs.")
+
+    @app_commands.command(name="remove", description="Removes a song from the queue")
+    @app_commands.describe(position="Position in /queue")
+    async def remove(self, interaction: discord.Interaction, position: app_commands.Range[int, 1]):
+        if not self.check_channel(interaction):
+            return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
+
+        queue = self.session(interaction.guild_id).queue
+        if position > len(queue):
+            return await interaction.response.send_message(f"The queue only has **{len(queue)}** songs.", ephemeral=True)
+        track = queue.remove(position - 1)
+        self.reordered(interaction.guild_id)
+        await interaction.response.send_message(f"Removed **{track.title or track.query}** from the queue.")
+
+    @app_commands.command(name="move", description="Moves a song to another place in the queue")
+    @app_commands.describe(position="Position in /queue", to="New position")
+    async def move(self, interaction: discord.Interaction, position: app_commands.Range[int, 1], to: app_commands.Range[int, 1]):
+        if not self.check_channel(interaction):
+            return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
+
+        queue = self.session(interaction.guild_id).queue
+        if max(position, to) > len(queue):
+            return await interaction.response.send_message(f"The queue only has **{len(queue)}** songs.", ephemeral=True)
+        track = queue.move(position - 1, to - 1)
+        self.reordered(interaction.guild_id)
+        await interaction.response.send_message(f"Moved **{track.title or track.query}** to position **{to}**.")
+
+    @app_commands.command(name="stats", description="Shows extraction queue and cache stats")
+    async def stats(self, interaction: discord.Interaction):
+        if not self.check_channel(interaction):
+            return await interaction.response.send_message(f"🚫 I can only be used in the #ჭაჭing channel!", ephemeral=True)
+
+        pool = extractor.stats()
+        msg = f"**Extraction pool** ({pool['kind']}, {pool['busy']}/{pool['workers']} busy)\n"
+        for name, lane in pool['lanes'].items():
+            msg += (f"- {name}: {lane['depth']} queued from {lane['guilds']} guilds, "
+                    f"wait avg {lane['wait_avg'] * 1000:.0f} ms / p95 {lane['wait_p95'] * 1000:.0f} ms / max {lane['wait_max'] * 1000:.0f} ms, "
+                    f"{lane['completed']} done, {lane['failed']} failed, {lane['rejected']} rejected\n")
+
+        progress = self.progress.stats()
+        msg += (f"**Progress updates:** {progress['guilds']} guilds, {progress['edits_per_sec']:.1f} edits/s "
+                f"(p95 {progress['latency_p95'] * 1000:.0f} ms), {progress['unchanged']} unchanged skipped, "
+                f"{progress['dropped']} dropped, {progress['late']} late, {progress['rate_limited']} rate limited, "
+                f"{progress['backed_off_channels']} channels backing off\n")
+
+        if stall_watchdog:
+            stalls = stall_watchdog.stats()
+            msg += (f"**Event loop:** lag {loop_lag.lag * 1000:.0f} ms (max {loop_lag.max_lag * 1000:.0f} ms), "
+                    f"{stalls['stalls']} stalls over {stalls['threshold'] * 1000:.0f} ms (worst {stalls['worst'] * 1000:.0f} ms)\n")
+
+        if 'total' in boot_timings:
+            msg += "**Startup:** " + ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in boot_timings.items()) + "\n"
+
+        cache = stream_cache.stats()
+        msg += (f"**Stream cache:** {cache['size']}/{cache['maxsize']} entries, "
+                f"{cache['hit_rate'] * 100:.0f}% hit rate ({cache['hits']} hits, {cache['coalesced']} coalesced, {cache['misses']} misses)")
+        if disk_cache:
+            disk = disk_cache.stats()
+            msg += (f"\n**Disk cache:** {disk['tracks']} tracks, {disk['bytes'] / 1e6:.0f}/{disk['max_bytes'] / 1e6:.0f} MB, "
+                    f"{disk['hit_rate'] * 100:.0f}% hit rate ({disk['hits']} hits, {disk['misses']} misses), "
+                    f"{disk['writes']} written, {disk['writing']} writing, {disk['failed']} failed, {disk['evictions']} evicted")
+        if search_cache:
+            search = search_cache.stats()
+            msg += (f"\n**Search cache:** {search['hit_rate'] * 100:.0f}% hit rate ({search['hits']} hits, {search['misses']} misses), "
+                    f"{search['stored']} stored, {search['evictions']} evicted")
+        await interaction.response.send_message(msg, ephemeral=True)
+
+    @app_commands.command(name="profile", description="Profiles the bot, or lists recent event loop stalls (owner only)")
+    @app_commands.describe(kind="What to record", seconds="How long to profile for")
+    @app_commands.choices(kind=[app_commands.Choice(name="CPU (cProfile)", value="cpu"),
+                                app_commands.Choice(name="Memory (tracemalloc)", value="memory"),
+                                app_commands.Choice(name="Event loop stalls", value="stalls")])
+    @app_commands.default_permissions(administrator=True)
+    async def profile(self, interaction: discord.Interaction, kind: str = "cpu",
+                      seconds: app_commands.Range[int, 1, PROFILE_MAX_SECONDS] = 10):
+        # Everyone's guilds run in this process, so not for other guilds' admins
+        if not await self.bot.is_owner(interaction.user):
+            return await interaction.response.send_message("🚫 Only the bot's owner can do that.", ephemeral=True)
+
+        if kind == "stalls":
+            if not stall_watchdog:
+                return await interaction.response.send_message("The stall watchdog is off (STALL_THRESHOLD=0).", ephemeral=True)
+            report = stall_watchdog.report()
+        else:
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            try:
+                report = await profiling.profile(kind, seconds)
+            except profiling.ProfilerBusy as e:
+                return await interaction.followup.send(str(e), ephemeral=True)
+
+        file = discord.File(io.BytesIO(report.encode()), filename=f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+        if interaction.response.is_done():
+            await interaction.followup.send(file=file, ephemeral=True)
+        else:
+            await interaction.response.send_message(file=file, ephemeral=True)
 
     async def stop_music(self, interaction):
         if interaction.guild.voice_client:
-            self.queues[interaction.guild_id].clear() # Clear queue
-            if interaction.guild_id in self.current_song:
-                 self.current_song[interaction.guild_id]['status'] = 'Stopped'
-            interaction.guild.voice_client.stop()
-            await interaction.guild.voice_client.disconnect()
-            # Disable buttons
+            player = self.player(interaction.guild_id)
+            player.interaction = player.interaction or interaction
             await interaction.response.defer()
+            await player.stop()
         else:
             await interaction.response.send_message("Not playing.", ephemeral=True)
 
     async def skip_song(self, interaction):
-        if interaction.guild.voice_client and interaction.guild.voice_client.is_playing():
-            if interaction.guild_id in self.current_song:
-                 self.current_song[interaction.guild_id]['status'] = 'Skipped'
-            interaction.guild.voice_client.stop() # This triggers 'after' which calls play_next
-            # We can update the message to say "Skipped" but play_next will send a NEW message for the next song.
-            # So here we can just delete the old controls or say skipped.
+        player = self.players.get(interaction.guild_id)
+        if player and player.state == PLAYING:
             await interaction.response.defer()
+            # The next song gets its own Now Playing message
+            await player.skip()
         else:
             await interaction.response.send_message("Not playing.", ephemeral=True)
 
-class MusicBot(commands.Bot):
+# Sharded workers run their shard range in one AutoShardedBot
+class MusicBot(commands.AutoShardedBot if SHARDED else commands.Bot):
     def __init__(self):
         intents = discord.Intents.default()
         intents.message_content = True
-        super().__init__(command_prefix='!', intents=intents)
+        if SHARDED:
+            super().__init__(command_prefix='!', intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+        else:
+            super().__init__(command_prefix='!', intents=intents)
+        self.health = HealthServer(self, loop_lag, port=PORT, max_lag=HEALTH_MAX_LAG, watchdog=stall_watchdog,
+                                   debug_token=DEBUG_TOKEN, max_profile_seconds=PROFILE_MAX_SECONDS)
     
+    async def close(self):
+        # Fly stops the machine with a signal: save everyone's queue first
+        music = self.get_cog("Music")
+        if music:
+            await music.checkpoint_now(all_guilds=True)
+        await spotify.close()
+        await self.health.close()
+        if stall_watchdog:
+            # Shutting down blocks the loop for a while, that's not a stall
+            stall_watchdog.stop()
+        await super().close()
+
     async def setup_hook(self):
+        mark_boot('login')
         await self.add_cog(Music(self))
-        await self.tree.sync()
-        print("Commands synced globally.")
+        close_on_sigterm(self.loop, self.close)
+        loop_lag.start()
+        if stall_watchdog:
+            stall_watchdog.start()
+        if LOOP_DEBUG:
+            self.loop.set_debug(True)
+            self.loop.slow_callback_duration = SLOW_CALLBACK
+        try:
+            await self.health.start()
+        except OSError as e:
+            print(f"Health server failed to start: {e}")
+
+        # None of this needs to hold up connecting to the gateway.
+        # Commands are global, one shard worker syncing them is enough.
+        if not SHARD_IDS or 0 in SHARD_IDS:
+            self.loop.create_task(self.sync_commands())
+        self.loop.create_task(playlist_store.warm_up())
+        self.loop.create_task(checkpoint_store.warm_up())
+        self.loop.create_task(self.get_cog("Music").load_title_index())
+        if search_cache:
+            self.loop.create_task(search_cache.warm_up())
+        if disk_cache:
+            self.loop.create_task(disk_cache.load())
+        self.loop.run_in_executor(None, get_ffmpeg_executable)
+        mark_boot('setup_hook')
+
+    # A global sync is slow and rate limited, so only do it when the command
+    # tree actually changed since the last boot
+    async def sync_commands(self):
+        started = time.perf_counter()
+        commands_payload = []
+        for command in self.tree.get_commands():
+            try:
+                commands_payload.append(command.to_dict(self.tree))
+            except TypeError:
+                # discord.py < 2.4 doesn't take the tree
+                commands_payload.append(command.to_dict())
+        digest = hashlib.sha256(json.dumps(commands_payload, sort_keys=True).encode()).hexdigest()
+        key = f'command_tree_hash:{self.application_id}'
+
+        try:
+            synced_digest = None if FORCE_COMMAND_SYNC else await meta_store.get(key)
+            if synced_digest == digest:
+                print("Command tree unchanged, skipped sync.")
+            else:
+                await self.tree.sync()
+                await meta_store.set(key, digest)
+                print("Commands synced globally.")
+        except Exception as e:
+            print(f"Command sync failed: {e}")
+        boot_timings['command_sync'] = time.perf_counter() - started
 
 bot = MusicBot()
+mark_boot('module')
+
+# Gauges are computed when /metrics is scraped
+def _music():
+    return bot.get_cog("Music")
+
+metrics.Gauge('voice_clients', 'Connected voice clients', lambda: len(bot.voice_clients))
+metrics.Gauge('ffmpeg_processes', 'Live ffmpeg subprocesses', lambda: sum(1 for s in list(live_sources) if ffmpeg_alive(s)))
+metrics.Gauge('queued_songs', 'Songs waiting in all guild queues',
+              lambda: sum(len(s.queue) for s in _music().sessions.values()) if _music() else 0)
+metrics.Gauge('queue_length_max', 'Longest guild queue',
+              lambda: max((len(s.queue) for s in _music().sessions.values()), default=0) if _music() else 0)
+metrics.Gauge('cache_hit_ratio', 'Cache hit rate (coalesced lookups count as hits)',
+              lambda: {('stream',): stream_cache.stats()['hit_rate'],
+                       ('spotify',): spotify.cache.stats()['hit_rate'],
+                       ('playlists',): playlist_store.cache.stats()['hit_rate'],
+                       **({('disk',): disk_cache.stats()['hit_rate']} if disk_cache else {}),
+                       **({('search',): search_cache.stats()['hit_rate']} if search_cache else {})},
+              ['cache'])
+metrics.Gauge('disk_cache_bytes', 'Size of the local Opus track cache', lambda: disk_cache.stats()['bytes'] if disk_cache else 0)
+metrics.Gauge('extract_queue_depth', 'Extractions waiting for a worker',
+              lambda: {(name,): lane['depth'] for name, lane in extractor.stats()['lanes'].items()}, ['lane'])
+metrics.Gauge('event_loop_lag_current_seconds', 'Most recent event loop wake-up delay', lambda: loop_lag.lag)
+metrics.Gauge('startup_phase_seconds', 'Startup timing breakdown',
+              lambda: {(phase,): seconds for phase, seconds in boot_timings.items()}, ['phase'])
 
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user} (ID: {bot.user.id})')
+    if 'gateway' not in boot_timings:
+        mark_boot('gateway')
+        boot_timings['total'] = time.perf_counter() - BOOT_STARTED
+        print("Startup: " + ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in boot_timings.items()))
     print('------')
 
 if __name__ == "__main__":
     if not TOKEN:
         print("Error: DISCORD_TOKEN not found in .env file.")
     else:
-        # Start Keep-Alive Server
-        app = Flask('')
-        @app.route('/')
-        def home():
-            return "Bot is alive!"
-        
-        def run_keep_alive():
-            # Use port from env (standard for cloud hosts) or default to 8080
-            port = int(os.environ.get('PORT', 8080))
-            app.run(host='0.0.0.0', port=port)
-
-        t = threading.Thread(target=run_keep_alive)
-        t.start()
-        
+        # The health server is started from setup_hook, on the bot's own loop
         bot.run(TOKEN)
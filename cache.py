@@ -0,0 +1,97 @@
+import asyncio
+import collections
+import time
+
+
+# Small in-process LRU cache with per-entry expiry.
+# get_or_load() also coalesces concurrent loads of the same key, so ten guilds
+# asking for the same track at once only trigger a single extraction.
+class TTLCache:
+    def __init__(self, maxsize=256, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _count=False) is not None
+
+    def get(self, key, _count=True):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        if _count:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self):
+        self._data.clear()
+
+    def expires_in(self, key):
+        # Seconds until the entry expires, or None if it isn't cached
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        return entry[0] - time.monotonic()
+
+    async def get_or_load(self, key, loader, ttl_for=None):
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+
+            def _done(t, key=key):
+                self._inflight.pop(key, None)
+                if t.cancelled() or t.exception() is not None:
+                    return
+                result = t.result()
+                if result is not None:
+                    self.set(key, result, ttl_for(result) if ttl_for else None)
+
+            task.add_done_callback(_done)
+
+        # Shield so one impatient caller being cancelled doesn't kill the
+        # shared load for everyone else waiting on it
+        return await asyncio.shield(task)
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
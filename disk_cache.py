@@ -0,0 +1,216 @@
+import asyncio
+import collections
+import json
+import os
+import time
+
+
+# Local Opus/Ogg copies of tracks that get played a lot, keyed by YouTube
+# video id. A track is admitted after `admit_after` plays and written in the
+# background by a second ffmpeg while it streams; the least recently played
+# files are evicted to stay under `max_bytes`. Playing from a cached file
+# needs no extraction, and -ss seeks are instant. Filesystem calls run on the
+# loop's default executor, so a slow volume doesn't hold up playback.
+class OpusDiskCache:
+    def __init__(self, directory, max_bytes, admit_after=2, max_duration=20 * 60, ffmpeg='ffmpeg', writers=1,
+                 max_tracked=10000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.admit_after = admit_after
+        self.max_duration = max_duration  # don't fill the cache with 10 hour mixes
+        self.ffmpeg = ffmpeg  # executable path, or a callable returning it
+        self.entries = None  # video_id -> (size, meta), least recently used first; None until load()
+        self.bytes = 0
+        # video_id -> plays so far, least recently played first; capped at
+        # `max_tracked` so one-off plays don't pile up for the process lifetime
+        self.plays = collections.OrderedDict()
+        self.max_tracked = max_tracked
+        self.writing = {}  # video_id -> Task
+        self._writers = asyncio.Semaphore(writers)
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.failed = 0
+        self.evictions = 0
+
+    def _path(self, video_id, ext):
+        return os.path.join(self.directory, f'{video_id}.{ext}')
+
+    def _scan(self):
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            video_id, ext = os.path.splitext(name)
+            if ext == '.part':
+                # Left over from a write that was interrupted
+                os.remove(os.path.join(self.directory, name))
+                continue
+            if ext != '.ogg':
+                continue
+            try:
+                stat = os.stat(self._path(video_id, 'ogg'))
+                with open(self._path(video_id, 'json')) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            found.append((stat.st_mtime, video_id, stat.st_size, meta))
+        found.sort()
+        return collections.OrderedDict((video_id, (size, meta)) for _, video_id, size, meta in found)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    # Builds the index from what's on disk. Lookups miss until this is done.
+    async def load(self):
+        entries = await self._run(self._scan)
+        self.entries = entries
+        self.bytes = sum(size for size, _ in entries.values())
+        print(f"Opus disk cache: {len(entries)} tracks, {self.bytes / 1e6:.0f} MB")
+
+    def has(self, video_id):
+        return bool(video_id) and self.entries is not None and video_id in self.entries
+
+    # (path, stream info) for a cached track, or None
+    async def lookup(self, video_id):
+        if not video_id or self.entries is None:
+            return None
+        entry = self.entries.get(video_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        path = self._path(video_id, 'ogg')
+        try:
+            # Recency survives restarts through the file's mtime
+            await self._run(os.utime, path)
+        except OSError:
+            # Deleted behind our back
+            if self.entries.get(video_id) is entry:
+                self._forget(video_id)
+            self.misses += 1
+            return None
+        if video_id not in self.entries:
+            # Evicted while we were touching it
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(video_id)
+        return path, entry[1]
+
+    # Called whenever a track starts playing; admits it once it's popular enough
+    def record_play(self, video_id, data):
+        if not video_id or self.entries is None or video_id in self.entries:
+            return
+        self.plays[video_id] = self.plays.pop(video_id, 0) + 1
+        if len(self.plays) > self.max_tracked:
+            self.plays.popitem(last=False)
+        if self.plays[video_id] >= self.admit_after:
+            self.store(video_id, data)
+
+    # Writes the track in the background (no-op if cached, being written, or
+    # too long). Returns the write task, if any.
+    def store(self, video_id, data):
+        if not video_id or self.entries is None or video_id in self.entries:
+            return None
+        if video_id in self.writing:
+            return self.writing[video_id]
+        if not data.get('url') or (data.get('duration') or 0) > self.max_duration:
+            return None
+        task = asyncio.get_running_loop().create_task(self._write(video_id, data))
+        self.writing[video_id] = task
+        task.add_done_callback(lambda t: self.writing.pop(video_id, None))
+        return task
+
+    async def _write(self, video_id, data):
+        async with self._writers:
+            part = self._path(video_id, 'part')
+            ffmpeg = self.ffmpeg() if callable(self.ffmpeg) else self.ffmpeg
+            # Opus streams (YouTube's usual audio format) are remuxed, not re-encoded
+            codec = ['-c:a', 'copy'] if data.get('acodec') == 'opus' else ['-c:a', 'libopus', '-b:a', '128k']
+            started = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    ffmpeg, '-nostdin', '-loglevel', 'error',
+                    '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                    '-i', data['url'], '-vn', '-map_metadata', '-1', *codec, '-f', 'ogg', '-y', part,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+                )
+                try:
+                    _, stderr = await process.communicate()
+                except asyncio.CancelledError:
+                    process.kill()
+                    raise
+                if process.returncode != 0:
+                    raise RuntimeError(stderr.decode(errors='replace').strip() or f"ffmpeg exited with {process.returncode}")
+
+                meta = {
+                    'id': video_id,
+                    'title': data.get('title'),
+                    'duration': data.get('duration'),
+                    'webpage_url': data.get('webpage_url'),
+                    'acodec': 'opus',
+                }
+                size = await self._run(self._commit, video_id, part, meta)
+            except BaseException as e:
+                # Not awaited: this may be a cancellation
+                asyncio.get_running_loop().run_in_executor(None, self._remove, part)
+                if not isinstance(e, Exception):
+                    raise
+                self.failed += 1
+                print(f"Failed to cache {video_id}: {e}")
+                return
+
+            self.entries[video_id] = (size, meta)
+            self.bytes += size
+            self.writes += 1
+            self.plays.pop(video_id, None)
+            print(f"Cached {video_id} ({size / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s")
+            await self._evict()
+
+    # Moves a finished write into place; returns the file's size
+    def _commit(self, video_id, part, meta):
+        with open(self._path(video_id, 'json'), 'w') as f:
+            json.dump(meta, f)
+        path = self._path(video_id, 'ogg')
+        os.replace(part, path)
+        return os.path.getsize(path)
+
+    @staticmethod
+    def _remove(*paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _forget(self, video_id):
+        size, _ = self.entries.pop(video_id)
+        self.bytes -= size
+
+    # Least recently played first. The newest entry is always kept, even if it
+    # alone is over budget. The index is updated right away, the files are
+    # deleted on the executor.
+    async def _evict(self):
+        paths = []
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            video_id = next(iter(self.entries))
+            self._forget(video_id)
+            self.evictions += 1
+            paths += [self._path(video_id, 'ogg'), self._path(video_id, 'json')]
+        if paths:
+            await self._run(self._remove, *paths)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'tracks': len(self.entries or ()),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'writes': self.writes,
+            'writing': len(self.writing),
+            'failed': self.failed,
+            'evictions': self.evictions,
+        }
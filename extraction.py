@@ -0,0 +1,252 @@
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import threading
+import time
+
+from metrics import Histogram
+
+# Priority lanes: interactive work (/play, seek) always goes before background
+# work (prefetch, playlist paging) that is already waiting
+INTERACTIVE = 0
+BACKGROUND = 1
+LANE_NAMES = ('interactive', 'background')
+
+EXTRACT_SECONDS = Histogram('extract_info_seconds', 'Time spent in yt-dlp extract_info', ['profile'])
+EXTRACT_WAIT_SECONDS = Histogram('extract_queue_wait_seconds', 'Time extractions waited for a worker', ['lane'])
+
+
+class ExtractionQueueFull(Exception):
+    pass
+
+
+# Worker side. Each worker thread (or process) keeps one pre-built YoutubeDL
+# per option profile instead of constructing a new one for every request.
+_local = threading.local()
+
+
+def _get_ydl(profile, options):
+    instances = getattr(_local, 'instances', None)
+    if instances is None:
+        instances = _local.instances = {}
+    ydl = instances.get(profile)
+    if ydl is None:
+        import yt_dlp
+        # Suppress noise about console usage from errors
+        yt_dlp.utils.bug_reports_message = lambda *args, **kwargs: ''
+        ydl = instances[profile] = yt_dlp.YoutubeDL(options)
+    return ydl
+
+
+def _run_extract(profile, options, query, download, overrides):
+    ydl = _get_ydl(profile, options)
+    if not overrides:
+        return ydl.extract_info(query, download=download)
+
+    # Per-call tweaks (e.g. playlist_items) are applied to the reused instance
+    # and put back afterwards. Safe because the instance is thread-local.
+    saved = {key: ydl.params.get(key) for key in overrides}
+    ydl.params.update(overrides)
+    try:
+        return ydl.extract_info(query, download=download)
+    finally:
+        ydl.params.update(saved)
+
+
+# A playlist's entries, read lazily (process=False): yt-dlp fetches each
+# continuation only when the entries get that far, so listing page after page
+# follows the continuations once instead of from the top for every page.
+# Uses its own YoutubeDL, since a walk moves between worker threads.
+def _open_playlist(options, query):
+    import yt_dlp
+    yt_dlp.utils.bug_reports_message = lambda *args, **kwargs: ''
+    ydl = yt_dlp.YoutubeDL(options)
+    info = ydl.extract_info(query, download=False, process=False)
+    for _ in range(3):
+        # e.g. a watch?v=...&list=... link pointing at the playlist itself
+        if info.get('_type') not in ('url', 'url_transparent'):
+            break
+        info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+    return info.get('entries') or ()
+
+
+# Where a playlist listing has got to. Each next_page() call is its own job on
+# a worker thread, so other guilds' jobs still get a turn between pages.
+class _PlaylistWalk:
+    def __init__(self, options, query, start, limit):
+        self.options = options
+        self.query = query
+        self.start = start
+        self.limit = limit
+        self.entries = None
+
+    def next_page(self, page_size):
+        if self.entries is None:
+            entries = _open_playlist(self.options, self.query)
+            self.entries = itertools.islice(entries, self.start - 1, self.start - 1 + self.limit)
+        return list(itertools.islice(self.entries, page_size))
+
+
+# The same listing in one job, for process pools (a walk can't be sent back
+# and forth between processes)
+def _walk_playlist(options, query, start, limit, page_size):
+    walk = _PlaylistWalk(options, query, start, limit)
+    pages = []
+    while True:
+        page = walk.next_page(page_size)
+        if not page:
+            return pages
+        pages.append(page)
+
+
+class _Job:
+    __slots__ = ('future', 'profile', 'fn', 'args', 'enqueued_at')
+
+    def __init__(self, future, profile, fn, args):
+        self.future = future
+        self.profile = profile
+        self.fn = fn
+        self.args = args
+        self.enqueued_at = time.perf_counter()
+
+
+# Runs yt-dlp extractions on a dedicated pool, separate from the loop's default
+# executor. Jobs wait in per-lane, per-guild queues and are handed out round
+# robin between guilds, so one guild importing a huge playlist can't starve
+# everyone else.
+class ExtractionPool:
+    def __init__(self, profiles, workers=2, kind='thread', max_queue=100):
+        self.profiles = profiles  # name -> yt-dlp options
+        self.workers = workers
+        self.kind = kind
+        self.max_queue = max_queue
+
+        self._lanes = [collections.OrderedDict() for _ in LANE_NAMES]  # guild_id -> deque of _Job
+        self._depth = [0] * len(LANE_NAMES)
+        self._ready = None
+        self._executor = None
+        self._dispatchers = []
+
+        self.busy = 0
+        self.completed = [0] * len(LANE_NAMES)
+        self.failed = [0] * len(LANE_NAMES)
+        self.rejected = [0] * len(LANE_NAMES)
+        self.wait_times = [collections.deque(maxlen=500) for _ in LANE_NAMES]
+
+    def _start(self):
+        if self.kind == 'process':
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix='extract')
+        self._ready = asyncio.Semaphore(0)
+        loop = asyncio.get_running_loop()
+        self._dispatchers = [loop.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    def shutdown(self):
+        for task in self._dispatchers:
+            task.cancel()
+        self._dispatchers = []
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # Queues fn(*args) for a worker; returns the future of its result
+    def _submit(self, priority, guild_id, profile, fn, *args):
+        if self._executor is None:
+            self._start()
+
+        if self._depth[priority] >= self.max_queue:
+            self.rejected[priority] += 1
+            raise ExtractionQueueFull(f"Too many pending {LANE_NAMES[priority]} extractions, try again in a bit.")
+
+        job = _Job(asyncio.get_running_loop().create_future(), profile, fn, args)
+        self._lanes[priority].setdefault(guild_id, collections.deque()).append(job)
+        self._depth[priority] += 1
+        self._ready.release()
+        return job.future
+
+    async def extract(self, query, *, profile='stream', guild_id=None, priority=INTERACTIVE, download=False, **overrides):
+        # If the caller gives up, the future is cancelled and the dispatcher skips it
+        return await self._submit(priority, guild_id, profile, _run_extract,
+                                  profile, self.profiles[profile], query, download, overrides)
+
+    # Up to `limit` entries of a playlist from `start` on, in lists of up to
+    # `page_size` flat entries. On a thread pool each page is a separate job
+    # carrying on from where the last one stopped.
+    async def playlist_pages(self, query, start, limit, page_size, *, profile='flat', guild_id=None, priority=BACKGROUND):
+        options = self.profiles[profile]
+        if self.kind == 'process':
+            for page in await self._submit(priority, guild_id, profile, _walk_playlist,
+                                           options, query, start, limit, page_size):
+                yield page
+            return
+
+        walk = _PlaylistWalk(options, query, start, limit)
+        while True:
+            page = await self._submit(priority, guild_id, profile, walk.next_page, page_size)
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+
+    def _next_job(self):
+        for priority, lane in enumerate(self._lanes):
+            while lane:
+                guild_id, jobs = next(iter(lane.items()))
+                job = jobs.popleft()
+                self._depth[priority] -= 1
+                # Round robin: this guild goes to the back of the line
+                del lane[guild_id]
+                if jobs:
+                    lane[guild_id] = jobs
+                if not job.future.cancelled():
+                    return priority, job
+        return None, None
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._ready.acquire()
+            priority, job = self._next_job()
+            if job is None:
+                # Every waiting job had been cancelled
+                continue
+
+            waited = time.perf_counter() - job.enqueued_at
+            self.wait_times[priority].append(waited)
+            EXTRACT_WAIT_SECONDS.labels(LANE_NAMES[priority]).observe(waited)
+            self.busy += 1
+            started = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(self._executor, job.fn, *job.args)
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                self.failed[priority] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self.completed[priority] += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.busy -= 1
+                EXTRACT_SECONDS.labels(job.profile).observe(time.perf_counter() - started)
+
+    def stats(self):
+        lanes = {}
+        for priority, name in enumerate(LANE_NAMES):
+            waits = sorted(self.wait_times[priority])
+            lanes[name] = {
+                'depth': self._depth[priority],
+                'guilds': len(self._lanes[priority]),
+                'completed': self.completed[priority],
+                'failed': self.failed[priority],
+                'rejected': self.rejected[priority],
+                'wait_avg': sum(waits) / len(waits) if waits else 0.0,
+                'wait_p95': waits[int(len(waits) * 0.95)] if waits else 0.0,
+                'wait_max': waits[-1] if waits else 0.0,
+            }
+        return {'kind': self.kind, 'workers': self.workers, 'busy': self.busy, 'lanes': lanes}
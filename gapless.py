@@ -0,0 +1,179 @@
+import collections
+import threading
+import time
+from array import array
+
+import discord
+
+from seek_buffer import SeekBuffer
+
+FRAME_SECONDS = 0.02
+
+
+# Wraps a freshly spawned source and reads its first frames ahead of time (on
+# a worker thread, via fill()), so ffmpeg has already connected, probed and
+# produced audio by the time the track is switched to.
+class Prebuffered(discord.AudioSource):
+    def __init__(self, source):
+        self.source = source
+        self.buffer = collections.deque()
+        self.ended = False
+
+    def __getattr__(self, name):
+        # title, duration, data, volume... come from the wrapped source
+        return getattr(self.source, name)
+
+    def fill(self, frames):
+        for _ in range(frames):
+            data = self.source.read()
+            if not data:
+                self.ended = True
+                break
+            self.buffer.append(data)
+        return len(self.buffer)
+
+    def read(self):
+        if self.buffer:
+            return self.buffer.popleft()
+        if self.ended:
+            return b''
+        return self.source.read()
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.buffer.clear()
+        self.source.cleanup()
+
+
+# Linear crossfade of two 16-bit stereo PCM frames; `t` goes from 0 (all a)
+# to 1 (all b)
+def mix(a, b, t):
+    x = array('h', a)
+    y = array('h', b)
+    if len(y) < len(x):
+        y.extend([0] * (len(x) - len(y)))
+    out = array('h', (max(-32768, min(32767, int(p * (1 - t) + q * t))) for p, q in zip(x, y)))
+    return out.tobytes()
+
+
+# The single source handed to voice_client.play() in gapless mode. It plays the
+# current track and, once the next one has been queued with set_next(), moves
+# on to it on the very next frame instead of letting the AudioPlayer stop.
+# Runs on the audio thread: on_switch(chain, source, ended_at, gap, started_at)
+# is called from there and must only hand off to the event loop.
+class TrackChain(discord.AudioSource):
+    def __init__(self, source, on_switch, crossfade=0.0):
+        self.current = source
+        self.upcoming = None
+        self.on_switch = on_switch
+        self.crossfade_frames = int(crossfade / FRAME_SECONDS)
+        self.frames_left = None  # frames until the current track ends, when known
+        self.fade = 0
+        self.fade_started = None
+        self.skip_requested = False
+        self.end_requested = False
+        self._lock = threading.Lock()
+
+    def is_opus(self):
+        return self.current.is_opus()
+
+    # Remaining length of the current track, for deciding when to crossfade.
+    # Also called after a seek, which calls off a crossfade under way.
+    def set_remaining(self, seconds):
+        with self._lock:
+            self.frames_left = int(seconds / FRAME_SECONDS) if seconds else None
+            self.fade = 0
+
+    def set_next(self, source):
+        with self._lock:
+            old, self.upcoming = self.upcoming, source
+            if source is None and self.skip_requested:
+                # The skip has nothing to move on to now: just end the track
+                self.skip_requested = False
+                self.end_requested = True
+        if old is not None:
+            old.cleanup()
+
+    def take_next(self):
+        with self._lock:
+            source, self.upcoming = self.upcoming, None
+            self.skip_requested = False
+        return source
+
+    def replace_current(self, source):
+        with self._lock:
+            old, self.current = self.current, source
+            self.fade = 0
+        old.cleanup()
+
+    # Moves on to the queued track on the next frame. False if nothing's ready.
+    def skip(self):
+        with self._lock:
+            if self.upcoming is None:
+                return False
+            self.skip_requested = True
+            return True
+
+    def _can_fade(self):
+        return (self.crossfade_frames and self.upcoming is not None and self.frames_left is not None
+                and not self.current.is_opus() and not self.upcoming.is_opus())
+
+    def read(self):
+        with self._lock:
+            if self.end_requested:
+                return b''
+            if self.skip_requested:
+                self.skip_requested = False
+                return self._switch(time.perf_counter())
+
+            data = self.current.read()
+            if self.frames_left is not None:
+                self.frames_left -= 1
+
+            if data and self._can_fade() and self.frames_left <= self.crossfade_frames:
+                if self.fade == 0:
+                    self.fade_started = time.time()
+                self.fade += 1
+                incoming = self.upcoming.read()
+                return mix(data, incoming, min(1.0, self.fade / self.crossfade_frames)) if incoming else data
+
+            if data:
+                return data
+            if self.upcoming is None:
+                # Nothing queued: end normally, the player's `after` takes over
+                return b''
+            return self._switch(time.perf_counter())
+
+    def _switch(self, ended_at):
+        if self.upcoming is None:
+            # Nothing to switch to: end the track, the player's `after` takes over
+            return b''
+        old, self.current, self.upcoming = self.current, self.upcoming, None
+        started_at = self.fade_started if self.fade else time.time()
+        self.fade = 0
+        self.frames_left = None
+        old.cleanup()
+        data = self.current.read()
+        self.on_switch(self, self.current, ended_at, time.perf_counter() - ended_at, started_at)
+        return data
+
+    def cleanup(self):
+        with self._lock:
+            sources = [s for s in (self.current, self.upcoming) if s is not None]
+            self.upcoming = None
+            self.skip_requested = False
+        for source in sources:
+            source.cleanup()
+
+
+# The source actually producing the current track's audio
+def unwrap(source):
+    if isinstance(source, TrackChain):
+        source = source.current
+    if isinstance(source, Prebuffered):
+        source = source.source
+    if isinstance(source, SeekBuffer):
+        source = source.source
+    return source
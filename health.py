@@ -0,0 +1,93 @@
+import hmac
+import math
+
+from aiohttp import web
+
+import metrics
+import profiling
+
+
+# Health check and /metrics, served from the bot's own event loop. If the loop
+# is wedged the check doesn't answer at all, and if it was recently stalled or
+# the gateway is down it answers 503.
+#
+# With a debug token set it also serves, to requests carrying
+# "Authorization: Bearer <token>" (or ?token=):
+#   /debug/stalls                          recent event loop stalls with stacks
+#   /debug/profile?kind=cpu&seconds=10     profile taken while you wait (kind=memory for tracemalloc)
+class HealthServer:
+    def __init__(self, bot, loop_lag, port=8080, max_lag=1.0, watchdog=None, debug_token=None, max_profile_seconds=60):
+        self.bot = bot
+        self.loop_lag = loop_lag
+        self.port = port
+        self.max_lag = max_lag
+        self.watchdog = watchdog
+        self.debug_token = debug_token
+        self.max_profile_seconds = max_profile_seconds
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/', self.health)
+        app.router.add_get('/health', self.health)
+        app.router.add_get('/metrics', self.metrics)
+        if self.debug_token:
+            app.router.add_get('/debug/stalls', self.stalls)
+            app.router.add_get('/debug/profile', self.profile)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '0.0.0.0', self.port).start()
+        print(f"Health server listening on port {self.port}")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def problems(self):
+        problems = []
+        if self.bot.is_closed() or not self.bot.is_ready():
+            problems.append("gateway not connected")
+        elif not math.isfinite(self.bot.latency):
+            problems.append("no gateway heartbeat")
+        if self.loop_lag.lag > self.max_lag:
+            problems.append(f"event loop lag {self.loop_lag.lag:.2f}s")
+        return problems
+
+    async def health(self, request):
+        problems = self.problems()
+        if problems:
+            return web.Response(status=503, text="Unhealthy: " + ", ".join(problems))
+        return web.Response(text="Bot is alive!")
+
+    async def metrics(self, request):
+        return web.Response(body=metrics.render().encode(),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    def authorized(self, request):
+        header = request.headers.get('Authorization', '')
+        token = header[len('Bearer '):] if header.startswith('Bearer ') else request.query.get('token', '')
+        return hmac.compare_digest(token.encode(), self.debug_token.encode())
+
+    async def stalls(self, request):
+        if not self.authorized(request):
+            return web.Response(status=401, text="Unauthorized")
+        if self.watchdog is None:
+            return web.Response(status=404, text="Stall watchdog is off")
+        return web.Response(text=self.watchdog.report())
+
+    async def profile(self, request):
+        if not self.authorized(request):
+            return web.Response(status=401, text="Unauthorized")
+        kind = request.query.get('kind', 'cpu')
+        try:
+            seconds = float(request.query.get('seconds', 10))
+        except ValueError:
+            return web.Response(status=400, text="seconds must be a number")
+        if kind not in profiling.PROFILE_KINDS or not 0 < seconds <= self.max_profile_seconds:
+            return web.Response(status=400, text=f"kind is one of {', '.join(profiling.PROFILE_KINDS)}, "
+                                                 f"seconds up to {self.max_profile_seconds}")
+        try:
+            return web.Response(text=await profiling.profile(kind, seconds))
+        except profiling.ProfilerBusy as e:
+            return web.Response(status=409, text=str(e))
@@ -0,0 +1,206 @@
+import asyncio
+import bisect
+import time
+
+# Minimal Prometheus-style metrics. Recording is a couple of list operations
+# (no locks, no label formatting), everything expensive happens in render()
+# when /metrics is scraped.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    inner = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + inner + '}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.family} {metric.help}")
+            lines.append(f"# TYPE {metric.family} {metric.type}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                lines.append(f"# {metric.family} failed: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if registry is not None:
+            registry.register(self)
+
+    # Name the HELP/TYPE lines use, the same one the samples start with
+    @property
+    def family(self):
+        return self.name
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Context manager for timing a block
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ('child', 'started')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, values)} {child.sum}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, values)} {child.count}"
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    @property
+    def family(self):
+        return self.name if self.name.endswith('_total') else f"{self.name}_total"
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.family}{_format_labels(self.labelnames, values)} {child.value}"
+
+
+# Gauges are read from a callback at scrape time, so nothing has to keep them
+# up to date on the hot path. The callback returns a number, or a dict of
+# label value tuple -> number when the gauge has labels.
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def __init__(self, name, help, callback, labelnames=(), registry=REGISTRY):
+        self.callback = callback
+        super().__init__(name, help, labelnames, registry)
+
+    def samples(self):
+        value = self.callback()
+        if isinstance(value, dict):
+            for values, v in value.items():
+                yield f"{self.name}{_format_labels(self.labelnames, values)} {v}"
+        else:
+            yield f"{self.name} {value}"
+
+
+# Measures how late the event loop wakes up from a short sleep. Anything above
+# a few ms means something is blocking the loop.
+class LoopLagMonitor:
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.histogram = Histogram('event_loop_lag_seconds', 'Event loop wake-up delay',
+                                   buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - started - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            self.histogram.observe(self.lag)
+
+
+def render():
+    return REGISTRY.render()
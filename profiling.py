@@ -0,0 +1,174 @@
+import asyncio
+import collections
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+
+import metrics
+
+STALLS = metrics.Counter('event_loop_stalls', 'Times the event loop was blocked for longer than the stall threshold')
+
+# Innermost frames of a stall's stack printed to the log (the reports keep more)
+LOG_FRAMES = 4
+STACK_FRAMES = 30
+# Samples kept per stall; a stall still running after that is just timed
+MAX_SAMPLES = 200
+
+
+# Notices when the event loop stops running and samples the loop thread's
+# stack from another thread while it's still blocked, so the report shows
+# what was blocking (a synchronous database call, an ffmpeg spawn...) rather
+# than whatever ran after it. A heartbeat task stamps the time every
+# `interval`; the watchdog thread checks the stamp just as often.
+class StallWatchdog:
+    def __init__(self, threshold=0.25, interval=0.05, keep=50):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = collections.deque(maxlen=keep)  # reports, oldest first
+        self.count = 0
+        self.worst = 0.0
+        self._beat = 0.0
+        self._loop_thread = None
+        self._task = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._stopping.clear()
+        threading.Thread(target=self._watch, name='stall-watchdog', daemon=True).start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        stall = None
+        while not self._stopping.wait(self.interval):
+            beat = self._beat
+            if stall is not None and beat != stall['beat']:
+                # The loop is running again
+                self._finish(stall, beat)
+                stall = None
+            blocked = time.monotonic() - beat
+            if blocked < self.threshold + self.interval:
+                continue
+            if stall is None:
+                stall = {'beat': beat, 'at': time.time() - blocked, 'samples': collections.Counter()}
+            if sum(stall['samples'].values()) < MAX_SAMPLES:
+                stack = self._stack()
+                if stack:
+                    stall['samples'][stack] += 1
+
+    def _stack(self):
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return None
+        return tuple(traceback.format_list(traceback.extract_stack(frame, limit=STACK_FRAMES)))
+
+    def _finish(self, stall, resumed):
+        duration = max(0.0, resumed - stall['beat'] - self.interval)
+        samples = stall['samples']
+        self.stalls.append({'at': stall['at'], 'duration': duration,
+                            'samples': sum(samples.values()), 'stacks': samples.most_common(3)})
+        self.count += 1
+        self.worst = max(self.worst, duration)
+        STALLS.inc()
+        where = ''.join(samples.most_common(1)[0][0][-LOG_FRAMES:]).rstrip('\n') if samples else None
+        print(f"Event loop blocked for {duration * 1000:.0f} ms" + (f" in:\n{where}" if where else ""))
+
+    def stats(self):
+        return {'stalls': self.count, 'worst': self.worst, 'threshold': self.threshold}
+
+    # Plain text report of the recent stalls, newest first
+    def report(self):
+        lines = [f"{self.count} event loop stalls over {self.threshold * 1000:.0f} ms, "
+                 f"worst {self.worst * 1000:.0f} ms, last {len(self.stalls)} below"]
+        for stall in reversed(self.stalls):
+            when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stall['at']))
+            lines.append(f"\n{when} blocked for {stall['duration'] * 1000:.0f} ms")
+            for stack, hits in stall['stacks']:
+                lines.append(f"{hits}/{stall['samples']} samples in:")
+                lines.append(''.join(stack).rstrip('\n'))
+        return '\n'.join(lines) + '\n'
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+PROFILE_KINDS = ('cpu', 'memory')
+_running = None
+
+
+# Profiles the event loop thread for `seconds` while the bot keeps running and
+# returns a plain text report. One profile at a time.
+async def profile(kind, seconds, limit=40):
+    global _running
+    if kind not in PROFILE_KINDS:
+        raise ValueError(f"Unknown profile kind {kind!r}")
+    if _running is not None:
+        raise ProfilerBusy(f"A {_running} profile is already running")
+    _running = kind
+    try:
+        if kind == 'cpu':
+            return await _profile_cpu(seconds, limit)
+        return await _profile_memory(seconds, limit)
+    finally:
+        _running = None
+
+
+async def _profile_cpu(seconds, limit):
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Another profiler (a debugger, coverage...) already hooks this thread
+        raise ProfilerBusy(str(e))
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+
+    out = io.StringIO()
+    out.write(f"CPU profile of the event loop thread over {seconds:g}s\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats('cumulative').print_stats(limit)
+    stats.sort_stats('tottime').print_stats(limit)
+    return out.getvalue()
+
+
+async def _profile_memory(seconds, limit):
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<frozen importlib._bootstrap>'))
+    diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+    lines = [f"Memory allocated over {seconds:g}s and still alive, by line "
+             f"(traced {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB)"]
+    lines.extend(str(stat) for stat in diff[:limit])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,169 @@
+import asyncio
+import collections
+import time
+
+import discord
+
+from metrics import Histogram
+
+# Update cadence by track length: short songs tick every second, long mixes
+# don't need to (and every edit counts against the channel's rate limit)
+CADENCE = (
+    (10 * 60, 1.0),
+    (60 * 60, 5.0),
+    (float('inf'), 15.0),
+)
+MAX_BACKOFF = 32.0
+# Edits slower than this mean discord.py sat out a 429 for us, so back off too
+SLOW_EDIT = 2.0
+
+EDIT_SECONDS = Histogram('message_edit_seconds', 'Now Playing message.edit latency')
+
+
+def cadence_for(duration):
+    for limit, interval in CADENCE:
+        if (duration or 0) < limit:
+            return interval
+    return CADENCE[-1][1]
+
+
+class _GuildState:
+    __slots__ = ('message_id', 'last_content', 'next_due')
+
+    def __init__(self, message_id):
+        self.message_id = message_id
+        self.last_content = None
+        self.next_due = 0.0
+
+
+class _ChannelState:
+    __slots__ = ('backoff', 'blocked_until', 'in_flight')
+
+    def __init__(self):
+        self.backoff = 1.0
+        self.blocked_until = 0.0
+        self.in_flight = False
+
+
+# Schedules the Now Playing message edits. Guilds are edited concurrently, at
+# most one edit in flight per channel, unchanged content is never re-sent and a
+# channel that hits rate limits backs off (and recovers) on its own.
+class ProgressScheduler:
+    def __init__(self, max_in_flight=50, on_gone=None):
+        self.max_in_flight = max_in_flight
+        self.on_gone = on_gone  # called with guild_id when the message was deleted
+        self.guilds = {}  # guild_id -> _GuildState
+        self.channels = collections.defaultdict(_ChannelState)  # channel_id -> _ChannelState
+        self.in_flight = 0
+        self.tasks = set()  # edits under way; the loop itself only keeps weak references
+
+        self.edit_times = collections.deque(maxlen=5000)  # completion times, for edits/s
+        self.latencies = collections.deque(maxlen=500)
+        self.edits = 0
+        self.unchanged = 0
+        self.dropped = 0
+        self.late = 0
+        self.rate_limited = 0
+        self.failed = 0
+
+    # items: iterable of (guild_id, message, content, duration)
+    def tick(self, items):
+        now = time.monotonic()
+        seen = set()
+        seen_channels = set()
+
+        for guild_id, message, content, duration in items:
+            seen.add(guild_id)
+            seen_channels.add(message.channel.id)
+            state = self.guilds.get(guild_id)
+            if state is None or state.message_id != message.id:
+                state = self.guilds[guild_id] = _GuildState(message.id)
+
+            if now < state.next_due:
+                continue
+            if content == state.last_content:
+                self.unchanged += 1
+                continue
+
+            channel = self.channels[message.channel.id]
+            if channel.in_flight or now < channel.blocked_until or self.in_flight >= self.max_in_flight:
+                # Still busy with (or waiting out) the previous edit, try again next tick
+                self.dropped += 1
+                continue
+
+            interval = cadence_for(duration) * channel.backoff
+            if state.next_due and now - state.next_due > interval:
+                self.late += 1
+            state.next_due = now + interval
+            channel.in_flight = True
+            self.in_flight += 1
+            task = asyncio.ensure_future(self._edit(guild_id, state, channel, message, content))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        for guild_id in list(self.guilds):
+            if guild_id not in seen:
+                del self.guilds[guild_id]
+        for channel_id, channel in list(self.channels.items()):
+            if channel_id not in seen_channels and not channel.in_flight:
+                del self.channels[channel_id]
+
+    async def _edit(self, guild_id, state, channel, message, content):
+        started = time.monotonic()
+        try:
+            await message.edit(content=content)
+            state.last_content = content
+            self.edits += 1
+            finished = time.monotonic()
+            self.edit_times.append(finished)
+            self.latencies.append(finished - started)
+            EDIT_SECONDS.observe(finished - started)
+            if finished - started > SLOW_EDIT:
+                self._back_off(channel, finished)
+            else:
+                channel.backoff = max(1.0, channel.backoff * 0.75)
+        except discord.NotFound:
+            # Message deleted, stop tracking it
+            self.guilds.pop(guild_id, None)
+            if self.on_gone:
+                self.on_gone(guild_id)
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self.rate_limited += 1
+                self._back_off(channel, time.monotonic())
+            else:
+                self.failed += 1
+                print(f"Progress update failed in {guild_id}: {e}")
+        except Exception as e:
+            self.failed += 1
+            print(f"Progress update failed in {guild_id}: {e}")
+        finally:
+            channel.in_flight = False
+            self.in_flight -= 1
+
+    # Cancels the edits still under way
+    def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+    def _back_off(self, channel, now):
+        channel.backoff = min(MAX_BACKOFF, channel.backoff * 2)
+        channel.blocked_until = now + channel.backoff
+
+    def stats(self):
+        now = time.monotonic()
+        recent = sum(1 for t in self.edit_times if now - t <= 60)
+        latencies = sorted(self.latencies)
+        return {
+            'guilds': len(self.guilds),
+            'in_flight': self.in_flight,
+            'edits_per_sec': recent / 60,
+            'edits': self.edits,
+            'unchanged': self.unchanged,
+            'dropped': self.dropped,
+            'late': self.late,
+            'rate_limited': self.rate_limited,
+            'failed': self.failed,
+            'backed_off_channels': sum(1 for c in self.channels.values() if c.backoff > 1.0),
+            'latency_p95': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        }
@@ -0,0 +1,152 @@
+import concurrent.futures
+import threading
+
+import discord
+
+FRAME_SECONDS = 0.02
+# Played frames are dropped in batches, so trimming isn't a list shift per frame
+TRIM_BATCH = 250
+
+# Read-ahead is best effort: when every worker is busy the audio thread just
+# reads the next frame itself, as it would without a buffer
+_fill_pool = None
+
+
+def fill_pool():
+    global _fill_pool
+    if _fill_pool is None:
+        _fill_pool = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix='seek-buffer')
+    return _fill_pool
+
+
+# Keeps the frames a track has produced, `back` seconds behind the playback
+# position and up to `ahead` seconds past it (read early on a worker thread),
+# so a seek inside that window just moves a cursor: no ffmpeg restart, no
+# network. Frames are whatever the wrapped source yields, Opus packets or PCM;
+# `max_bytes` bounds the whole buffer, which matters for PCM (192 KB/s).
+# `start` is the track position the source starts at (its -ss).
+class SeekBuffer(discord.AudioSource):
+    def __init__(self, source, start=0.0, back=120.0, ahead=15.0, max_bytes=8 * 1024 * 1024):
+        self.source = source
+        self.start = start
+        self.back_frames = int(back / FRAME_SECONDS)
+        self.ahead_frames = int(ahead / FRAME_SECONDS)
+        self.max_bytes = max_bytes
+        self.frames = []
+        self.first = 0  # frame number of frames[0], counted from `start`
+        self.cursor = 0  # frame number read() returns next
+        self.bytes = 0
+        self.ended = False
+        self.closed = False
+        self.filling = False
+        self._lock = threading.Lock()  # the frames and cursor
+        self._source_lock = threading.Lock()  # reading the source, which may block
+
+    def __getattr__(self, name):
+        # title, duration, data, _process... come from the wrapped source
+        return getattr(self.source, name)
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    # Track position of the next frame
+    @property
+    def position(self):
+        return self.start + self.cursor * FRAME_SECONDS
+
+    # Moves playback to `position` if it's inside the buffer (or past the end
+    # of a track that has been read to the end). False if it isn't.
+    def seek(self, position):
+        with self._lock:
+            index = round((position - self.start) / FRAME_SECONDS)
+            end = self.first + len(self.frames)
+            if index < self.first or (index > end and not self.ended):
+                return False
+            self.cursor = min(index, end)
+            self._want_more()
+            return True
+
+    def read(self):
+        with self._lock:
+            if self.cursor < self.first + len(self.frames) or self.ended:
+                return self._take()
+        # Nothing read ahead: read it ourselves, as an unbuffered source would
+        with self._source_lock:
+            with self._lock:
+                if self.cursor < self.first + len(self.frames) or self.ended:
+                    # The read-ahead got there first
+                    return self._take()
+            data = self._read_source()
+            with self._lock:
+                self._append(data)
+                return self._take()
+
+    def _take(self):
+        index = self.cursor - self.first
+        if index >= len(self.frames):
+            return b''
+        self.cursor += 1
+        self._want_more()
+        return self.frames[index]
+
+    def _read_source(self):
+        if self.closed:
+            return b''
+        try:
+            return self.source.read()
+        except Exception:
+            if self.closed:
+                # Killed under a read-ahead
+                return b''
+            raise
+
+    def _append(self, data):
+        if not data:
+            self.ended = True
+            return
+        self.frames.append(data)
+        self.bytes += len(data)
+        self._trim()
+
+    def _trim(self):
+        behind = self.cursor - self.first
+        drop = behind - self.back_frames
+        if self.bytes > self.max_bytes:
+            average = self.bytes / len(self.frames)
+            drop = max(drop, int((self.bytes - self.max_bytes) / average) + TRIM_BATCH)
+        drop = min(drop, behind)
+        if drop >= TRIM_BATCH or (drop > 0 and self.bytes > self.max_bytes):
+            self.bytes -= sum(map(len, self.frames[:drop]))
+            del self.frames[:drop]
+            self.first += drop
+
+    # Starts a read-ahead when less than half of `ahead` is buffered
+    def _want_more(self):
+        if self.filling or self.ended or self.closed or not self.ahead_frames:
+            return
+        if self.first + len(self.frames) - self.cursor < self.ahead_frames // 2:
+            self.filling = True
+            fill_pool().submit(self._fill)
+
+    def _fill(self):
+        try:
+            while True:
+                with self._lock:
+                    if self.ended or self.closed or self.first + len(self.frames) - self.cursor >= self.ahead_frames:
+                        return
+                with self._source_lock:
+                    data = self._read_source()
+                    with self._lock:
+                        self._append(data)
+        except Exception as e:
+            print(f"Read-ahead failed: {e}")
+        finally:
+            with self._lock:
+                self.filling = False
+
+    def cleanup(self):
+        self.closed = True
+        with self._lock:
+            self.frames = []
+            self.bytes = 0
+        self.source.cleanup()
@@ -0,0 +1,218 @@
+# Sharded deployment: runs the bot as several worker processes, each one an
+# AutoShardedBot for a contiguous range of shards, so voice, extraction and
+# progress edits for different guilds don't share one interpreter and GIL.
+#
+#   SHARD_COUNT=8 SHARD_WORKERS=4 python shards.py
+#
+# Each worker is `python bot.py` with SHARD_COUNT/SHARD_IDS set and its own
+# health server port (PORT + 1 + worker index). The supervisor restarts
+# workers that exit, and serves an aggregated /health and /metrics on PORT.
+# Guild state lives in the worker that owns the guild's shard; playlists and
+# checkpoints come from the shared store (Mongo, or the SQLite file in WAL mode).
+import asyncio
+import os
+import signal
+import sys
+import time
+
+# Discord allows one IDENTIFY per 5 seconds (per max_concurrency bucket)
+IDENTIFY_INTERVAL = 5.0
+
+
+def shard_for(guild_id, shard_count):
+    return (guild_id >> 22) % shard_count
+
+
+# "0-3,6" -> [0, 1, 2, 3, 6]
+def parse_shard_ids(text):
+    ids = []
+    for part in text.replace(' ', '').split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        ids.extend(range(int(first), int(last or first) + 1))
+    return ids
+
+
+# Splits shards 0..shard_count-1 into `workers` contiguous, near-equal ranges
+def partition(shard_count, workers):
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(range(start, end))
+        start = end
+    return ranges
+
+
+def format_shard_ids(shards):
+    return f"{shards.start}-{shards.stop - 1}"
+
+
+# Workers are stopped with SIGTERM (so are containers). discord.py only shuts
+# down cleanly on Ctrl+C, so a worker calls this to run its close() (which
+# saves checkpoints) on SIGTERM as well.
+def close_on_sigterm(loop, close):
+    try:
+        loop.add_signal_handler(signal.SIGTERM, lambda: loop.create_task(close()))
+    except NotImplementedError:
+        # No signal handlers on Windows event loops
+        pass
+
+
+async def recommended_shards(token):
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        async with session.get('https://discord.com/api/v10/gateway/bot',
+                               headers={'Authorization': f'Bot {token}'}) as resp:
+            resp.raise_for_status()
+            return (await resp.json())['shards']
+
+
+class Worker:
+    def __init__(self, index, shards, port, argv):
+        self.index = index
+        self.shards = shards
+        self.port = port
+        self.argv = argv
+        self.process = None
+        self.restarts = 0
+        self.started_at = 0.0
+
+    async def start(self, shard_count):
+        env = dict(os.environ, SHARD_COUNT=str(shard_count), SHARD_IDS=format_shard_ids(self.shards), PORT=str(self.port))
+        self.process = await asyncio.create_subprocess_exec(*self.argv, env=env)
+        self.started_at = time.monotonic()
+        print(f"Worker {self.index} (shards {format_shard_ids(self.shards)}) started, pid {self.process.pid}")
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+
+class Supervisor:
+    def __init__(self, shard_count, workers, port=8080, argv=None):
+        self.shard_count = shard_count
+        self.port = port
+        argv = argv or [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')]
+        self.workers = [Worker(i, shards, port + 1 + i, argv) for i, shards in enumerate(partition(shard_count, workers))]
+        self.stopping = False
+        self._session = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+
+        runner = await self._serve()
+        try:
+            await asyncio.gather(*(self._keep_running(worker) for worker in self.workers))
+        finally:
+            await runner.cleanup()
+            if self._session is not None:
+                await self._session.close()
+
+    async def _keep_running(self, worker):
+        # Stagger the first start so the workers' IDENTIFYs don't collide
+        await asyncio.sleep(IDENTIFY_INTERVAL * sum(len(w.shards) for w in self.workers[:worker.index]))
+        backoff = 1.0
+        while not self.stopping:
+            await worker.start(self.shard_count)
+            code = await worker.process.wait()
+            if self.stopping:
+                break
+            # Only back off for workers that die right away
+            backoff = 1.0 if time.monotonic() - worker.started_at > 60 else min(backoff * 2, 60.0)
+            worker.restarts += 1
+            print(f"Worker {worker.index} exited with {code}, restarting in {backoff:.0f}s")
+            await asyncio.sleep(backoff)
+
+    def stop(self):
+        # Workers save their checkpoints on SIGTERM, see close_on_sigterm
+        self.stopping = True
+        for worker in self.workers:
+            if worker.alive:
+                worker.process.send_signal(signal.SIGTERM)
+
+    async def _serve(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get('/', self.health)
+        app.router.add_get('/health', self.health)
+        app.router.add_get('/metrics', self.metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '0.0.0.0', self.port).start()
+        return runner
+
+    async def _fetch(self, worker, path):
+        import aiohttp
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=3))
+        try:
+            async with self._session.get(f'http://127.0.0.1:{worker.port}{path}') as resp:
+                return resp.status, await resp.text()
+        except Exception as e:
+            return None, str(e)
+
+    async def health(self, request):
+        from aiohttp import web
+        results = await asyncio.gather(*(self._fetch(w, '/health') for w in self.workers))
+        lines = []
+        healthy = True
+        for worker, (status, text) in zip(self.workers, results):
+            healthy = healthy and status == 200
+            lines.append(f"worker {worker.index} (shards {format_shard_ids(worker.shards)}, "
+                         f"{worker.restarts} restarts): {status or 'down'} {text.strip()}")
+        return web.Response(status=200 if healthy else 503, text="\n".join(lines))
+
+    async def metrics(self, request):
+        from aiohttp import web
+        results = await asyncio.gather(*(self._fetch(w, '/metrics') for w in self.workers))
+        text = merge_metrics([(str(w.index), body) for w, (status, body) in zip(self.workers, results) if status == 200])
+        return web.Response(body=text.encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+# Combines the workers' exposition text into one, adding a worker label to
+# every sample and keeping each metric family's samples together
+def merge_metrics(bodies):
+    families = {}  # name -> (header lines, samples)
+    for worker, body in bodies:
+        name = None
+        for line in body.splitlines():
+            if line.startswith('# HELP ') or line.startswith('# TYPE '):
+                name = line.split()[2]
+                headers, _ = families.setdefault(name, ([], []))
+                if line not in headers:
+                    headers.append(line)
+            elif line and not line.startswith('#') and name is not None:
+                brace = line.find('{')
+                space = line.find(' ')
+                if 0 <= brace < space:
+                    line = f'{line[:brace + 1]}worker="{worker}",{line[brace + 1:]}'
+                else:
+                    line = f'{line[:space]}{{worker="{worker}"}}{line[space:]}'
+                families[name][1].append(line)
+    out = []
+    for headers, samples in families.values():
+        out.extend(headers)
+        out.extend(samples)
+    return '\n'.join(out) + '\n'
+
+
+def main():
+    shard_count = int(os.getenv('SHARD_COUNT', 0))
+    if not shard_count:
+        from dotenv import load_dotenv
+        load_dotenv()
+        shard_count = asyncio.run(recommended_shards(os.environ['DISCORD_TOKEN']))
+    workers = int(os.getenv('SHARD_WORKERS', os.cpu_count() or 1))
+    port = int(os.getenv('PORT', 8080))
+    print(f"Running {shard_count} shards in {min(workers, shard_count)} worker processes")
+    asyncio.run(Supervisor(shard_count, workers, port).run())
+
+
+if __name__ == '__main__':
+    main()
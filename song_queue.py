@@ -0,0 +1,110 @@
+import collections
+import itertools
+import random
+
+
+# One queued song. `query` is what gets played (a video URL, or a search for
+# entries nothing was known about); the rest is whatever the flat extraction or
+# a playlist pin already told us, for display.
+class Track:
+    __slots__ = ('query', 'title', 'duration', 'requester')
+
+    def __init__(self, query, title=None, duration=None, requester=None):
+        self.query = query
+        self.title = title
+        self.duration = duration
+        self.requester = requester
+
+    def __repr__(self):
+        return f'Track({self.query!r})'
+
+    # Checkpoints store [query, title, duration, requester], older ones just the query
+    def dump(self):
+        return [self.query, self.title, self.duration, self.requester]
+
+    @classmethod
+    def load(cls, value):
+        if isinstance(value, str):
+            return cls(value)
+        return cls(*value)
+
+
+def as_track(item):
+    return item if isinstance(item, Track) else Track(item)
+
+
+# A guild's queue: a deque of Tracks, so taking the next song and adding
+# pages of a big playlist are O(1) per song. The total length is kept up to
+# date as songs come and go, so showing it is free.
+class SongQueue:
+    def __init__(self, items=()):
+        self._items = collections.deque()
+        self.duration = 0.0  # sum of the known durations
+        self.unknown = 0  # songs without a duration
+        self.extend(items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def _count(self, track, sign):
+        if track.duration:
+            self.duration += sign * track.duration
+        else:
+            self.unknown += sign
+
+    def append(self, item):
+        track = as_track(item)
+        self._items.append(track)
+        self._count(track, 1)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def appendleft(self, item):
+        track = as_track(item)
+        self._items.appendleft(track)
+        self._count(track, 1)
+
+    def popleft(self):
+        track = self._items.popleft()
+        self._count(track, -1)
+        return track
+
+    def clear(self):
+        self._items.clear()
+        self.duration = 0.0
+        self.unknown = 0
+
+    # The first `count` songs from `start`, without copying the rest
+    def page(self, start, count):
+        return list(itertools.islice(self._items, start, start + count))
+
+    def head(self, count):
+        return self.page(0, count)
+
+    def shuffle(self):
+        items = list(self._items)
+        random.shuffle(items)
+        self._items = collections.deque(items)
+
+    def remove(self, index):
+        track = self._items[index]
+        del self._items[index]
+        self._count(track, -1)
+        return track
+
+    def move(self, src, dst):
+        track = self._items[src]
+        del self._items[src]
+        self._items.insert(dst, track)
+        return track
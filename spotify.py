@@ -0,0 +1,117 @@
+import asyncio
+import html
+import re
+
+import aiohttp
+
+from cache import TTLCache
+
+SPOTIFY_URL_RE = re.compile(r'https?://open\.spotify\.com/(?:intl-[a-z-]+/)?(track|album|playlist)/([A-Za-z0-9]+)')
+TITLE_RE = re.compile(r'<title>(.*?)</title>', re.S)
+# Album and playlist pages list their tracks as <meta name="music:song" content="...">
+SONG_META_RE = re.compile(r'<meta[^>]+name="music:song"[^>]+content="([^"]+)"')
+
+
+# Turns Spotify links into YouTube searches by reading the public Spotify page.
+# One pooled HTTP session is shared by every lookup and results are cached, so
+# the same link showing up again (or being resolved twice per /play) is free.
+# `origin` can point at a local stand-in that serves recorded pages.
+class SpotifyResolver:
+    def __init__(self, origin='https://open.spotify.com', cache_size=4096, ttl=24 * 3600,
+                 concurrency=4, max_tracks=1000):
+        self.origin = origin.rstrip('/')
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.concurrency = concurrency
+        self.max_tracks = max_tracks
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency * 2, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=10),
+                headers={'User-Agent': 'Mozilla/5.0 (compatible; music-bot)'},
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def match(self, query):
+        m = SPOTIFY_URL_RE.search(query)
+        return (m.group(1), m.group(2)) if m else None
+
+    def is_collection(self, query):
+        m = self.match(query)
+        return m is not None and m[0] in ('album', 'playlist')
+
+    async def _fetch(self, kind, spotify_id):
+        async with self._get_session().get(f"{self.origin}/{kind}/{spotify_id}") as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"Spotify returned HTTP {resp.status} for {kind}/{spotify_id}")
+            return await resp.text()
+
+    async def _search_query(self, spotify_id):
+        text = await self._fetch('track', spotify_id)
+        # Simple Title tag: <title>Song - song by Artist | Spotify</title>
+        m = TITLE_RE.search(text)
+        if not m:
+            return None
+        title = html.unescape(m.group(1)).strip()
+        # Clean up common spotify title suffixes
+        title = title.replace(" - song by", "")
+        title = title.replace(" | Spotify", "")
+        return f"ytsearch:{title}"
+
+    # Single track link -> "ytsearch:Song Artist". Anything else is returned as is.
+    async def resolve_track(self, query):
+        m = self.match(query)
+        if not m or m[0] != 'track':
+            return query
+        return await self._resolve_id(m[1]) or query
+
+    async def _resolve_id(self, track_id):
+        try:
+            return await self.cache.get_or_load(('track', track_id), lambda: self._search_query(track_id))
+        except Exception as e:
+            print(f"Failed to resolve Spotify track {track_id}: {e}")
+            return None
+
+    async def _track_ids(self, kind, spotify_id):
+        text = await self._fetch(kind, spotify_id)
+        ids = []
+        for url in SONG_META_RE.findall(text):
+            m = self.match(url)
+            if m and m[0] == 'track' and m[1] not in ids:
+                ids.append(m[1])
+        return ids[:self.max_tracks]
+
+    # Album/playlist link -> async iterator of YouTube searches, in album order.
+    # Tracks are resolved `concurrency` at a time; the first one is yielded as
+    # soon as it's ready instead of after the whole album.
+    async def expand(self, query):
+        m = self.match(query)
+        if not m:
+            return
+        if m[0] == 'track':
+            yield await self.resolve_track(query)
+            return
+
+        ids = await self.cache.get_or_load(m, lambda: self._track_ids(*m))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def resolve(track_id):
+            async with semaphore:
+                return await self._resolve_id(track_id)
+
+        tasks = [asyncio.ensure_future(resolve(track_id)) for track_id in ids]
+        try:
+            for task in tasks:
+                result = await task
+                if result:
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
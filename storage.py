@@ -0,0 +1,667 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from cache import TTLCache
+
+
+def _snapshot(playlists):
+    # Copy handed to the storage thread, so the loop can keep mutating the cached one
+    return {name: list(songs) for name, songs in playlists.items()}
+
+
+def _safe_field(name):
+    # Mongo can't address keys containing '.' or starting with '$' in a field path
+    return bool(name) and not name.startswith('$') and '.' not in name and '\0' not in name
+
+
+# Shared, lazily connected Mongo database. pymongo is only imported and the
+# client only created the first time a backend needs a collection, which
+# happens on a storage thread rather than at import time.
+class MongoDatabase:
+    def __init__(self, uri, name='music_bot'):
+        self.uri = uri
+        self.name = name
+        self._db = None
+        self._lock = threading.Lock()
+
+    def __getitem__(self, collection):
+        with self._lock:
+            if self._db is None:
+                from pymongo import MongoClient
+                client = MongoClient(self.uri, serverSelectionTimeoutMS=10000)
+                client.admin.command('ping')
+                self._db = client[self.name]
+                print("Connected to MongoDB.")
+        return self._db[collection]
+
+
+# Playlists live in Mongo as one document per user:
+#   {'user_id': '123', 'playlists': {'name': [song, ...]}}
+# Every change is a single $set/$unset/$push on that user's document.
+class MongoPlaylistBackend:
+    def __init__(self, db, collection='playlists', migrate_from=None):
+        self.db = db
+        self.collection = collection
+        self.migrate_from = migrate_from
+        self.col = None
+
+    def setup(self):
+        self.col = self.db[self.collection]
+        try:
+            self.col.create_index('user_id', unique=True)
+        except Exception as e:
+            print(f"Could not create playlists index: {e}")
+
+        # One-off import of a leftover local playlists.json
+        if self.migrate_from and os.path.exists(self.migrate_from):
+            try:
+                with open(self.migrate_from, 'r') as f:
+                    data = json.load(f)
+                for user_id, playlists in data.items():
+                    self.col.update_one({'user_id': user_id}, {'$setOnInsert': {'playlists': playlists}}, upsert=True)
+                os.replace(self.migrate_from, self.migrate_from + '.migrated')
+                print(f"Migrated {len(data)} users' playlists from {self.migrate_from} to MongoDB.")
+            except Exception as e:
+                print(f"Failed to migrate {self.migrate_from}: {e}")
+
+    def load_user(self, user_id):
+        doc = self.col.find_one({'user_id': user_id}, {'playlists': 1})
+        return doc.get('playlists', {}) if doc else {}
+
+    def _update(self, user_id, name, update, playlists):
+        if not _safe_field(name):
+            update = {'$set': {'playlists': playlists}}
+        self.col.update_one({'user_id': user_id}, update, upsert=True)
+
+    def create_playlist(self, user_id, name, playlists):
+        self._update(user_id, name, {'$set': {f'playlists.{name}': []}}, playlists)
+
+    def delete_playlist(self, user_id, name, playlists):
+        self._update(user_id, name, {'$unset': {f'playlists.{name}': ''}}, playlists)
+
+    def add_song(self, user_id, name, song, playlists):
+        self._update(user_id, name, {'$push': {f'playlists.{name}': song}}, playlists)
+
+    def load_all(self):
+        if self.col is None:
+            self.setup()
+        return {doc['user_id']: doc.get('playlists', {}) for doc in self.col.find()}
+
+    def save_all(self, data):
+        if self.col is None:
+            self.setup()
+        for user_id, playlists in data.items():
+            self.col.update_one({'user_id': user_id}, {'$set': {'playlists': playlists}}, upsert=True)
+
+
+# Local fallback: the whole playlists.json, kept in memory after the first read
+class JsonPlaylistBackend:
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+
+    def setup(self):
+        self._data = self.load_all()
+
+    def load_user(self, user_id):
+        return _snapshot(self._data.get(user_id, {}))
+
+    def _store_user(self, user_id, playlists):
+        self._data[user_id] = playlists
+        self.save_all(self._data)
+
+    def create_playlist(self, user_id, name, playlists):
+        self._store_user(user_id, playlists)
+
+    def delete_playlist(self, user_id, name, playlists):
+        self._store_user(user_id, playlists)
+
+    def add_song(self, user_id, name, song, playlists):
+        self._store_user(user_id, playlists)
+
+    def load_all(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    return json.load(f)
+            except Exception:
+                return {}
+        return {}
+
+    def save_all(self, data):
+        with open(self.path, 'w') as f:
+            json.dump(data, f, indent=4)
+
+
+# Local default: SQLite in WAL mode. Each change is one small transaction, so a
+# crash can't leave a half-written file behind and the cost of a write doesn't
+# grow with the number of playlists stored.
+class SqlitePlaylistBackend:
+    def __init__(self, path, migrate_from=None):
+        self.path = path
+        self.migrate_from = migrate_from
+        self.conn = None
+
+    def setup(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS playlists (
+                    user_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    PRIMARY KEY (user_id, name)
+                )""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS playlist_songs (
+                    user_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    song TEXT NOT NULL,
+                    PRIMARY KEY (user_id, name, position)
+                ) WITHOUT ROWID""")
+
+        # One-off import of the old playlists.json
+        if self.migrate_from and os.path.exists(self.migrate_from):
+            if self.conn.execute('SELECT 1 FROM playlists LIMIT 1').fetchone() is None:
+                try:
+                    with open(self.migrate_from, 'r') as f:
+                        data = json.load(f)
+                    self.save_all(data)
+                    os.replace(self.migrate_from, self.migrate_from + '.migrated')
+                    print(f"Migrated {len(data)} users' playlists from {self.migrate_from} to {self.path}.")
+                except Exception as e:
+                    print(f"Failed to migrate {self.migrate_from}: {e}")
+
+    def load_user(self, user_id):
+        playlists = {}
+        for (name,) in self.conn.execute('SELECT name FROM playlists WHERE user_id = ? ORDER BY rowid', (user_id,)):
+            playlists[name] = []
+        rows = self.conn.execute(
+            'SELECT name, song FROM playlist_songs WHERE user_id = ? ORDER BY name, position', (user_id,))
+        for name, song in rows:
+            playlists.setdefault(name, []).append(song)
+        return playlists
+
+    def create_playlist(self, user_id, name, playlists):
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO playlists (user_id, name) VALUES (?, ?)', (user_id, name))
+
+    def delete_playlist(self, user_id, name, playlists):
+        with self.conn:
+            self.conn.execute('DELETE FROM playlists WHERE user_id = ? AND name = ?', (user_id, name))
+            self.conn.execute('DELETE FROM playlist_songs WHERE user_id = ? AND name = ?', (user_id, name))
+
+    def add_song(self, user_id, name, song, playlists):
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO playlist_songs (user_id, name, position, song)
+                SELECT ?, ?, COALESCE(MAX(position), -1) + 1, ?
+                FROM playlist_songs WHERE user_id = ? AND name = ?""",
+                (user_id, name, song, user_id, name))
+
+    def load_all(self):
+        if self.conn is None:
+            self.setup()
+        data = {}
+        for user_id, name in self.conn.execute('SELECT user_id, name FROM playlists ORDER BY rowid'):
+            data.setdefault(user_id, {})[name] = []
+        for user_id, name, song in self.conn.execute(
+                'SELECT user_id, name, song FROM playlist_songs ORDER BY user_id, name, position'):
+            data.setdefault(user_id, {}).setdefault(name, []).append(song)
+        return data
+
+    def save_all(self, data):
+        if self.conn is None:
+            self.setup()
+        with self.conn:
+            self.conn.execute('DELETE FROM playlists')
+            self.conn.execute('DELETE FROM playlist_songs')
+            for user_id, playlists in data.items():
+                for name, songs in playlists.items():
+                    self.conn.execute('INSERT INTO playlists (user_id, name) VALUES (?, ?)', (user_id, name))
+                    self.conn.executemany(
+                        'INSERT INTO playlist_songs (user_id, name, position, song) VALUES (?, ?, ?, ?)',
+                        [(user_id, name, i, song) for i, song in enumerate(songs)])
+
+
+# Runs a synchronous backend on its own storage thread, which keeps it off the
+# event loop and applies writes in order. backend.setup() runs before anything else.
+class ThreadedStore:
+    def __init__(self, backend, name='storage'):
+        self.backend = backend
+        self._executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix=name)
+        self._setup = None
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        if self._setup is None:
+            self._setup = loop.run_in_executor(self._executor, self.backend.setup)
+        try:
+            await self._setup
+        except Exception:
+            # e.g. Mongo unreachable: try connecting again on the next call
+            self._setup = None
+            raise
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    # Connect/open in the background ahead of the first real request
+    async def warm_up(self):
+        try:
+            await self._run(lambda: None)
+        except Exception as e:
+            print(f"{type(self.backend).__name__} setup failed: {e}")
+
+
+# What the playlist commands get when storage fails; the message is for the user
+class PlaylistsUnavailable(Exception):
+    pass
+
+
+# Async, cached access to playlists for the command handlers.
+# Reads come from a per-user write-through cache in front of the backend. When
+# other processes write to the same backend (sharded workers), use a short
+# `ttl` (0 disables caching) so changes made elsewhere show up.
+class PlaylistStore(ThreadedStore):
+    def __init__(self, backend, cache_size=10000, ttl=float('inf')):
+        super().__init__(backend, name='playlists')
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+
+    async def _write(self, user_id, fn, *args):
+        try:
+            await self._run(fn, *args)
+        except Exception as e:
+            # Don't keep serving a change that never made it to storage
+            self.cache.pop(user_id)
+            print(f"Saving playlists for {user_id} failed: {e}")
+            raise PlaylistsUnavailable("Couldn't save your playlist right now, please try again later.") from e
+
+    # Returns the user's {name: [songs]} dict. Treat it as read-only.
+    async def get_user(self, user_id):
+        try:
+            return await self.cache.get_or_load(user_id, lambda: self._run(self.backend.load_user, user_id))
+        except Exception as e:
+            print(f"Loading playlists for {user_id} failed: {e}")
+            raise PlaylistsUnavailable("Couldn't load your playlists right now, please try again later.") from e
+
+    async def create(self, user_id, name):
+        playlists = await self.get_user(user_id)
+        if name in playlists:
+            return False
+        playlists[name] = []
+        await self._write(user_id, self.backend.create_playlist, user_id, name, _snapshot(playlists))
+        return True
+
+    async def delete(self, user_id, name):
+        playlists = await self.get_user(user_id)
+        if name not in playlists:
+            return False
+        del playlists[name]
+        await self._write(user_id, self.backend.delete_playlist, user_id, name, _snapshot(playlists))
+        return True
+
+    async def add_song(self, user_id, name, song):
+        playlists = await self.get_user(user_id)
+        if name not in playlists:
+            return False
+        playlists[name].append(song)
+        await self._write(user_id, self.backend.add_song, user_id, name, song, _snapshot(playlists))
+        return True
+
+    # Every user's playlists, straight from the backend (for background jobs)
+    async def load_all(self):
+        return await self._run(self.backend.load_all)
+
+
+# Per-guild playback checkpoints (queue, current track and position), so a
+# machine stop or redeploy doesn't lose everyone's queue. Written in batches.
+class MongoCheckpointBackend:
+    def __init__(self, db, collection='checkpoints'):
+        self.db = db
+        self.collection = collection
+        self.col = None
+
+    def setup(self):
+        self.col = self.db[self.collection]
+        try:
+            self.col.create_index('guild_id', unique=True)
+        except Exception as e:
+            print(f"Could not create checkpoints index: {e}")
+
+    def load(self, guild_id):
+        return self.col.find_one({'guild_id': guild_id}, {'_id': 0})
+
+    def save_many(self, batch):
+        from pymongo import DeleteOne, ReplaceOne
+        ops = []
+        for guild_id, checkpoint in batch.items():
+            if checkpoint is None:
+                ops.append(DeleteOne({'guild_id': guild_id}))
+            else:
+                ops.append(ReplaceOne({'guild_id': guild_id}, dict(checkpoint, guild_id=guild_id), upsert=True))
+        if ops:
+            self.col.bulk_write(ops, ordered=False)
+
+
+class SqliteCheckpointBackend:
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+
+    def setup(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    guild_id INTEGER PRIMARY KEY,
+                    data TEXT NOT NULL
+                )""")
+
+    def load(self, guild_id):
+        row = self.conn.execute('SELECT data FROM checkpoints WHERE guild_id = ?', (guild_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_many(self, batch):
+        with self.conn:
+            self.conn.executemany('DELETE FROM checkpoints WHERE guild_id = ?',
+                                  [(guild_id,) for guild_id, checkpoint in batch.items() if checkpoint is None])
+            self.conn.executemany('INSERT OR REPLACE INTO checkpoints (guild_id, data) VALUES (?, ?)',
+                                  [(guild_id, json.dumps(checkpoint)) for guild_id, checkpoint in batch.items()
+                                   if checkpoint is not None])
+
+
+class CheckpointStore(ThreadedStore):
+    def __init__(self, backend):
+        super().__init__(backend, name='checkpoints')
+
+    async def load(self, guild_id):
+        return await self._run(self.backend.load, guild_id)
+
+    # batch: guild_id -> checkpoint dict, or None to forget the guild
+    async def save_many(self, batch):
+        await self._run(self.backend.save_many, batch)
+
+
+# Small key/value store for bookkeeping that has to survive restarts
+# (e.g. the hash of the last synced command tree)
+class MongoKeyValueBackend:
+    def __init__(self, db, collection='meta'):
+        self.db = db
+        self.collection = collection
+        self.col = None
+
+    def setup(self):
+        self.col = self.db[self.collection]
+
+    def get(self, key):
+        doc = self.col.find_one({'_id': key})
+        return doc['value'] if doc else None
+
+    def set(self, key, value):
+        self.col.update_one({'_id': key}, {'$set': {'value': value}}, upsert=True)
+
+
+class SqliteKeyValueBackend:
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+
+    def setup(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def get(self, key):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+
+class KeyValueStore(ThreadedStore):
+    def __init__(self, backend):
+        super().__init__(backend, name='meta')
+
+    async def get(self, key):
+        return await self._run(self.backend.get, key)
+
+    async def set(self, key, value):
+        await self._run(self.backend.set, key, value)
+
+
+# Search query -> chosen YouTube video, so repeat searches ("despacito",
+# Spotify tracks rewritten to ytsearch:...) skip the YouTube search. Entries
+# expire after a TTL; past `max_entries` the least used ones are evicted.
+class MongoSearchBackend:
+    def __init__(self, db, collection='search_cache'):
+        self.db = db
+        self.collection = collection
+        self.col = None
+
+    def setup(self):
+        self.col = self.db[self.collection]
+        try:
+            # Mongo removes expired entries by itself
+            self.col.create_index('expires_at', expireAfterSeconds=0)
+            self.col.create_index([('hits', 1), ('last_used', 1)])
+        except Exception as e:
+            print(f"Could not create search cache indexes: {e}")
+
+    def get(self, query, now):
+        import datetime
+        return self.col.find_one_and_update(
+            {'_id': query, 'expires_at': {'$gt': datetime.datetime.fromtimestamp(now, datetime.timezone.utc)}},
+            {'$inc': {'hits': 1}, '$set': {'last_used': now}},
+            {'_id': 0, 'video_id': 1, 'title': 1, 'duration': 1})
+
+    def put(self, query, entry, now, ttl):
+        import datetime
+        expires_at = datetime.datetime.fromtimestamp(now + ttl, datetime.timezone.utc)
+        self.col.update_one({'_id': query},
+                            {'$set': dict(entry, expires_at=expires_at, last_used=now), '$setOnInsert': {'hits': 0}},
+                            upsert=True)
+
+    def prune(self, now, max_entries):
+        excess = self.col.estimated_document_count() - max_entries
+        if excess <= 0:
+            return 0
+        ids = [doc['_id'] for doc in self.col.find({}, {'_id': 1}).sort([('hits', 1), ('last_used', 1)]).limit(excess)]
+        return self.col.delete_many({'_id': {'$in': ids}}).deleted_count
+
+
+class SqliteSearchBackend:
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+
+    def setup(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    query TEXT PRIMARY KEY,
+                    video_id TEXT NOT NULL,
+                    title TEXT,
+                    duration REAL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )""")
+            self.conn.execute('CREATE INDEX IF NOT EXISTS search_cache_usage ON search_cache (hits, last_used)')
+
+    def get(self, query, now):
+        with self.conn:
+            row = self.conn.execute('SELECT video_id, title, duration FROM search_cache WHERE query = ? AND expires_at > ?',
+                                    (query, now)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute('UPDATE search_cache SET hits = hits + 1, last_used = ? WHERE query = ?', (now, query))
+        return {'video_id': row[0], 'title': row[1], 'duration': row[2]}
+
+    def put(self, query, entry, now, ttl):
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO search_cache (query, video_id, title, duration, expires_at, last_used) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (query) DO UPDATE SET video_id = excluded.video_id, title = excluded.title,
+                    duration = excluded.duration, expires_at = excluded.expires_at, last_used = excluded.last_used""",
+                (query, entry['video_id'], entry.get('title'), entry.get('duration'), now + ttl, now))
+
+    def prune(self, now, max_entries):
+        with self.conn:
+            removed = self.conn.execute('DELETE FROM search_cache WHERE expires_at <= ?', (now,)).rowcount
+            removed += self.conn.execute("""
+                DELETE FROM search_cache WHERE query IN (
+                    SELECT query FROM search_cache ORDER BY hits, last_used
+                    LIMIT max(0, (SELECT count(*) FROM search_cache) - ?))""", (max_entries,)).rowcount
+        return removed
+
+
+class SearchCache(ThreadedStore):
+    def __init__(self, backend, ttl=30 * 24 * 3600, max_entries=50000, prune_every=500):
+        super().__init__(backend, name='search-cache')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self._puts = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evictions = 0
+        self.errors = 0
+
+    # {'video_id', 'title', 'duration'} for a normalized query, or None.
+    # Storage problems count as a miss: the search just runs as usual.
+    async def get(self, query):
+        try:
+            entry = await self._run(self.backend.get, query, time.time())
+        except Exception as e:
+            self.errors += 1
+            print(f"Search cache lookup failed: {e}")
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def put(self, query, entry):
+        try:
+            await self._run(self.backend.put, query, entry, time.time(), self.ttl)
+            self.stored += 1
+            self._puts += 1
+            if (self._puts - 1) % self.prune_every == 0:
+                self.evictions += await self._run(self.backend.prune, time.time(), self.max_entries)
+        except Exception as e:
+            self.errors += 1
+            print(f"Search cache write failed: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'stored': self.stored,
+            'evictions': self.evictions,
+            'errors': self.errors,
+        }
+
+
+# Saved playlist entries resolved to a canonical video: query -> {'video_id',
+# 'title', 'duration'}. Keyed by the entry's text, so the same song saved in
+# several playlists (or by several users) is resolved once.
+class MongoPinBackend:
+    def __init__(self, db, collection='playlist_pins'):
+        self.db = db
+        self.collection = collection
+        self.col = None
+
+    def setup(self):
+        self.col = self.db[self.collection]
+
+    def get_many(self, queries):
+        docs = self.col.find({'_id': {'$in': list(queries)}})
+        return {doc['_id']: {'video_id': doc['video_id'], 'title': doc.get('title'), 'duration': doc.get('duration')}
+                for doc in docs}
+
+    def load_all(self):
+        return {doc['_id']: {'video_id': doc['video_id'], 'title': doc.get('title'), 'duration': doc.get('duration')}
+                for doc in self.col.find()}
+
+    def put_many(self, pins):
+        from pymongo import ReplaceOne
+        if pins:
+            self.col.bulk_write([ReplaceOne({'_id': query}, dict(pin, resolved_at=time.time()), upsert=True)
+                                 for query, pin in pins.items()], ordered=False)
+
+
+class SqlitePinBackend:
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+
+    def setup(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS playlist_pins (
+                    query TEXT PRIMARY KEY,
+                    video_id TEXT NOT NULL,
+                    title TEXT,
+                    duration REAL,
+                    resolved_at REAL NOT NULL
+                )""")
+
+    def get_many(self, queries):
+        queries = list(queries)
+        pins = {}
+        # Stay under SQLite's bound parameter limit
+        for i in range(0, len(queries), 500):
+            chunk = queries[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT query, video_id, title, duration FROM playlist_pins WHERE query IN ({','.join('?' * len(chunk))})",
+                chunk)
+            for query, video_id, title, duration in rows:
+                pins[query] = {'video_id': video_id, 'title': title, 'duration': duration}
+        return pins
+
+    def load_all(self):
+        return {query: {'video_id': video_id, 'title': title, 'duration': duration} for query, video_id, title, duration
+                in self.conn.execute('SELECT query, video_id, title, duration FROM playlist_pins')}
+
+    def put_many(self, pins):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO playlist_pins (query, video_id, title, duration, resolved_at) VALUES (?, ?, ?, ?, ?)',
+                [(query, pin['video_id'], pin.get('title'), pin.get('duration'), now) for query, pin in pins.items()])
+
+
+class PinStore(ThreadedStore):
+    def __init__(self, backend):
+        super().__init__(backend, name='pins')
+
+    async def get_many(self, queries):
+        return await self._run(self.backend.get_many, queries)
+
+    async def put_many(self, pins):
+        await self._run(self.backend.put_many, pins)
+
+    async def load_all(self):
+        return await self._run(self.backend.load_all)
@@ -0,0 +1,40 @@
+# Stands in for `python bot.py` under shards.Supervisor in test_shards.py: the
+# Music cog on the benchmark fakes, playing in this worker's share of the test
+# guilds, with /metrics served on PORT. On SIGTERM it saves every guild to
+# CHECKPOINT_DB, the way MusicBot.close does, and exits.
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.load import Harness, shard_guild_ids  # noqa: E402  (sets up the bot's storage first)
+from benchmarks.fakes import FakeSources, FakeYoutube  # noqa: E402
+import bot  # noqa: E402
+from health import HealthServer  # noqa: E402
+from shards import close_on_sigterm, parse_shard_ids, shard_for  # noqa: E402
+
+
+async def main():
+    shard_count = int(os.environ['SHARD_COUNT'])
+    shards = set(parse_shard_ids(os.environ['SHARD_IDS']))
+    guild_ids = [g for g in shard_guild_ids(int(os.environ['TEST_GUILDS'])) if shard_for(g, shard_count) in shards]
+
+    stopped = asyncio.Event()
+    youtube = FakeYoutube(0.01, 0.01, track_seconds=600)
+    async with Harness('worker', youtube, FakeSources(), latency=0.01, checkpoint_db=os.environ['CHECKPOINT_DB']) as h:
+        async def close():
+            await h.music.checkpoint_now(all_guilds=True)
+            stopped.set()
+        close_on_sigterm(asyncio.get_running_loop(), close)
+
+        for guild_id in guild_ids:
+            await h.play(h.guild(guild_id), f'https://www.youtube.com/playlist?list=FAKE3&guild={guild_id}')
+        health = HealthServer(h.bot, bot.loop_lag, port=int(os.environ['PORT']))
+        await health.start()
+        await stopped.wait()
+        await health.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import pytest
+
+from cache import TTLCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert 'a' in cache and 'c' in cache
+    assert 'b' not in cache
+
+
+def test_expired_entries_are_dropped():
+    cache = TTLCache(ttl=0.01)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=0)
+    assert cache.get('a') == 1
+    assert 'b' not in cache
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_concurrent_loads_of_one_key_are_coalesced():
+    cache = TTLCache()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'value'
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_load('k', loader) for _ in range(10)))
+        return results + [await cache.get_or_load('k', loader)]
+
+    assert asyncio.run(scenario()) == ['value'] * 11
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats['misses'], stats['coalesced'], stats['hits']) == (1, 9, 1)
+
+
+def test_failed_loads_are_shared_but_not_cached():
+    cache = TTLCache()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError('down')
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_load('k', loader) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        with pytest.raises(RuntimeError):
+            await cache.get_or_load('k', loader)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert 'k' not in cache
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_load():
+    cache = TTLCache()
+
+    async def loader():
+        await asyncio.sleep(0.02)
+        return 'value'
+
+    async def scenario():
+        impatient = asyncio.ensure_future(cache.get_or_load('k', loader))
+        patient = asyncio.ensure_future(cache.get_or_load('k', loader))
+        await asyncio.sleep(0)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(scenario()) == 'value'
+    assert cache.get('k') == 'value'
@@ -0,0 +1,54 @@
+import asyncio
+import os
+
+from disk_cache import OpusDiskCache
+
+
+def test_play_counts_admit_popular_tracks_and_stay_bounded(tmp_path):
+    cache = OpusDiskCache(str(tmp_path), 10 ** 9, admit_after=2, max_tracked=3)
+    stored = []
+    cache.store = lambda video_id, data: stored.append(video_id)
+
+    async def scenario():
+        await cache.load()
+        for video_id in ['a', 'b', 'c', 'a', 'd', 'e']:
+            cache.record_play(video_id, {})
+
+    asyncio.run(scenario())
+    assert stored == ['a']
+    assert list(cache.plays) == ['a', 'd', 'e']
+
+
+def _fake_ffmpeg(tmp_path, size):
+    # Writes `size` bytes to the output path, which ffmpeg gets last
+    script = tmp_path / 'ffmpeg'
+    script.write_text(f'#!/bin/sh\nfor last; do :; done\nhead -c {size} /dev/zero > "$last"\n')
+    script.chmod(0o755)
+    return str(script)
+
+
+def test_writes_lookups_and_eviction(tmp_path):
+    directory = tmp_path / 'cache'
+    cache = OpusDiskCache(str(directory), 250, ffmpeg=_fake_ffmpeg(tmp_path, 100))
+
+    async def scenario():
+        await cache.load()
+        for video_id in ('a', 'b'):
+            await cache.store(video_id, {'url': f'https://example.com/{video_id}', 'title': video_id})
+        assert (await cache.lookup('a'))[1]['title'] == 'a'
+        # 'b' is now the least recently played
+        await cache.store('c', {'url': 'https://example.com/c', 'title': 'c'})
+        return await cache.lookup('b')
+
+    assert asyncio.run(scenario()) is None
+    assert sorted(os.listdir(directory)) == ['a.json', 'a.ogg', 'c.json', 'c.ogg']
+    assert (cache.bytes, cache.evictions, cache.writes) == (200, 1, 3)
+
+    os.remove(directory / 'a.ogg')
+
+    async def lookup_deleted():
+        return await cache.lookup('a')
+
+    assert asyncio.run(lookup_deleted()) is None
+    assert not cache.has('a')
+    assert cache.bytes == 100
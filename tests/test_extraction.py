@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+import extraction
+from extraction import BACKGROUND, INTERACTIVE, ExtractionPool, ExtractionQueueFull
+
+
+@pytest.fixture
+def ran(monkeypatch):
+    ran = []
+
+    def run(profile, options, query, download, overrides):
+        ran.append(query)
+        return {'query': query}
+
+    monkeypatch.setattr(extraction, '_run_extract', run)
+    return ran
+
+
+def _submit(pool, jobs):
+    # Queues every job before the (single) dispatcher gets to run
+    async def scenario():
+        try:
+            return await asyncio.gather(*(pool.extract(query, guild_id=guild, priority=priority)
+                                          for query, guild, priority in jobs))
+        finally:
+            pool.shutdown()
+    return asyncio.run(scenario())
+
+
+def test_guilds_take_turns_and_interactive_goes_first(ran):
+    pool = ExtractionPool({'stream': {}}, workers=1)
+    jobs = [('bg', 3, BACKGROUND)]
+    jobs += [(f'a{i}', 1, INTERACTIVE) for i in range(3)]
+    jobs += [(f'b{i}', 2, INTERACTIVE) for i in range(2)]
+    results = _submit(pool, jobs)
+    assert [r['query'] for r in results] == [query for query, _, _ in jobs]
+    assert ran == ['a0', 'b0', 'a1', 'b1', 'a2', 'bg']
+    assert pool.completed == [5, 1]
+
+
+def test_full_lane_rejects_without_touching_the_other(ran):
+    pool = ExtractionPool({'stream': {}}, workers=1, max_queue=2)
+
+    async def scenario():
+        try:
+            waiting = [asyncio.ensure_future(pool.extract(f'q{i}', guild_id=1)) for i in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(ExtractionQueueFull):
+                await pool.extract('q2', guild_id=1)
+            await pool.extract('bg', guild_id=1, priority=BACKGROUND)
+            await asyncio.gather(*waiting)
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
+    assert pool.rejected == [1, 0]
+    assert sorted(ran) == ['bg', 'q0', 'q1']
+
+
+def test_cancelled_jobs_are_skipped(ran):
+    pool = ExtractionPool({'stream': {}}, workers=1)
+
+    async def scenario():
+        try:
+            first = asyncio.ensure_future(pool.extract('first', guild_id=1))
+            gone = asyncio.ensure_future(pool.extract('gone', guild_id=1))
+            await asyncio.sleep(0)
+            gone.cancel()
+            await first
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
+    assert ran == ['first']
+
+
+def test_playlist_is_listed_once_a_page_per_job(ran, monkeypatch):
+    opened = []
+    read = []
+
+    def open_playlist(options, query):
+        opened.append(query)
+        for n in range(1, 24):
+            read.append(n)
+            yield {'id': str(n)}
+
+    monkeypatch.setattr(extraction, '_open_playlist', open_playlist)
+    pool = ExtractionPool({'flat': {}, 'stream': {}}, workers=1)
+
+    async def scenario():
+        try:
+            pages = []
+            async for page in pool.playlist_pages('list', 3, 15, 5, guild_id=1):
+                pages.append([entry['id'] for entry in page])
+                if len(pages) == 1:
+                    # The walk doesn't hold the only worker between pages
+                    await pool.extract('other', guild_id=2, priority=BACKGROUND)
+            return pages
+        finally:
+            pool.shutdown()
+
+    pages = asyncio.run(scenario())
+    assert opened == ['list']
+    assert pages == [[str(n) for n in range(start, start + 5)] for start in (3, 8, 13)]
+    assert ran == ['other']
+    # Stopped at the limit instead of reading the rest of the playlist
+    assert read[-1] <= 18
+    assert pool.completed == [0, 5]
@@ -0,0 +1,88 @@
+import discord
+
+from gapless import Prebuffered, TrackChain, unwrap
+from seek_buffer import SeekBuffer
+
+
+class Frames(discord.AudioSource):
+    def __init__(self, name, count):
+        self.frames = [f'{name}{i}'.encode() for i in range(count)]
+        self.cleaned = False
+
+    def read(self):
+        return self.frames.pop(0) if self.frames else b''
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+def _chain(source):
+    switches = []
+    chain = TrackChain(source, lambda chain, source, *times: switches.append(source))
+    return chain, switches
+
+
+def test_prepared_track_starts_on_the_next_frame():
+    a, b = Frames('a', 2), Frames('b', 2)
+    upcoming = Prebuffered(b)
+    assert upcoming.fill(5) == 2
+    chain, switches = _chain(a)
+    chain.set_next(upcoming)
+    assert [chain.read() for _ in range(4)] == [b'a0', b'a1', b'b0', b'b1']
+    assert switches == [upcoming]
+    assert a.cleaned and not b.cleaned
+    assert chain.read() == b''
+
+
+def test_skip_moves_on_only_when_something_is_ready():
+    a, b = Frames('a', 10), Frames('b', 10)
+    chain, switches = _chain(a)
+    assert chain.read() == b'a0'
+    assert not chain.skip()
+    assert chain.read() == b'a1'
+    chain.set_next(b)
+    assert chain.skip()
+    assert chain.read() == b'b0'
+    assert switches == [b]
+    assert a.cleaned
+
+
+def test_skip_whose_track_is_withdrawn_ends_the_current_one():
+    a, b = Frames('a', 10), Frames('b', 10)
+    chain, switches = _chain(a)
+    chain.set_next(b)
+    assert chain.skip()
+    chain.set_next(None)
+    assert b.cleaned
+    assert not chain.skip_requested
+    assert chain.read() == b''
+    assert switches == []
+
+
+def test_taken_track_drops_a_pending_skip():
+    a, b = Frames('a', 10), Frames('b', 10)
+    chain, _ = _chain(a)
+    chain.set_next(b)
+    chain.skip()
+    assert chain.take_next() is b
+    assert not chain.skip_requested
+    assert chain.read() == b'a0'
+
+
+def test_replacing_the_next_track_cleans_up_the_old_one():
+    chain, _ = _chain(Frames('a', 1))
+    first, second = Frames('b', 1), Frames('c', 1)
+    chain.set_next(first)
+    chain.set_next(second)
+    assert first.cleaned and not second.cleaned
+    chain.cleanup()
+    assert second.cleaned
+
+
+def test_unwrap_sees_through_every_wrapper():
+    source = Frames('a', 1)
+    chain, _ = _chain(Prebuffered(SeekBuffer(source, ahead=0)))
+    assert unwrap(chain) is source
@@ -0,0 +1,35 @@
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_family_matches_its_samples():
+    registry = Registry()
+    seeks = Counter('seeks', 'Seeks', ['served'], registry=registry)
+    seeks.labels('memory').inc()
+    seeks.labels(served='ffmpeg').inc(2)
+    Counter('stalls_total', 'Stalls', registry=registry).inc()
+    assert registry.render().splitlines() == [
+        '# HELP seeks_total Seeks', '# TYPE seeks_total counter',
+        'seeks_total{served="memory"} 1', 'seeks_total{served="ffmpeg"} 2',
+        '# HELP stalls_total Stalls', '# TYPE stalls_total counter',
+        'stalls_total 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP latency_seconds Latency', '# TYPE latency_seconds histogram']
+    assert lines[2:5] == ['latency_seconds_bucket{le="0.1"} 1', 'latency_seconds_bucket{le="1.0"} 2',
+                          'latency_seconds_bucket{le="+Inf"} 3']
+    assert lines[-1] == 'latency_seconds_count 3'
+
+
+def test_gauge_reads_its_callback_at_render_time():
+    registry = Registry()
+    depth = {('a',): 1}
+    Gauge('depth', 'Depth', lambda: depth, ['lane'], registry=registry)
+    depth[('b',)] = 2
+    assert registry.render().splitlines()[2:] == ['depth{lane="a"} 1', 'depth{lane="b"} 2']
@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from progress import ProgressScheduler
+
+
+class Message:
+    def __init__(self, message_id, channel_id, delay=0.0):
+        self.id = message_id
+        self.channel = SimpleNamespace(id=channel_id)
+        self.delay = delay
+        self.edits = []
+
+    async def edit(self, content):
+        await asyncio.sleep(self.delay)
+        self.edits.append(content)
+
+
+def test_one_edit_per_channel_and_unchanged_content_is_skipped():
+    scheduler = ProgressScheduler()
+    a, b = Message(1, 10), Message(2, 10)
+
+    async def scenario():
+        scheduler.tick([(1, a, 'a 0:01', 60), (2, b, 'b 0:01', 60)])
+        await asyncio.sleep(0.01)
+        for state in scheduler.guilds.values():
+            state.next_due = 0
+        scheduler.tick([(1, a, 'a 0:01', 60), (2, b, 'b 0:01', 60)])
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert (a.edits, b.edits) == (['a 0:01'], ['b 0:01'])
+    assert (scheduler.edits, scheduler.dropped, scheduler.unchanged) == (2, 1, 1)
+    assert not scheduler.tasks
+
+
+def test_close_cancels_edits_in_flight():
+    scheduler = ProgressScheduler()
+    slow = Message(1, 10, delay=10)
+
+    async def scenario():
+        scheduler.tick([(1, slow, '0:01', 60)])
+        await asyncio.sleep(0)
+        assert len(scheduler.tasks) == 1
+        scheduler.close()
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert not scheduler.tasks
+    assert scheduler.in_flight == 0
+    assert slow.edits == []
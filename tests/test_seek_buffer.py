@@ -0,0 +1,69 @@
+import time
+
+import discord
+
+from seek_buffer import FRAME_SECONDS, SeekBuffer
+
+
+class Frames(discord.AudioSource):
+    def __init__(self, count):
+        self.frames = [b'%d' % i for i in range(count)]
+        self.reads = 0
+        self.cleaned = False
+
+    def read(self):
+        self.reads += 1
+        return self.frames.pop(0) if self.frames else b''
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+def _read(buffer, count):
+    return [buffer.read() for _ in range(count)]
+
+
+def test_seeks_inside_the_buffer_replay_without_rereading():
+    source = Frames(100)
+    buffer = SeekBuffer(source, start=10.0, ahead=0)
+    assert _read(buffer, 50)[-1] == b'49'
+    assert buffer.seek(10.0 + 20 * FRAME_SECONDS)
+    assert buffer.position == 10.0 + 20 * FRAME_SECONDS
+    assert _read(buffer, 2) == [b'20', b'21']
+    assert source.reads == 50
+
+
+def test_seeks_outside_the_buffer_fail():
+    buffer = SeekBuffer(Frames(100), ahead=0)
+    _read(buffer, 10)
+    assert not buffer.seek(5.0)
+    assert not buffer.seek(-1.0)
+    assert buffer.position == 10 * FRAME_SECONDS
+
+
+def test_seek_past_the_end_of_a_finished_track_ends_it():
+    buffer = SeekBuffer(Frames(5), ahead=0)
+    assert _read(buffer, 6)[-1] == b''
+    assert buffer.seek(60.0)
+    assert buffer.read() == b''
+
+
+def test_played_frames_are_trimmed_to_the_back_window():
+    buffer = SeekBuffer(Frames(2000), back=1.0, ahead=0)
+    _read(buffer, 1000)
+    assert buffer.first > 0
+    assert buffer.cursor - buffer.first <= 1.0 / FRAME_SECONDS + 250
+    assert not buffer.seek(0.0)
+
+
+def test_read_ahead_fills_in_the_background():
+    source = Frames(1000)
+    buffer = SeekBuffer(source, ahead=1.0)
+    assert buffer.read() == b'0'
+    deadline = time.monotonic() + 5
+    while source.reads < 50 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert source.reads >= 50
+    assert _read(buffer, 3) == [b'1', b'2', b'3']
+    buffer.cleanup()
+    assert source.cleaned
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import re
+import socket
+import sys
+
+import aiohttp
+
+import shards
+from benchmarks.load import shard_guild_ids
+from shards import Supervisor, merge_metrics, parse_shard_ids, partition, shard_for
+from storage import CheckpointStore, SqliteCheckpointBackend
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shard_worker.py')
+
+
+def test_parse_shard_ids():
+    assert parse_shard_ids("0-3, 6") == [0, 1, 2, 3, 6]
+    assert parse_shard_ids("") == []
+
+
+def test_partition_covers_every_shard_once():
+    ranges = partition(10, 4)
+    assert [len(r) for r in ranges] == [3, 3, 2, 2]
+    assert [s for r in ranges for s in r] == list(range(10))
+    assert len(partition(2, 8)) == 2
+
+
+def test_merge_metrics_labels_samples_and_keeps_families_together():
+    body = ("# HELP plays_total Plays\n# TYPE plays_total counter\nplays_total 3\n"
+            "# HELP lag Lag\n# TYPE lag gauge\nlag{guild=\"1\"} 0.5\n")
+    merged = merge_metrics([('0', body), ('1', body.replace('3', '4'))]).splitlines()
+    assert merged == [
+        '# HELP plays_total Plays', '# TYPE plays_total counter',
+        'plays_total{worker="0"} 3', 'plays_total{worker="1"} 4',
+        '# HELP lag Lag', '# TYPE lag gauge',
+        'lag{worker="0",guild="1"} 0.5', 'lag{worker="1",guild="1"} 0.5',
+    ]
+
+
+def _free_port_block(count):
+    # A base port with the next `count` ports free too (the workers' ports)
+    while True:
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            base = s.getsockname()[1]
+        try:
+            for port in range(base, base + count + 1):
+                with socket.socket() as s:
+                    s.bind(('127.0.0.1', port))
+            return base
+        except OSError:
+            continue
+
+
+def _first_audio_counts(text):
+    counts = {}
+    for worker, value in re.findall(r'^time_to_first_audio_seconds_count\{worker="(\d+)",[^}]*\} (\S+)$', text, re.M):
+        counts[worker] = counts.get(worker, 0) + int(float(value))
+    return counts
+
+
+# Two workers on the fakes, two shards each: the supervisor's /metrics adds up
+# both, and stopping it makes every worker save its guilds before exiting
+def test_supervisor_merges_metrics_and_workers_checkpoint_on_stop(tmp_path, monkeypatch):
+    shard_count, guilds = 4, 8
+    checkpoint_db = str(tmp_path / 'checkpoints.db')
+    monkeypatch.setenv('CHECKPOINT_DB', checkpoint_db)
+    monkeypatch.setenv('TEST_GUILDS', str(guilds))
+    monkeypatch.setattr(shards, 'IDENTIFY_INTERVAL', 0)
+
+    guild_ids = shard_guild_ids(guilds)
+    expected = {}
+    for index, worker_shards in enumerate(partition(shard_count, 2)):
+        expected[str(index)] = sum(1 for g in guild_ids if shard_for(g, shard_count) in worker_shards)
+
+    port = _free_port_block(2)
+    supervisor = Supervisor(shard_count, 2, port=port, argv=[sys.executable, WORKER])
+
+    async def scenario():
+        running = asyncio.ensure_future(supervisor.run())
+        counts, text = {}, ''
+        try:
+            async with aiohttp.ClientSession() as session:
+                for _ in range(300):
+                    await asyncio.sleep(0.1)
+                    try:
+                        async with session.get(f'http://127.0.0.1:{port}/metrics') as resp:
+                            text = await resp.text()
+                    except aiohttp.ClientError:
+                        continue
+                    counts = _first_audio_counts(text)
+                    if counts == expected:
+                        break
+        finally:
+            supervisor.stop()
+            await asyncio.wait_for(running, 30)
+        return counts, text
+
+    counts, text = asyncio.run(scenario())
+    assert counts == expected
+    # One HELP/TYPE per family, however many workers report it
+    assert text.count('# TYPE time_to_first_audio_seconds histogram') == 1
+    assert all(w.process.returncode == 0 for w in supervisor.workers)
+
+    store = CheckpointStore(SqliteCheckpointBackend(checkpoint_db))
+
+    async def load_all():
+        return [await store.load(g) for g in guild_ids]
+
+    for checkpoint in asyncio.run(load_all()):
+        assert checkpoint is not None
+        assert checkpoint['current']
+        assert len(checkpoint['queue']) == 2
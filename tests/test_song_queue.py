@@ -0,0 +1,39 @@
+from song_queue import SongQueue, Track
+
+
+def test_totals_follow_every_change():
+    queue = SongQueue(['a', Track('b', duration=60), Track('c', duration=30)])
+    assert (len(queue), queue.duration, queue.unknown) == (3, 90, 1)
+    queue.appendleft(Track('d', duration=10))
+    assert queue.popleft().query == 'd'
+    assert queue.remove(1).query == 'b'
+    assert (queue.duration, queue.unknown) == (30, 1)
+    queue.clear()
+    assert (len(queue), queue.duration, queue.unknown) == (0, 0, 0)
+    assert not queue
+
+
+def test_plain_queries_become_tracks():
+    queue = SongQueue()
+    queue.append('https://youtu.be/x')
+    queue.extend([Track('y', title='Y')])
+    assert all(isinstance(track, Track) for track in queue)
+    assert [t.title for t in queue] == [None, 'Y']
+
+
+def test_page_move_and_shuffle():
+    queue = SongQueue(str(i) for i in range(10))
+    assert [t.query for t in queue.page(3, 2)] == ['3', '4']
+    assert [t.query for t in queue.head(2)] == ['0', '1']
+    assert queue.page(9, 5)[0].query == '9'
+    assert queue.move(0, 4).query == '0'
+    assert [t.query for t in queue.head(5)] == ['1', '2', '3', '4', '0']
+    queue.shuffle()
+    assert sorted(t.query for t in queue) == [str(i) for i in range(10)]
+
+
+def test_track_checkpoint_round_trip():
+    track = Track('q', 'Title', 123, 'someone')
+    again = Track.load(track.dump())
+    assert (again.query, again.title, again.duration, again.requester) == ('q', 'Title', 123, 'someone')
+    assert Track.load('old').query == 'old'
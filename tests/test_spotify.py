@@ -0,0 +1,133 @@
+import asyncio
+import os
+
+from aiohttp import web
+
+from spotify import SpotifyResolver
+
+PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'spotify')
+
+ALBUM = 'https://open.spotify.com/album/6i6folBtxKV28WX3msQ4FE'
+PLAYLIST = 'https://open.spotify.com/intl-de/playlist/37i9dQZF1DXcBWIGoYBM5M?si=abc'
+TRACK = 'https://open.spotify.com/track/7tFiyTwD0nx5a1eklYtX2J?si=xyz'
+MISSING = 'https://open.spotify.com/track/5UnavailableTrackId00a'
+
+
+# Serves the recorded pages in fixtures/spotify/<kind>/<id>.html the way
+# open.spotify.com serves the live ones; anything else is a 404
+class FakeSpotify:
+    def __init__(self):
+        self.requests = []
+        self.down = False
+        app = web.Application()
+        app.router.add_get('/{kind}/{spotify_id}', self.page)
+        self.runner = web.AppRunner(app)
+
+    async def page(self, request):
+        kind, spotify_id = request.match_info['kind'], request.match_info['spotify_id']
+        self.requests.append(f'{kind}/{spotify_id}')
+        if self.down:
+            return web.Response(status=503)
+        path = os.path.join(PAGES, kind, f'{spotify_id}.html')
+        if not os.path.exists(path):
+            return web.Response(status=404)
+        with open(path, encoding='utf-8') as f:
+            return web.Response(text=f.read(), content_type='text/html')
+
+    async def __aenter__(self):
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f'http://127.0.0.1:{port}'
+
+    async def __aexit__(self, *exc):
+        await self.runner.cleanup()
+
+
+def _run(scenario, **kwargs):
+    server = FakeSpotify()
+
+    async def main():
+        async with server as origin:
+            resolver = SpotifyResolver(origin=origin, **kwargs)
+            try:
+                return await scenario(resolver, server)
+            finally:
+                await resolver.close()
+
+    return asyncio.run(main()), server
+
+
+def test_resolve_track_turns_a_link_into_a_search():
+    async def scenario(resolver, server):
+        return [await resolver.resolve_track(TRACK),
+                await resolver.resolve_track('https://open.spotify.com/track/6DCZcSspjsKoFjzjrWoCdn'),
+                await resolver.resolve_track('never gonna give you up'),
+                await resolver.resolve_track(ALBUM)]
+
+    results, server = _run(scenario)
+    assert results == ['ytsearch:Bohemian Rhapsody Queen', "ytsearch:God's Plan Drake",
+                       'never gonna give you up', ALBUM]
+    assert server.requests == ['track/7tFiyTwD0nx5a1eklYtX2J', 'track/6DCZcSspjsKoFjzjrWoCdn']
+
+
+def test_resolved_tracks_are_cached():
+    async def scenario(resolver, server):
+        first = await resolver.resolve_track(TRACK)
+        again = await asyncio.gather(*(resolver.resolve_track(TRACK) for _ in range(5)))
+        return [first] + again
+
+    results, server = _run(scenario)
+    assert set(results) == {'ytsearch:Bohemian Rhapsody Queen'}
+    assert server.requests == ['track/7tFiyTwD0nx5a1eklYtX2J']
+
+
+def test_failed_lookups_fall_back_to_the_link_and_are_retried():
+    async def scenario(resolver, server):
+        missing = await resolver.resolve_track(MISSING)
+        server.down = True
+        down = await resolver.resolve_track(TRACK)
+        server.down = False
+        return missing, down, await resolver.resolve_track(TRACK)
+
+    (missing, down, recovered), server = _run(scenario)
+    assert (missing, down) == (MISSING, TRACK)
+    assert recovered == 'ytsearch:Bohemian Rhapsody Queen'
+    assert server.requests.count('track/7tFiyTwD0nx5a1eklYtX2J') == 2
+
+
+def test_album_expands_in_order_skipping_duplicates_and_dead_tracks():
+    async def scenario(resolver, server):
+        return [query async for query in resolver.expand(ALBUM)]
+
+    results, server = _run(scenario)
+    assert results == ['ytsearch:Bohemian Rhapsody - Remastered 2011 Queen', 'ytsearch:Bohemian Rhapsody Queen']
+    assert server.requests.count('album/6i6folBtxKV28WX3msQ4FE') == 1
+    assert server.requests.count('track/4u7EnebtmKWzUH433cf5Qv') == 1
+
+
+def test_playlist_expansion_is_capped_and_its_track_list_cached():
+    async def scenario(resolver, server):
+        first = [query async for query in resolver.expand(PLAYLIST)]
+        second = [query async for query in resolver.expand(PLAYLIST)]
+        return first, second
+
+    (first, second), server = _run(scenario, max_tracks=4)
+    assert first == second == ['ytsearch:Blinding Lights The Weeknd', "ytsearch:God's Plan Drake",
+                               'ytsearch:bad guy Billie Eilish', 'ytsearch:Mr. Brightside The Killers']
+    assert server.requests.count('playlist/37i9dQZF1DXcBWIGoYBM5M') == 1
+    assert len(server.requests) == 5
+
+
+def test_expansion_stops_fetching_when_the_consumer_does():
+    async def scenario(resolver, server):
+        tracks = resolver.expand(PLAYLIST)
+        first = await tracks.__anext__()
+        await tracks.aclose()
+        await asyncio.sleep(0.05)
+        return first
+
+    first, server = _run(scenario, concurrency=1)
+    assert first == 'ytsearch:Blinding Lights The Weeknd'
+    assert len(server.requests) <= 3
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from storage import PlaylistStore, PlaylistsUnavailable, SqlitePlaylistBackend
+
+
+def test_playlists_round_trip_through_sqlite(tmp_path):
+    path = str(tmp_path / 'playlists.db')
+
+    async def scenario():
+        store = PlaylistStore(SqlitePlaylistBackend(path))
+        assert await store.create('1', 'mix')
+        assert not await store.create('1', 'mix')
+        assert await store.add_song('1', 'mix', 'a')
+        assert await store.add_song('1', 'mix', 'b')
+        assert not await store.add_song('1', 'other', 'c')
+        return await PlaylistStore(SqlitePlaylistBackend(path)).get_user('1')
+
+    assert asyncio.run(scenario()) == {'mix': ['a', 'b']}
+
+
+class FlakyBackend:
+    def __init__(self):
+        self.down = False
+        self.saved = {}
+
+    def setup(self):
+        pass
+
+    def load_user(self, user_id):
+        if self.down:
+            raise ConnectionError('down')
+        return {name: list(songs) for name, songs in self.saved.get(user_id, {}).items()}
+
+    def create_playlist(self, user_id, name, playlists):
+        if self.down:
+            raise ConnectionError('down')
+        self.saved[user_id] = playlists
+
+
+def test_backend_errors_become_playlists_unavailable():
+    backend = FlakyBackend()
+
+    async def scenario():
+        store = PlaylistStore(backend)
+        backend.down = True
+        with pytest.raises(PlaylistsUnavailable):
+            await store.get_user('1')
+        backend.down = False
+        await store.get_user('1')
+        backend.down = True
+        with pytest.raises(PlaylistsUnavailable):
+            await store.create('1', 'mix')
+        backend.down = False
+        # The failed write isn't served from the cache
+        return await store.get_user('1')
+
+    assert asyncio.run(scenario()) == {}
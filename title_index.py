@@ -0,0 +1,129 @@
+import collections
+import heapq
+import re
+
+WORD_RE = re.compile(r'\w+')
+
+
+def words(text):
+    return WORD_RE.findall(text.casefold())
+
+
+# Grams for one word: " x" (so single letters can be looked up) and the
+# trigrams of " word", so every gram of a typed prefix is one of these
+def word_grams(word):
+    padded = ' ' + word
+    grams = {padded[:2]}
+    grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+# In-memory index of track titles for /play autocomplete: video_id -> title,
+# with a gram -> video ids map so a lookup only scores titles that contain
+# every typed word as a word prefix. Titles are ranked by how often they were
+# played (or saved). The least recently added titles go past `max_entries`.
+class TitleIndex:
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()  # video_id -> [title, plays, words]
+        self.grams = collections.defaultdict(set)  # gram -> video ids
+        self.dirty = False
+        # Results for the first few typed letters match much of the index, so
+        # they're kept until the index changes
+        self._short = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def title(self, video_id):
+        entry = self.entries.get(video_id)
+        return entry[0] if entry else None
+
+    def _grams(self, title_words):
+        grams = set()
+        for word in title_words:
+            grams.update(word_grams(word))
+        return grams
+
+    def add(self, video_id, title, plays=1):
+        if not video_id or not title:
+            return
+        entry = self.entries.get(video_id)
+        if entry is not None:
+            entry[1] += plays
+            self.entries.move_to_end(video_id)
+            if entry[0] == title:
+                self.dirty = True
+                self._short.clear()
+                return
+            self._unindex(video_id, entry[2])
+            entry[0] = title
+            entry[2] = tuple(words(title))
+        else:
+            entry = self.entries[video_id] = [title, plays, tuple(words(title))]
+        for gram in self._grams(entry[2]):
+            self.grams[gram].add(video_id)
+        self.dirty = True
+        self._short.clear()
+
+        while len(self.entries) > self.max_entries:
+            old_id, (_, _, old_words) = self.entries.popitem(last=False)
+            self._unindex(old_id, old_words)
+
+    def _unindex(self, video_id, title_words):
+        for gram in self._grams(title_words):
+            ids = self.grams.get(gram)
+            if ids is not None:
+                ids.discard(video_id)
+                if not ids:
+                    del self.grams[gram]
+
+    # Up to `limit` (video_id, title) pairs for what's been typed so far
+    def search(self, text, limit=25):
+        typed = words(text)
+        if sum(map(len, typed)) <= 3:
+            key = (tuple(typed), limit)
+            if key not in self._short:
+                self._short[key] = self._search(typed, limit)
+            return self._short[key]
+        return self._search(typed, limit)
+
+    def _search(self, typed, limit):
+        if not typed:
+            # Nothing typed yet: the most played titles
+            best = heapq.nlargest(limit, self.entries.items(), key=lambda item: item[1][1])
+            return [(video_id, entry[0]) for video_id, entry in best]
+
+        # Smallest gram sets first, so the intersection shrinks quickly
+        gram_sets = sorted((self.grams.get(gram, ()) for word in typed for gram in word_grams(word)), key=len)
+        if not gram_sets or not gram_sets[0]:
+            return []
+        candidates = gram_sets[0]
+        for ids in gram_sets[1:]:
+            candidates = candidates & ids
+            if not candidates:
+                return []
+
+        # The grams can come from different words, so check the best ranked
+        # candidates properly, looking further down only if too few pass
+        entries = self.entries
+        plays = lambda video_id: entries[video_id][1]
+        ranked = heapq.nlargest(limit * 4, candidates, key=plays)
+        matches = [video_id for video_id in ranked if self._matches(video_id, typed)]
+        if len(matches) < limit and len(ranked) < len(candidates):
+            ranked = sorted(candidates, key=plays, reverse=True)
+            matches = [video_id for video_id in ranked if self._matches(video_id, typed)]
+        return [(video_id, entries[video_id][0]) for video_id in matches[:limit]]
+
+    def _matches(self, video_id, typed):
+        title_words = self.entries[video_id][2]
+        return all(any(w.startswith(t) for w in title_words) for t in typed)
+
+    # [[video_id, title, plays], ...], least recently added first
+    def dump(self):
+        self.dirty = False
+        return [[video_id, title, plays] for video_id, (title, plays, _) in self.entries.items()]
+
+    def load(self, rows):
+        for video_id, title, plays in rows:
+            self.add(video_id, title, plays)